@@ -26,9 +26,7 @@ import os
 import sys
 import logging
 import traceback
-import json
 import wave
-import struct
 import requests
 
 from time import time
@@ -67,7 +65,11 @@ if len(args) != 1:
 
 wavfn = args[0]
 
-url = 'http://%s:%d/decode' % (options.host, options.port)
+url = 'http://%s:%d/sessions' % (options.host, options.port)
+
+response = requests.post(url)
+assert response.status_code == 201
+session_url = '%s/%s' % (url, response.json()['session'])
 
 #
 # read samples from wave file, hand them over to asr server incrementally to simulate online decoding
@@ -98,14 +100,10 @@ while num_frames < tot_frames:
 
     frames = wavf.readframes(nframes)
     num_frames += nframes
-    samples = struct.unpack_from('<%dh' % nframes, frames)
-
-    data = {'audio'      : samples, 
-            'do_record'  : False, 
-            'do_asr'     : True, 
-            'do_finalize': finalize}
 
-    response = requests.post(url, data=json.dumps(data))
+    response = requests.post('%s/audio' % session_url, data=frames,
+                             params={'finalize': '1' if finalize else '0'},
+                             headers={'Content-Type': 'application/octet-stream'})
 
     logging.info("%6.3fs: %5d frames (%6.3fs) decoded, status=%d." % (time()-time_start, 
                                                                       num_frames, 
@@ -118,12 +116,14 @@ wavf.close()
 
 data = response.json()
 
+requests.delete(session_url)
+
 logging.debug("raw response data: %s" % repr(data))
 
 logging.info ( "*****************************************************************")
 logging.info ( "** wavfn         : %s" % wavfn)
 logging.info ( "** hstr          : %s" % data['hstr'])
-logging.info ( "** confidence    : %f" % data['confidence'])
+logging.info ( "** likelihood    : %f" % data['likelihood'])
 logging.info ( "** decoding time : %8.2fs" % ( time() - time_start ))
 logging.info ( "*****************************************************************")
 
@@ -0,0 +1,265 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+# Copyright 2016, 2017, 2018 Guenter Bartsch
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# THIS CODE IS PROVIDED *AS IS* BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, EITHER EXPRESS OR IMPLIED, INCLUDING WITHOUT LIMITATION ANY IMPLIED
+# WARRANTIES OR CONDITIONS OF TITLE, FITNESS FOR A PARTICULAR PURPOSE,
+# MERCHANTABLITY OR NON-INFRINGEMENT.
+# See the Apache 2 License for the specific language governing permissions and
+# limitations under the License.
+#
+#
+# load generator for kaldiasr.server: runs a number of concurrent client
+# streams, each replaying the WAV files in data/*.wav (in a loop, for the
+# given duration) in 250ms chunks at real-time speed, and reports sessions
+# refused by backpressure plus chunk and final result latencies. With
+# --stream the binary streaming protocol (kaldiasr.protocol) is used
+# instead of HTTP requests, the final latency is then the time from the
+# end of the audio to the final result.
+#
+# start the server first, e.g.
+#
+#     python -m kaldiasr.server -n 200
+#     python examples/asr_loadgen.py -c 200 -d 60
+#     python examples/asr_loadgen.py -c 200 -d 60 --stream
+#
+
+from __future__ import print_function
+
+import sys
+import json
+import glob
+import wave
+import socket
+import logging
+import threading
+
+from time import time, sleep
+from optparse import OptionParser
+
+try:
+    from http.client import HTTPConnection
+except ImportError:
+    from httplib import HTTPConnection
+
+from kaldiasr.protocol import read_message, write_message, DEFAULT_STREAM_PORT, \
+                              MSG_AUDIO, MSG_END, MSG_OPEN, MSG_RESULT
+
+DEFAULT_HOST  = 'localhost'
+DEFAULT_PORT  = 8301
+WAVFILES      = 'data/*.wav'
+CHUNK_MS      = 250
+
+parser = OptionParser("usage: %prog [options] [wavfile ...]")
+
+parser.add_option ("-H", "--host", dest="host", type = "string", default=DEFAULT_HOST,
+                   help="host, default: %s" % DEFAULT_HOST)
+
+parser.add_option ("-p", "--port", dest="port", type = "int", default=DEFAULT_PORT,
+                   help="port, default: %d" % DEFAULT_PORT)
+
+parser.add_option ("-s", "--stream", action="store_true", dest="stream",
+                   help="use the binary streaming protocol")
+
+parser.add_option ("-S", "--stream-port", dest="stream_port", type = "int", default=DEFAULT_STREAM_PORT,
+                   help="streaming port, default: %d" % DEFAULT_STREAM_PORT)
+
+parser.add_option ("-c", "--clients", dest="num_clients", type = "int", default=10,
+                   help="number of concurrent client streams, default: 10")
+
+parser.add_option ("-d", "--duration", dest="duration", type = "float", default=30.0,
+                   help="run for this many seconds, default: 30")
+
+parser.add_option ("-f", "--fast", action="store_true", dest="fast",
+                   help="send chunks as fast as possible instead of in real time")
+
+(options, args) = parser.parse_args()
+
+logging.basicConfig(level=logging.INFO)
+
+#
+# load audio once, every client replays the same chunks
+#
+
+wavfns = args if args else sorted(glob.glob(WAVFILES))
+if not wavfns:
+    logging.error('no wav files found.')
+    sys.exit(1)
+
+utts = []
+for wavfn in wavfns:
+    wavf = wave.open(wavfn, 'rb')
+    assert wavf.getnchannels()==1
+    assert wavf.getsampwidth()==2
+    chunk_frames = CHUNK_MS * wavf.getframerate() // 1000
+    chunks = list(iter(lambda: wavf.readframes(chunk_frames), b''))
+    wavf.close()
+    if chunks:
+        utts.append(chunks)
+
+#
+# clients
+#
+
+lock  = threading.Lock()
+stats = {'sessions': 0, 'refused': 0, 'errors': 0, 'utts': 0, 'chunk_latencies': [], 'final_latencies': []}
+
+def request(conn, method, path, body=None, headers={}):
+    conn.request(method, path, body, headers)
+    response = conn.getresponse()
+    return response.status, json.loads(response.read().decode('utf8'))
+
+def client(idx, time_end):
+
+    conn = HTTPConnection(options.host, options.port)
+    utt  = idx % len(utts)
+
+    while time() < time_end:
+
+        status, data = request(conn, 'POST', '/sessions')
+        if status == 503:
+            with lock:
+                stats['refused'] += 1
+            sleep(1.0)
+            continue
+        if status != 201:
+            with lock:
+                stats['errors'] += 1
+            return
+
+        session_path = '/sessions/%s' % data['session']
+
+        with lock:
+            stats['sessions'] += 1
+
+        chunks = utts[utt]
+        utt    = (utt + 1) % len(utts)
+
+        time_start = time()
+        for i, chunk in enumerate(chunks):
+
+            finalize = i == len(chunks) - 1
+
+            # real time: do not send audio before it would have been spoken
+            if not options.fast:
+                delay = time_start + i * CHUNK_MS / 1000.0 - time()
+                if delay > 0:
+                    sleep(delay)
+
+            time_chunk = time()
+            status, data = request(conn, 'POST', '%s/audio?finalize=%d' % (session_path, finalize), chunk,
+                                   {'Content-Type': 'application/octet-stream'})
+            latency = time() - time_chunk
+
+            if status != 200:
+                with lock:
+                    stats['errors'] += 1
+                break
+
+            with lock:
+                stats['final_latencies' if finalize else 'chunk_latencies'].append(latency)
+
+        with lock:
+            stats['utts'] += 1
+
+        request(conn, 'DELETE', session_path)
+
+    conn.close()
+
+def stream_client(idx, time_end):
+
+    utt = idx % len(utts)
+
+    while time() < time_end:
+
+        sock  = socket.create_connection((options.host, options.stream_port))
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        rfile = sock.makefile('rb')
+        wfile = sock.makefile('wb')
+
+        try:
+            msg_type, payload = read_message(rfile)
+            if msg_type != MSG_OPEN:
+                with lock:
+                    stats['refused'] += 1
+                sleep(1.0)
+                continue
+
+            with lock:
+                stats['sessions'] += 1
+
+            chunks = utts[utt]
+            utt    = (utt + 1) % len(utts)
+
+            # results are pushed asynchronously and read after the last
+            # chunk, partial ones just queue up in the socket buffer
+
+            time_start = time()
+            for i, chunk in enumerate(chunks):
+                if not options.fast:
+                    delay = time_start + i * CHUNK_MS / 1000.0 - time()
+                    if delay > 0:
+                        sleep(delay)
+                write_message(wfile, MSG_AUDIO, chunk)
+
+            time_end_audio = time()
+            write_message(wfile, MSG_END)
+
+            while True:
+                msg_type, payload = read_message(rfile)
+                if msg_type is None:
+                    with lock:
+                        stats['errors'] += 1
+                    break
+                if msg_type == MSG_RESULT:
+                    with lock:
+                        stats['final_latencies'].append(time() - time_end_audio)
+                        stats['utts'] += 1
+                    break
+
+        finally:
+            sock.close()
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p * len(values)))]
+
+time_end = time() + options.duration
+
+threads = []
+for idx in range(options.num_clients):
+    thread = threading.Thread(target=stream_client if options.stream else client, args=(idx, time_end))
+    thread.daemon = True
+    thread.start()
+    threads.append(thread)
+
+for thread in threads:
+    thread.join()
+
+print('%d clients, %.0fs: %d sessions, %d utterances, %d refused (503), %d errors' % (options.num_clients,
+                                                                                      options.duration,
+                                                                                      stats['sessions'],
+                                                                                      stats['utts'],
+                                                                                      stats['refused'],
+                                                                                      stats['errors']))
+
+for name in ['chunk_latencies', 'final_latencies']:
+    latencies = stats[name]
+    print('%-16s n=%6d  p50 %7.1fms  p90 %7.1fms  p99 %7.1fms' % (name, len(latencies),
+                                                                  1000.0 * percentile(latencies, 0.5),
+                                                                  1000.0 * percentile(latencies, 0.9),
+                                                                  1000.0 * percentile(latencies, 0.99)))
+
+_, data = request(HTTPConnection(options.host, options.port), 'GET', '/status')
+print('server: %s' % json.dumps(data))
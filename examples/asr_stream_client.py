@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+# Copyright 2016, 2017, 2018 Guenter Bartsch
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# THIS CODE IS PROVIDED *AS IS* BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, EITHER EXPRESS OR IMPLIED, INCLUDING WITHOUT LIMITATION ANY IMPLIED
+# WARRANTIES OR CONDITIONS OF TITLE, FITNESS FOR A PARTICULAR PURPOSE,
+# MERCHANTABLITY OR NON-INFRINGEMENT.
+# See the Apache 2 License for the specific language governing permissions and
+# limitations under the License.
+#
+#
+# streaming client for the ASR server's binary protocol (kaldiasr.protocol):
+# sends a WAV file in 250ms chunks of raw PCM over one connection, at real
+# time speed unless --fast is given, while a second thread prints partial
+# and final results as the server pushes them
+#
+
+from __future__ import print_function
+
+import sys
+import json
+import wave
+import socket
+import threading
+
+from time import time, sleep
+from optparse import OptionParser
+
+from kaldiasr.protocol import read_message, write_message, DEFAULT_STREAM_PORT, \
+                              MSG_AUDIO, MSG_END, MSG_OPEN, MSG_PARTIAL, MSG_RESULT, MSG_ERROR
+
+DEFAULT_HOST = 'localhost'
+WAVFILE      = 'data/dw961.wav'
+CHUNK_MS     = 250
+
+parser = OptionParser("usage: %prog [options] [wavfile]")
+
+parser.add_option ("-H", "--host", dest="host", type = "string", default=DEFAULT_HOST,
+                   help="host, default: %s" % DEFAULT_HOST)
+
+parser.add_option ("-p", "--port", dest="port", type = "int", default=DEFAULT_STREAM_PORT,
+                   help="streaming port, default: %d" % DEFAULT_STREAM_PORT)
+
+parser.add_option ("-f", "--fast", action="store_true", dest="fast",
+                   help="send chunks as fast as possible instead of in real time")
+
+(options, args) = parser.parse_args()
+
+wavfn = args[0] if args else WAVFILE
+
+sock = socket.create_connection((options.host, options.port))
+sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+rfile = sock.makefile('rb')
+wfile = sock.makefile('wb')
+
+msg_type, payload = read_message(rfile)
+if msg_type != MSG_OPEN:
+    print('server refused the session: %s' % (payload.decode('utf8') if payload else 'connection closed'))
+    sys.exit(1)
+
+print('session %s' % json.loads(payload.decode('utf8'))['session'])
+
+time_start = time()
+time_sent  = [time_start]
+
+def receive():
+
+    while True:
+
+        msg_type, payload = read_message(rfile)
+        if msg_type is None:
+            break
+
+        data = json.loads(payload.decode('utf8'))
+
+        if msg_type == MSG_PARTIAL:
+            sys.stdout.write('\r%s' % data['hstr'])
+            sys.stdout.flush()
+        elif msg_type == MSG_RESULT:
+            print('\r%s (%.3f, %.1fms after the last chunk)' % (data['hstr'], data['likelihood'],
+                                                                1000.0 * (time() - time_sent[0])))
+        elif msg_type == MSG_ERROR:
+            print('\nerror: %s' % data['error'])
+
+receiver = threading.Thread(target=receive)
+receiver.start()
+
+wavf = wave.open(wavfn, 'rb')
+assert wavf.getnchannels()==1
+assert wavf.getsampwidth()==2
+
+chunk_frames = CHUNK_MS * wavf.getframerate() // 1000
+
+for i, chunk in enumerate(iter(lambda: wavf.readframes(chunk_frames), b'')):
+
+    if not options.fast:
+        delay = time_start + i * CHUNK_MS / 1000.0 - time()
+        if delay > 0:
+            sleep(delay)
+
+    write_message(wfile, MSG_AUDIO, chunk)
+    time_sent[0] = time()
+
+wavf.close()
+
+# finalizes the utterance, the server closes the connection after the result
+write_message(wfile, MSG_END)
+
+receiver.join()
+sock.close()
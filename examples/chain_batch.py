@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+# Copyright 2016, 2017, 2018 Guenter Bartsch
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# THIS CODE IS PROVIDED *AS IS* BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, EITHER EXPRESS OR IMPLIED, INCLUDING WITHOUT LIMITATION ANY IMPLIED
+# WARRANTIES OR CONDITIONS OF TITLE, FITNESS FOR A PARTICULAR PURPOSE,
+# MERCHANTABLITY OR NON-INFRINGEMENT.
+# See the Apache 2 License for the specific language governing permissions and
+# limitations under the License.
+#
+#
+# batch decoding demo and benchmark: decodes data/*.wav once in a
+# sequential loop using KaldiNNet3OnlineDecoder and once using
+# KaldiNNet3BatchDecoder, then reports the real time factor of both
+#
+
+from __future__ import print_function
+
+import glob
+import wave
+import struct
+import numpy as np
+
+from time import time
+from optparse import OptionParser
+
+from kaldiasr.nnet3 import KaldiNNet3OnlineModel, KaldiNNet3OnlineDecoder, KaldiNNet3BatchDecoder
+
+MODELDIR        = 'data/models/kaldi-generic-en-tdnn_sp-latest'
+WAVFILES        = 'data/*.wav'
+DEFAULT_THREADS = 2
+DEFAULT_REPEAT  = 4
+
+parser = OptionParser("usage: %prog [options]")
+
+parser.add_option ("-t", "--threads", dest="threads", type = "int", default=DEFAULT_THREADS,
+                   help="number of beam search threads of the batch decoder, default: %d" % DEFAULT_THREADS)
+
+parser.add_option ("-r", "--repeat", dest="repeat", type = "int", default=DEFAULT_REPEAT,
+                   help="repeat the test files this many times to get a larger batch, default: %d" % DEFAULT_REPEAT)
+
+parser.add_option ("-m", "--model-dir", dest="model_dir", type = "string", default=MODELDIR,
+                   help="kaldi model directory, default: %s" % MODELDIR)
+
+(options, args) = parser.parse_args()
+
+#
+# load test audio
+#
+
+wavfns     = sorted(glob.glob(WAVFILES))
+utts       = []
+samp_freq  = None
+
+for wavfn in wavfns:
+    wavf = wave.open(wavfn, 'rb')
+    assert wavf.getnchannels()==1
+    assert wavf.getsampwidth()==2
+    if samp_freq is None:
+        samp_freq = wavf.getframerate()
+    assert wavf.getframerate() == samp_freq
+    num_frames = wavf.getnframes()
+    samples    = struct.unpack_from('<%dh' % num_frames, wavf.readframes(num_frames))
+    utts.append(np.array(samples, dtype=np.float32))
+    wavf.close()
+
+utts       = utts * options.repeat
+audio_secs = sum([float(len(samples)) / float(samp_freq) for samples in utts])
+
+print('%d utterances, %.1fs of audio' % (len(utts), audio_secs))
+
+print('%s loading model...' % options.model_dir)
+time_start = time()
+kaldi_model = KaldiNNet3OnlineModel (options.model_dir)
+print('%s loading model... done, took %fs.' % (options.model_dir, time()-time_start))
+
+#
+# sequential loop
+#
+
+decoder = KaldiNNet3OnlineDecoder (kaldi_model)
+
+time_start = time()
+seq_results = []
+for samples in utts:
+    if decoder.decode(samp_freq, samples, True):
+        seq_results.append(decoder.get_decoded_string()[0])
+    else:
+        seq_results.append(None)
+seq_time = time() - time_start
+
+#
+# batch
+#
+
+batch_decoder = KaldiNNet3BatchDecoder (kaldi_model, num_threads=options.threads)
+
+time_start = time()
+batch_results = batch_decoder.decode_batch(samp_freq, utts, word_alignment=False)
+batch_time = time() - time_start
+
+for i, wavfn in enumerate(wavfns):
+    print('%-20s sequential: %s' % (wavfn, seq_results[i]))
+    print('%-20s batch     : %s' % ('', batch_results[i][0] if batch_results[i] else None))
+
+print()
+print('sequential: %8.2fs, RTF %.3f' % (seq_time, seq_time / audio_secs))
+print('batch     : %8.2fs, RTF %.3f (%d threads)' % (batch_time, batch_time / audio_secs, options.threads))
+print('speedup   : %8.2fx' % (seq_time / batch_time))
+
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+# Copyright 2016, 2017, 2018 Guenter Bartsch
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# THIS CODE IS PROVIDED *AS IS* BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, EITHER EXPRESS OR IMPLIED, INCLUDING WITHOUT LIMITATION ANY IMPLIED
+# WARRANTIES OR CONDITIONS OF TITLE, FITNESS FOR A PARTICULAR PURPOSE,
+# MERCHANTABLITY OR NON-INFRINGEMENT.
+# See the Apache 2 License for the specific language governing permissions and
+# limitations under the License.
+#
+#
+# streaming demo: feeds a (possibly very long) WAV file to the decoder in
+# 250ms chunks using KaldiNNet3OnlineDecoder.stream(), printing partial
+# results as they evolve and one line per utterance found by endpointing
+#
+
+from __future__ import print_function
+
+import sys
+import wave
+
+from optparse import OptionParser
+
+from kaldiasr.nnet3 import KaldiNNet3OnlineModel, KaldiNNet3OnlineDecoder
+
+MODELDIR  = 'data/models/kaldi-generic-en-tdnn_sp-latest'
+WAVFILE   = 'data/dw961.wav'
+CHUNK_MS  = 250
+
+parser = OptionParser("usage: %prog [options] [wavfile]")
+
+parser.add_option ("-m", "--model-dir", dest="model_dir", type = "string", default=MODELDIR,
+                   help="kaldi model directory, default: %s" % MODELDIR)
+
+(options, args) = parser.parse_args()
+
+wavfn = args[0] if args else WAVFILE
+
+kaldi_model = KaldiNNet3OnlineModel (options.model_dir)
+decoder     = KaldiNNet3OnlineDecoder (kaldi_model)
+
+wavf = wave.open(wavfn, 'rb')
+assert wavf.getnchannels()==1
+assert wavf.getsampwidth()==2
+
+chunk_frames = CHUNK_MS * wavf.getframerate() // 1000
+chunks       = iter(lambda: wavf.readframes(chunk_frames), b'')
+
+for hstr, likelihood, final in decoder.stream(chunks, wavf.getframerate()):
+    if final:
+        print('\r%s' % hstr)
+    else:
+        sys.stdout.write('\r%s' % hstr)
+        sys.stdout.flush()
+
+wavf.close()
+
@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+# Copyright 2016, 2017, 2018 Guenter Bartsch
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# THIS CODE IS PROVIDED *AS IS* BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, EITHER EXPRESS OR IMPLIED, INCLUDING WITHOUT LIMITATION ANY IMPLIED
+# WARRANTIES OR CONDITIONS OF TITLE, FITNESS FOR A PARTICULAR PURPOSE,
+# MERCHANTABLITY OR NON-INFRINGEMENT.
+# See the Apache 2 License for the specific language governing permissions and
+# limitations under the License.
+#
+#
+# multithreaded throughput test: one shared model, one decoder per thread.
+#
+# decoding runs without holding the GIL, so throughput (seconds of audio
+# decoded per second of wall clock time) should scale linearly with the
+# number of threads up to the number of physical cores available.
+#
+
+from __future__ import print_function
+
+import sys
+import wave
+import struct
+import threading
+import numpy as np
+
+from time import time
+from optparse import OptionParser
+
+from kaldiasr.nnet3 import KaldiNNet3OnlineModel, KaldiNNet3OnlineDecoder
+
+MODELDIR        = 'data/models/kaldi-generic-en-tdnn_sp-latest'
+WAVFILES        = ['data/dw961.wav', 'data/gsp1.wav', 'data/lsen1.wav']
+DEFAULT_THREADS = 8
+DEFAULT_RUNS    = 4
+
+parser = OptionParser("usage: %prog [options]")
+
+parser.add_option ("-t", "--threads", dest="threads", type = "int", default=DEFAULT_THREADS,
+                   help="max number of decoder threads, default: %d" % DEFAULT_THREADS)
+
+parser.add_option ("-r", "--runs", dest="runs", type = "int", default=DEFAULT_RUNS,
+                   help="number of times each thread decodes the test files, default: %d" % DEFAULT_RUNS)
+
+parser.add_option ("-m", "--model-dir", dest="model_dir", type = "string", default=MODELDIR,
+                   help="kaldi model directory, default: %s" % MODELDIR)
+
+(options, args) = parser.parse_args()
+
+#
+# load test audio once, outside of the timed section
+#
+
+utts = []
+for wavfn in WAVFILES:
+    wavf = wave.open(wavfn, 'rb')
+    assert wavf.getnchannels()==1
+    assert wavf.getsampwidth()==2
+    num_frames = wavf.getnframes()
+    samples    = struct.unpack_from('<%dh' % num_frames, wavf.readframes(num_frames))
+    utts.append((wavf.getframerate(), np.array(samples, dtype=np.float32)))
+    wavf.close()
+
+audio_secs = sum([float(len(samples)) / float(samp_freq) for samp_freq, samples in utts])
+
+print('%s loading model...' % options.model_dir)
+time_start = time()
+kaldi_model = KaldiNNet3OnlineModel (options.model_dir)
+print('%s loading model... done, took %fs.' % (options.model_dir, time()-time_start))
+
+def decode_worker(decoder):
+    for i in range(options.runs):
+        for samp_freq, samples in utts:
+            decoder.decode(samp_freq, samples, True)
+            decoder.get_decoded_string()
+
+num_threads = 1
+base_throughput = None
+
+print()
+print('threads    audio[s]     wall[s]  throughput  speedup  efficiency')
+
+while num_threads <= options.threads:
+
+    decoders = [KaldiNNet3OnlineDecoder(kaldi_model) for i in range(num_threads)]
+    threads  = [threading.Thread(target=decode_worker, args=(decoder,)) for decoder in decoders]
+
+    time_start = time()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time() - time_start
+
+    total_audio = audio_secs * options.runs * num_threads
+    throughput  = total_audio / wall
+    if base_throughput is None:
+        base_throughput = throughput
+    speedup = throughput / base_throughput
+
+    print('%7d %11.2f %11.2f %10.2fx %8.2f %10.0f%%' % (num_threads, total_audio, wall, throughput,
+                                                       speedup, 100.0 * speedup / num_threads))
+
+    num_threads *= 2
+
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+# Copyright 2016, 2017, 2018 Guenter Bartsch
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# THIS CODE IS PROVIDED *AS IS* BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, EITHER EXPRESS OR IMPLIED, INCLUDING WITHOUT LIMITATION ANY IMPLIED
+# WARRANTIES OR CONDITIONS OF TITLE, FITNESS FOR A PARTICULAR PURPOSE,
+# MERCHANTABLITY OR NON-INFRINGEMENT.
+# See the Apache 2 License for the specific language governing permissions and
+# limitations under the License.
+#
+#
+# chunk size microbenchmark: streams a WAV file into the decoder in chunks
+# of 10ms up to 1s, passing samples as int16 numpy arrays, raw PCM bytes and
+# float32 numpy arrays, and reports the mean time per decode() call as well
+# as the real time factor for each combination.
+#
+
+from __future__ import print_function
+
+import wave
+import numpy as np
+
+from time import time
+from optparse import OptionParser
+
+from kaldiasr.nnet3 import KaldiNNet3OnlineModel, KaldiNNet3OnlineDecoder
+
+MODELDIR    = 'data/models/kaldi-generic-en-tdnn_sp-latest'
+WAVFILE     = 'data/dw961.wav'
+CHUNK_SIZES = [0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0]
+
+parser = OptionParser("usage: %prog [options]")
+
+parser.add_option ("-m", "--model-dir", dest="model_dir", type = "string", default=MODELDIR,
+                   help="kaldi model directory, default: %s" % MODELDIR)
+
+parser.add_option ("-w", "--wav", dest="wavfn", type = "string", default=WAVFILE,
+                   help="wav file to stream, default: %s" % WAVFILE)
+
+(options, args) = parser.parse_args()
+
+wavf = wave.open(options.wavfn, 'rb')
+assert wavf.getnchannels()==1
+assert wavf.getsampwidth()==2
+samp_freq  = wavf.getframerate()
+pcm        = wavf.readframes(wavf.getnframes())
+wavf.close()
+
+samples_int16   = np.frombuffer(pcm, dtype='<i2')
+samples_float32 = samples_int16.astype(np.float32)
+audio_secs      = float(len(samples_int16)) / float(samp_freq)
+
+kaldi_model = KaldiNNet3OnlineModel (options.model_dir)
+decoder     = KaldiNNet3OnlineDecoder (kaldi_model)
+
+def run(chunks):
+    decoder.reset()
+    time_start = time()
+    for i, chunk in enumerate(chunks):
+        decoder.decode(samp_freq, chunk, i == len(chunks)-1)
+    return time() - time_start
+
+print('chunk[ms]  input     calls  per call[ms]    RTF')
+
+for chunk_size in CHUNK_SIZES:
+
+    chunk_len = int(chunk_size * samp_freq)
+    offsets   = range(0, len(samples_int16), chunk_len)
+
+    inputs = [ ('int16',   [samples_int16[o:o+chunk_len]   for o in offsets]),
+               ('bytes',   [pcm[2*o:2*(o+chunk_len)]       for o in offsets]),
+               ('float32', [samples_float32[o:o+chunk_len] for o in offsets]) ]
+
+    for name, chunks in inputs:
+        t = run(chunks)
+        print('%9d  %-8s %6d %13.3f %6.3f' % (chunk_size * 1000, name, len(chunks),
+                                              1000.0 * t / len(chunks), t / audio_secs))
+
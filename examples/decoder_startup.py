@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+# Copyright 2016, 2017, 2018 Guenter Bartsch
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# THIS CODE IS PROVIDED *AS IS* BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, EITHER EXPRESS OR IMPLIED, INCLUDING WITHOUT LIMITATION ANY IMPLIED
+# WARRANTIES OR CONDITIONS OF TITLE, FITNESS FOR A PARTICULAR PURPOSE,
+# MERCHANTABLITY OR NON-INFRINGEMENT.
+# See the Apache 2 License for the specific language governing permissions and
+# limitations under the License.
+#
+#
+# decoder construction benchmark: measures how long it takes to create a
+# KaldiNNet3OnlineDecoder on an already loaded model and how much resident
+# memory each live decoder adds. Run it on two revisions to compare them.
+#
+
+from __future__ import print_function
+
+import os
+import resource
+
+from time import time
+from optparse import OptionParser
+
+from kaldiasr.nnet3 import KaldiNNet3OnlineModel, KaldiNNet3OnlineDecoder
+
+MODELDIR         = 'data/models/kaldi-generic-en-tdnn_sp-latest'
+DEFAULT_DECODERS = 32
+
+def rss_bytes():
+    # current (not peak) resident set size, linux only
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * resource.getpagesize()
+
+parser = OptionParser("usage: %prog [options]")
+
+parser.add_option ("-n", "--num-decoders", dest="num_decoders", type = "int", default=DEFAULT_DECODERS,
+                   help="number of decoders to create, default: %d" % DEFAULT_DECODERS)
+
+parser.add_option ("-m", "--model-dir", dest="model_dir", type = "string", default=MODELDIR,
+                   help="kaldi model directory, default: %s" % MODELDIR)
+
+(options, args) = parser.parse_args()
+
+rss_start = rss_bytes()
+time_start = time()
+kaldi_model = KaldiNNet3OnlineModel (options.model_dir)
+print('%s loading model... done, took %fs, rss +%.1f MB.' % (options.model_dir, time()-time_start,
+                                                            float(rss_bytes() - rss_start) / 1e6))
+
+decoders  = []
+latencies = []
+rss_start = rss_bytes()
+
+for i in range(options.num_decoders):
+    time_start = time()
+    decoders.append(KaldiNNet3OnlineDecoder (kaldi_model))
+    latencies.append(time() - time_start)
+
+rss_delta = rss_bytes() - rss_start
+latencies.sort()
+
+print('decoders created       : %d' % options.num_decoders)
+print('construction latency   : mean %.3fms, median %.3fms, max %.3fms' % (1000.0 * sum(latencies) / len(latencies),
+                                                                          1000.0 * latencies[len(latencies) // 2],
+                                                                          1000.0 * latencies[-1]))
+print('resident memory        : +%.1f MB total, +%.1f kB per decoder' % (float(rss_delta) / 1e6,
+                                                                        float(rss_delta) / 1e3 / options.num_decoders))
+
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+# Copyright 2016, 2017, 2018 Guenter Bartsch
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# THIS CODE IS PROVIDED *AS IS* BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, EITHER EXPRESS OR IMPLIED, INCLUDING WITHOUT LIMITATION ANY IMPLIED
+# WARRANTIES OR CONDITIONS OF TITLE, FITNESS FOR A PARTICULAR PURPOSE,
+# MERCHANTABLITY OR NON-INFRINGEMENT.
+# See the Apache 2 License for the specific language governing permissions and
+# limitations under the License.
+#
+#
+# model startup benchmark: loads the model in a fresh process for each
+# configuration and reports load time and resident memory, split into
+# anonymous (private heap) and file backed (shareable page cache) pages.
+# The bundle configurations load a model bundle (save_bundle()) written
+# once before the runs.
+#
+
+from __future__ import print_function
+
+import os
+import sys
+import json
+import tempfile
+import subprocess
+
+from time import time
+from optparse import OptionParser, SUPPRESS_HELP
+
+MODELDIR = 'data/models/kaldi-generic-en-tdnn_sp-latest'
+
+CONFIGS  = [ ('default',     {}),
+             ('mmap_fst',    {'mmap_fst': True}),
+             ('lazy_load',   {'lazy_load': True}),
+             ('ids_only',    {'word_symbols': False, 'word_alignment': False}),
+             ('bundle',      {'bundle': True}),
+             ('bundle_mmap', {'bundle': True, 'mmap_fst': True}) ]
+
+def rss():
+    res = {}
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('RssAnon:') or line.startswith('RssFile:'):
+                key, value, unit = line.split()
+                res[key[:-1]] = int(value) * 1024
+    return res
+
+def load(model_dir, kwargs):
+
+    from kaldiasr.nnet3 import KaldiNNet3OnlineModel, KaldiNNet3OnlineDecoder
+
+    bundle     = kwargs.pop('bundle', None)
+
+    rss_start  = rss()
+    time_start = time()
+    if bundle:
+        kaldi_model = KaldiNNet3OnlineModel.load_bundle (bundle, **kwargs)
+    else:
+        kaldi_model = KaldiNNet3OnlineModel (model_dir, **kwargs)
+    load_time  = time() - time_start
+    rss_end    = rss()
+
+    print(json.dumps({'load_time': load_time,
+                      'rss_anon' : rss_end['RssAnon'] - rss_start['RssAnon'],
+                      'rss_file' : rss_end['RssFile'] - rss_start['RssFile']}))
+
+parser = OptionParser("usage: %prog [options]")
+
+parser.add_option ("-m", "--model-dir", dest="model_dir", type = "string", default=MODELDIR,
+                   help="kaldi model directory, default: %s" % MODELDIR)
+
+parser.add_option ("-r", "--runs", dest="runs", type = "int", default=3,
+                   help="number of runs per configuration, default: 3")
+
+parser.add_option ("--child", dest="child", type = "string", default=None,
+                   help=SUPPRESS_HELP) # internal: load model with these JSON encoded kwargs
+
+(options, args) = parser.parse_args()
+
+if options.child is not None:
+    load(options.model_dir, json.loads(options.child))
+    sys.exit(0)
+
+from kaldiasr.nnet3 import KaldiNNet3OnlineModel
+
+bundle_fd, bundle = tempfile.mkstemp(suffix='.bundle')
+os.close(bundle_fd)
+
+time_start = time()
+KaldiNNet3OnlineModel (options.model_dir).save_bundle(bundle)
+print('bundle written in %.2fs, %.1fMB' % (time() - time_start, float(os.path.getsize(bundle)) / 1e6))
+
+print('configuration  run   load[s]  rss anon[MB]  rss file[MB]')
+
+try:
+    for name, kwargs in CONFIGS:
+        if kwargs.get('bundle'):
+            kwargs = dict(kwargs, bundle=bundle)
+        for run in range(options.runs):
+            out = subprocess.check_output([sys.executable, sys.argv[0], '-m', options.model_dir,
+                                           '--child', json.dumps(kwargs)])
+            res = json.loads(out.decode('utf8').strip().splitlines()[-1])
+            print('%-13s %4d %9.2f %13.1f %13.1f' % (name, run, res['load_time'],
+                                                     float(res['rss_anon']) / 1e6, float(res['rss_file']) / 1e6))
+finally:
+    os.remove(bundle)
+
@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+# Copyright 2016, 2017, 2018 Guenter Bartsch
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# THIS CODE IS PROVIDED *AS IS* BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, EITHER EXPRESS OR IMPLIED, INCLUDING WITHOUT LIMITATION ANY IMPLIED
+# WARRANTIES OR CONDITIONS OF TITLE, FITNESS FOR A PARTICULAR PURPOSE,
+# MERCHANTABLITY OR NON-INFRINGEMENT.
+# See the Apache 2 License for the specific language governing permissions and
+# limitations under the License.
+#
+#
+# partial result benchmark: streams one long utterance (data/dw961.wav
+# repeated) in 100ms chunks and after each chunk measures how long
+# get_decoded_string(), get_partial_hypothesis() and
+# get_partial_word_alignment() take (on separate decoders, they share the
+# traceback cache). Latencies are reported per 5s of utterance length, they
+# should stay flat as the utterance grows.
+#
+
+from __future__ import print_function
+
+import wave
+import numpy as np
+
+from time import time
+from optparse import OptionParser
+
+from kaldiasr.nnet3 import KaldiNNet3OnlineModel, KaldiNNet3OnlineDecoder
+
+MODELDIR  = 'data/models/kaldi-generic-en-tdnn_sp-latest'
+WAVFILE   = 'data/dw961.wav'
+CHUNK_MS  = 100
+BUCKET_S  = 5.0
+
+parser = OptionParser("usage: %prog [options]")
+
+parser.add_option ("-m", "--model-dir", dest="model_dir", type = "string", default=MODELDIR,
+                   help="kaldi model directory, default: %s" % MODELDIR)
+
+parser.add_option ("-s", "--seconds", dest="seconds", type = "float", default=60.0,
+                   help="utterance length in seconds, default: 60")
+
+(options, args) = parser.parse_args()
+
+wavf = wave.open(WAVFILE, 'rb')
+samp_freq = wavf.getframerate()
+samples = np.frombuffer(wavf.readframes(wavf.getnframes()), dtype='<i2')
+wavf.close()
+
+samples = np.tile(samples, int(options.seconds * samp_freq / len(samples)) + 1)[:int(options.seconds * samp_freq)]
+
+kaldi_model     = KaldiNNet3OnlineModel (options.model_dir)
+string_decoder  = KaldiNNet3OnlineDecoder (kaldi_model)
+partial_decoder = KaldiNNet3OnlineDecoder (kaldi_model)
+align_decoder   = KaldiNNet3OnlineDecoder (kaldi_model)
+
+chunk_len = CHUNK_MS * samp_freq // 1000
+buckets   = {}
+
+for offset in range(0, len(samples), chunk_len):
+
+    string_decoder.decode(samp_freq, samples[offset:offset+chunk_len], False)
+    partial_decoder.decode(samp_freq, samples[offset:offset+chunk_len], False)
+    align_decoder.decode(samp_freq, samples[offset:offset+chunk_len], False)
+
+    time_start = time()
+    string_decoder.get_decoded_string()
+    t_string = time() - time_start
+
+    time_start = time()
+    partial_decoder.get_partial_hypothesis()
+    t_partial = time() - time_start
+
+    time_start = time()
+    align_decoder.get_partial_word_alignment(as_ids=True)
+    t_align = time() - time_start
+
+    bucket = int(float(offset) / samp_freq / BUCKET_S)
+    buckets.setdefault(bucket, []).append((t_string, t_partial, t_align))
+
+string_decoder.finalize_decoding()
+partial_decoder.finalize_decoding()
+align_decoder.finalize_decoding()
+
+print('utterance[s]  get_decoded_string[ms]  get_partial_hypothesis[ms]  get_partial_word_alignment[ms]')
+
+for bucket in sorted(buckets):
+    t_string  = [t[0] for t in buckets[bucket]]
+    t_partial = [t[1] for t in buckets[bucket]]
+    t_align   = [t[2] for t in buckets[bucket]]
+    print('%5.0f-%5.0f %24.3f %27.3f %31.3f' % (bucket * BUCKET_S, (bucket + 1) * BUCKET_S,
+                                                1000.0 * sum(t_string) / len(t_string),
+                                                1000.0 * sum(t_partial) / len(t_partial),
+                                                1000.0 * sum(t_align) / len(t_align)))
+
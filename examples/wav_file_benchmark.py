@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+# Copyright 2016, 2017, 2018 Guenter Bartsch
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# THIS CODE IS PROVIDED *AS IS* BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, EITHER EXPRESS OR IMPLIED, INCLUDING WITHOUT LIMITATION ANY IMPLIED
+# WARRANTIES OR CONDITIONS OF TITLE, FITNESS FOR A PARTICULAR PURPOSE,
+# MERCHANTABLITY OR NON-INFRINGEMENT.
+# See the Apache 2 License for the specific language governing permissions and
+# limitations under the License.
+#
+#
+# long file benchmark: builds a long WAV file by repeating data/dw961.wav,
+# then decodes it in a fresh process per method - the old way of unpacking
+# the whole file into a tuple of Python ints, decode_wav_file() streaming
+# the file in blocks and decode_pcm_file() on the raw samples - and reports
+# time taken and peak resident memory on top of the loaded model.
+#
+
+from __future__ import print_function
+
+import os
+import sys
+import json
+import wave
+import struct
+import tempfile
+import subprocess
+
+from time import time
+from optparse import OptionParser, SUPPRESS_HELP
+
+MODELDIR = 'data/models/kaldi-generic-en-tdnn_sp-latest'
+WAVFILE  = 'data/dw961.wav'
+METHODS  = ['unpack', 'wav_file', 'pcm_file']
+
+def peak_rss():
+    # VmHWM, peak resident set size since the last reset, linux only
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmHWM:'):
+                return int(line.split()[1]) * 1024
+    return 0
+
+def reset_peak_rss():
+    # linux 4.0+, silently ignored elsewhere
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except IOError:
+        pass
+
+def decode_unpack(decoder, wavfn):
+
+    import numpy as np
+
+    wavf = wave.open(wavfn, 'rb')
+    num_frames = wavf.getnframes()
+    samples = struct.unpack_from('<%dh' % num_frames, wavf.readframes(num_frames))
+    samp_freq = wavf.getframerate()
+    wavf.close()
+
+    return decoder.decode(samp_freq, np.array(samples, dtype=np.float32), True)
+
+def run(model_dir, method, wavfn, pcmfn, samp_freq):
+
+    from kaldiasr.nnet3 import KaldiNNet3OnlineModel, KaldiNNet3OnlineDecoder
+
+    kaldi_model = KaldiNNet3OnlineModel (model_dir)
+    decoder     = KaldiNNet3OnlineDecoder (kaldi_model)
+
+    reset_peak_rss()
+    rss_start  = peak_rss()
+    time_start = time()
+
+    if method == 'unpack':
+        ok = decode_unpack(decoder, wavfn)
+    elif method == 'wav_file':
+        ok = decoder.decode_wav_file(wavfn)
+    else:
+        ok = decoder.decode_pcm_file(pcmfn, samp_freq)
+
+    print(json.dumps({'ok'       : ok,
+                      'time'     : time() - time_start,
+                      'peak_rss' : peak_rss() - rss_start}))
+
+parser = OptionParser("usage: %prog [options]")
+
+parser.add_option ("-m", "--model-dir", dest="model_dir", type = "string", default=MODELDIR,
+                   help="kaldi model directory, default: %s" % MODELDIR)
+
+parser.add_option ("-M", "--minutes", dest="minutes", type = "float", default=10.0,
+                   help="length of the test file in minutes, default: 10")
+
+parser.add_option ("--child", dest="child", type = "string", default=None,
+                   help=SUPPRESS_HELP) # internal: JSON encoded [method, wavfn, pcmfn, samp_freq]
+
+(options, args) = parser.parse_args()
+
+if options.child is not None:
+    run(options.model_dir, *json.loads(options.child))
+    sys.exit(0)
+
+#
+# build test files
+#
+
+wavf = wave.open(WAVFILE, 'rb')
+samp_freq = wavf.getframerate()
+pcm = wavf.readframes(wavf.getnframes())
+wavf.close()
+
+repeat = int(options.minutes * 60 * samp_freq / (len(pcm) // 2)) + 1
+
+tmpdir = tempfile.mkdtemp()
+wavfn  = os.path.join(tmpdir, 'long.wav')
+pcmfn  = os.path.join(tmpdir, 'long.raw')
+
+wavf = wave.open(wavfn, 'wb')
+wavf.setnchannels(1)
+wavf.setsampwidth(2)
+wavf.setframerate(samp_freq)
+with open(pcmfn, 'wb') as pcmf:
+    for i in range(repeat):
+        wavf.writeframes(pcm)
+        pcmf.write(pcm)
+wavf.close()
+
+audio_secs = float(repeat * (len(pcm) // 2)) / samp_freq
+
+print('%.1fs of audio' % audio_secs)
+print('method       time[s]     RTF  peak rss[MB]')
+
+try:
+    for method in METHODS:
+        out = subprocess.check_output([sys.executable, sys.argv[0], '-m', options.model_dir,
+                                       '--child', json.dumps([method, wavfn, pcmfn, samp_freq])])
+        res = json.loads(out.decode('utf8').strip().splitlines()[-1])
+        print('%-10s %9.2f %7.3f %13.1f' % (method, res['time'], res['time'] / audio_secs,
+                                            float(res['peak_rss']) / 1e6))
+finally:
+    os.remove(wavfn)
+    os.remove(pcmfn)
+    os.rmdir(tmpdir)
+
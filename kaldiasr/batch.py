@@ -0,0 +1,381 @@
+#
+# Copyright 2016, 2017, 2018 G. Bartsch
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# THIS CODE IS PROVIDED *AS IS* BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, EITHER EXPRESS OR IMPLIED, INCLUDING WITHOUT LIMITATION ANY IMPLIED
+# WARRANTIES OR CONDITIONS OF TITLE, FITNESS FOR A PARTICULAR PURPOSE,
+# MERCHANTABLITY OR NON-INFRINGEMENT.
+# See the Apache 2 License for the specific language governing permissions and
+# limitations under the License.
+#
+#
+# parallel corpus transcription
+#
+# transcribes a directory of WAV files or a kaldi style wav.scp using a
+# pool of worker processes. Workers are forked after the model has been
+# loaded, so acoustic model, decoding graph and symbol tables are shared
+# copy-on-write instead of being loaded once per worker.
+#
+# usage:
+#
+#     python -m kaldiasr.batch [options] <wav.scp|wav dir> <out.jsonl|out.ctm>
+#
+
+from __future__ import print_function
+
+import io
+import os
+import sys
+import math
+import json
+import wave
+import logging
+import multiprocessing
+
+from time import time
+from optparse import OptionParser
+
+DEFAULT_MODEL_DIR = 'data/models/kaldi-generic-en-tdnn_sp-latest'
+DEFAULT_MODEL     = 'model'
+DEFAULT_WORKERS   = multiprocessing.cpu_count()
+
+FORMAT_JSONL      = 'jsonl'
+FORMAT_CTM        = 'ctm'
+
+#
+# corpus readers
+#
+
+def read_wav_scp(scpfn):
+    """
+    Read a kaldi style wav.scp, returns a list of (utt_id, wavfn) tuples.
+    Only plain file names are supported, no extended filenames (pipes).
+    """
+
+    entries = []
+
+    with io.open(scpfn, 'r', encoding='utf8') as scpf:
+        for line in scpf:
+            line = line.strip()
+            if not line:
+                continue
+            parts = line.split(None, 1)
+            if len(parts) != 2:
+                raise Exception('%s: invalid line: %s' % (scpfn, line))
+            utt_id, wavfn = parts
+            if wavfn.endswith('|'):
+                raise Exception('%s: piped entries are not supported: %s' % (scpfn, line))
+            entries.append((utt_id, wavfn))
+
+    return entries
+
+def scan_wav_dir(wavdir):
+    """
+    Find all *.wav files below wavdir, returns a list of (utt_id, wavfn)
+    tuples with utt_id being the file path relative to wavdir sans extension.
+    """
+
+    entries = []
+
+    for dirpath, dirnames, filenames in os.walk(wavdir):
+        for fn in filenames:
+            if not fn.lower().endswith('.wav'):
+                continue
+            wavfn  = os.path.join(dirpath, fn)
+            utt_id = os.path.splitext(os.path.relpath(wavfn, wavdir))[0].replace(os.sep, '_')
+            entries.append((utt_id, wavfn))
+
+    return sorted(entries)
+
+def read_done(outfn, fmt):
+    """
+    Returns the set of utterance ids already present in an output file,
+    except for JSONL records of failed utterances, so these are retried.
+    CTM files only list utterances that produced at least one word, so
+    empty results will be transcribed again when resuming from a CTM file.
+    """
+
+    done = set()
+
+    if not os.path.exists(outfn):
+        return done
+
+    with io.open(outfn, 'r', encoding='utf8') as outf:
+        for line in outf:
+            line = line.strip()
+            if not line:
+                continue
+            if fmt == FORMAT_JSONL:
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    # truncated last line of an interrupted run
+                    continue
+                if rec.get('ok', True):
+                    done.add(rec['utt'])
+            else:
+                done.add(line.split()[0])
+
+    return done
+
+def truncate_partial_line(outfn):
+    """
+    Cut a trailing line without newline, left behind by an interrupted run,
+    off an output file, so results appended to it start on a line of their
+    own.
+    """
+
+    if not os.path.exists(outfn):
+        return
+
+    with io.open(outfn, 'rb+') as f:
+
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+
+        # search backwards for the last newline
+        pos = size
+        while pos > 0:
+            step  = min(4096, pos)
+            f.seek(pos - step)
+            block = f.read(step)
+            i     = block.rfind(b'\n')
+            if i >= 0:
+                pos = pos - step + i + 1
+                break
+            pos -= step
+
+        if pos < size:
+            logging.warning('%s: dropping truncated last line' % outfn)
+            f.truncate(pos)
+
+#
+# worker side
+#
+
+_model   = None # set before the worker processes are forked
+_decoder = None # one decoder per worker process
+
+def _init_worker():
+    global _decoder
+    from kaldiasr.nnet3 import KaldiNNet3OnlineDecoder
+    _decoder = KaldiNNet3OnlineDecoder(_model)
+
+def _transcribe(job):
+
+    utt_id, wavfn = job
+
+    time_start = time()
+
+    res = {'utt': utt_id, 'wav': wavfn, 'duration': 0.0, 'ok': False}
+
+    try:
+        # missing, truncated or non-WAV files fail this utterance only
+        wavf = wave.open(wavfn, 'rb')
+        res['duration'] = float(wavf.getnframes()) / float(wavf.getframerate())
+        wavf.close()
+
+        if _decoder.decode_wav_file(wavfn):
+            hstr, likelihood = _decoder.get_decoded_string()
+            res['hstr']       = hstr.strip()
+            res['likelihood'] = likelihood
+            alignment = _decoder.get_word_alignment(confidences=True) if _model.word_alignment else None
+            if alignment:
+                # optional silence (word id 0, confidence NaN) is no word,
+                # skipped like nbest-to-ctm does
+                words, times, lengths, confidences = alignment
+                res['words'] = [(word.decode('utf8'), times[i], lengths[i], float(confidences[i]))
+                                for i, word in enumerate(words) if not math.isnan(confidences[i])]
+            res['ok'] = True
+    except Exception as e:
+        logging.error('%s: %s' % (wavfn, e))
+        _decoder.reset()
+
+    res['decode_time'] = time() - time_start
+    res['worker']      = os.getpid()
+
+    return res
+
+#
+# parent side
+#
+
+def _file_size(job):
+    # unreadable files sort last, _transcribe() reports them
+    try:
+        return os.path.getsize(job[1])
+    except OSError:
+        return -1
+
+def _write_result(outf, fmt, res, frame_shift):
+
+    if fmt == FORMAT_JSONL:
+        rec = dict(res)
+        if 'words' in rec:
+            rec['words'] = [(word, start * frame_shift, length * frame_shift, conf)
+                            for word, start, length, conf in rec['words']]
+        outf.write(u'%s\n' % json.dumps(rec, ensure_ascii=False))
+
+    else:
+        for word, start, length, conf in res.get('words', []):
+            outf.write(u'%s 1 %.2f %.2f %s %.2f\n' % (res['utt'], start * frame_shift, length * frame_shift, word, conf))
+
+    outf.flush()
+
+def transcribe_corpus(model, entries, outfn, fmt=FORMAT_JSONL, num_workers=DEFAULT_WORKERS, resume=True,
+                      frame_shift=None):
+    """
+    Transcribe all (utt_id, wavfn) entries using num_workers forked worker
+    processes sharing model, streaming results to outfn as they come in.
+    Files are scheduled longest first for good load balance. With resume
+    set, utterances already present in outfn are skipped (failed ones are
+    retried) and new results are appended.
+
+    Returns a dict mapping worker pid to (num_utts, audio seconds, decode
+    seconds).
+    """
+
+    global _model
+
+    if frame_shift is None:
+        frame_shift = model.frame_shift
+
+    if resume:
+        truncate_partial_line(outfn)
+
+    done = read_done(outfn, fmt) if resume else set()
+    jobs = [(utt_id, wavfn) for utt_id, wavfn in entries if utt_id not in done]
+    jobs.sort(key=_file_size, reverse=True)
+
+    logging.info('%d utterances, %d already done, %d to transcribe using %d workers.' % (len(entries), len(done),
+                                                                                        len(jobs), num_workers))
+
+    stats = {}
+
+    with io.open(outfn, 'a' if resume else 'w', encoding='utf8') as outf:
+
+        _model = model
+
+        # lexicon info and symbol table are built lazily, do it here so the
+        # workers share them instead of each building its own copy
+        model.load_resources()
+
+        if num_workers > 1:
+            ctx     = multiprocessing.get_context('fork') if hasattr(multiprocessing, 'get_context') else multiprocessing
+            pool    = ctx.Pool(num_workers, initializer=_init_worker)
+            results = pool.imap_unordered(_transcribe, jobs)
+        else:
+            _init_worker()
+            pool    = None
+            results = (_transcribe(job) for job in jobs)
+
+        try:
+            for cnt, res in enumerate(results):
+
+                _write_result(outf, fmt, res, frame_shift)
+
+                num_utts, audio_time, decode_time = stats.get(res['worker'], (0, 0.0, 0.0))
+                stats[res['worker']] = (num_utts + 1, audio_time + res['duration'], decode_time + res['decode_time'])
+
+                logging.debug('%5d/%5d %s %s' % (cnt + 1, len(jobs), res['utt'], res.get('hstr')))
+
+        finally:
+            if pool:
+                pool.close()
+                pool.join()
+
+    return stats
+
+def main():
+
+    parser = OptionParser("usage: %prog [options] <wav.scp|wav dir> <out.jsonl|out.ctm>")
+
+    parser.add_option ("-d", "--model-dir", dest="model_dir", type = "string", default=DEFAULT_MODEL_DIR,
+                       help="kaldi model directory, default: %s" % DEFAULT_MODEL_DIR)
+
+    parser.add_option ("-m", "--model", dest="model", type = "string", default=DEFAULT_MODEL,
+                       help="kaldi model, default: %s" % DEFAULT_MODEL)
+
+    parser.add_option ("-b", "--beam", dest="beam", type = "float", default=7.0,
+                       help="decoder beam, default: 7.0")
+
+    parser.add_option ("-a", "--acoustic-scale", dest="acoustic_scale", type = "float", default=1.0,
+                       help="acoustic scale, default: 1.0")
+
+    parser.add_option ("-f", "--frame-subsampling-factor", dest="frame_subsampling_factor", type = "int", default=3,
+                       help="frame subsampling factor, default: 3")
+
+    parser.add_option ("-j", "--workers", dest="workers", type = "int", default=DEFAULT_WORKERS,
+                       help="number of worker processes, default: %d" % DEFAULT_WORKERS)
+
+    parser.add_option ("-F", "--format", dest="fmt", type = "string", default=None,
+                       help="output format, %s or %s, default: derived from output file extension" % (FORMAT_JSONL, FORMAT_CTM))
+
+    parser.add_option ("-n", "--no-resume", action="store_true", dest="no_resume",
+                       help="overwrite output file instead of resuming from it")
+
+    parser.add_option ("-v", "--verbose", action="store_true", dest="verbose",
+                       help="verbose output")
+
+    (options, args) = parser.parse_args()
+
+    if options.verbose:
+        logging.basicConfig(level=logging.DEBUG)
+    else:
+        logging.basicConfig(level=logging.INFO)
+
+    if len(args) != 2:
+        parser.print_help()
+        sys.exit(1)
+
+    corpus, outfn = args
+
+    fmt = options.fmt
+    if fmt is None:
+        fmt = FORMAT_CTM if outfn.lower().endswith('.ctm') else FORMAT_JSONL
+    if fmt not in [FORMAT_JSONL, FORMAT_CTM]:
+        parser.error('unknown output format: %s' % fmt)
+
+    if os.path.isdir(corpus):
+        entries = scan_wav_dir(corpus)
+    else:
+        entries = read_wav_scp(corpus)
+
+    from kaldiasr.nnet3 import KaldiNNet3OnlineModel
+
+    time_start = time()
+    logging.info('%s loading model from %s ...' % (options.model, options.model_dir))
+    model = KaldiNNet3OnlineModel (options.model_dir, options.model,
+                                   beam                     = options.beam,
+                                   acoustic_scale           = options.acoustic_scale,
+                                   frame_subsampling_factor = options.frame_subsampling_factor)
+    logging.info('%s loading model... done. took %fs.' % (options.model, time()-time_start))
+
+    time_start = time()
+    stats = transcribe_corpus(model, entries, outfn, fmt=fmt, num_workers=options.workers,
+                              resume=not options.no_resume)
+    wall_time = time() - time_start
+
+    tot_utts, tot_audio, tot_decode = 0, 0.0, 0.0
+    for worker in sorted(stats):
+        num_utts, audio_time, decode_time = stats[worker]
+        logging.info('worker %6d: %6d utts, %9.1fs audio, RTF %.3f' % (worker, num_utts, audio_time,
+                                                                       decode_time / audio_time if audio_time else 0.0))
+        tot_utts   += num_utts
+        tot_audio  += audio_time
+        tot_decode += decode_time
+
+    if tot_audio:
+        logging.info('total      : %6d utts, %9.1fs audio, RTF %.3f per worker, %.3f wall clock' % (tot_utts, tot_audio,
+                                                                                                  tot_decode / tot_audio,
+                                                                                                  wall_time / tot_audio))
+
+if __name__ == '__main__':
+    main()
+
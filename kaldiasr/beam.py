@@ -0,0 +1,263 @@
+#
+# Copyright 2016, 2017, 2018 G. Bartsch
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# THIS CODE IS PROVIDED *AS IS* BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, EITHER EXPRESS OR IMPLIED, INCLUDING WITHOUT LIMITATION ANY IMPLIED
+# WARRANTIES OR CONDITIONS OF TITLE, FITNESS FOR A PARTICULAR PURPOSE,
+# MERCHANTABLITY OR NON-INFRINGEMENT.
+# See the Apache 2 License for the specific language governing permissions and
+# limitations under the License.
+#
+#
+# adaptive search beam: trade accuracy for speed under load
+#
+
+import logging
+import threading
+
+import numpy as np
+
+from time import time
+
+# a controller re-evaluates the load after this many seconds of audio
+DEFAULT_INTERVAL  = 0.5
+
+# real time factor (processing time per second of audio, including waiting
+# for a decoding thread) above which the beam is narrowed, below which it
+# may be widened again
+DEFAULT_RTF_HIGH  = 0.8
+DEFAULT_RTF_LOW   = 0.5
+
+# host CPU utilization thresholds, same idea
+DEFAULT_CPU_HIGH  = 0.95
+DEFAULT_CPU_LOW   = 0.8
+
+# narrow fast, widen slowly: fraction of the range between the narrowest and
+# the model's settings per step
+DEFAULT_NARROW_STEP = 0.25
+DEFAULT_WIDEN_STEP  = 0.05
+
+# narrowest settings, relative to the model's
+DEFAULT_MIN_BEAM_RATIO       = 0.5
+DEFAULT_MIN_MAX_ACTIVE_RATIO = 0.25
+
+
+def _num_samples(samples):
+
+    """
+    Number of samples in anything decode() accepts: raw bytes-like objects
+    hold 16 bit PCM, so two bytes per sample (same as _as_samples() in the
+    decoder modules).
+    """
+
+    if isinstance(samples, np.ndarray):
+        return len(samples)
+    if isinstance(samples, (bytes, bytearray)):
+        return len(samples) // 2
+
+    arr = np.asarray(samples)
+    if arr.dtype.itemsize == 1:
+        return arr.nbytes // 2
+    return len(arr)
+
+
+class CpuLoad(object):
+
+    """
+    Host CPU utilization (0.0 ... 1.0 over all CPUs) from /proc/stat,
+    sampled at most every interval seconds, so any number of controllers
+    can share one instance. Thread-safe.
+    """
+
+    def __init__(self, interval=1.0, stat_filename='/proc/stat'):
+
+        self.interval      = interval
+        self.stat_filename = stat_filename
+
+        self._lock       = threading.Lock()
+        self._last_time  = 0.0
+        self._last_times = self._read()
+        self._load       = None
+
+    def get(self):
+        """
+        Utilization since the previous sample, None if unknown (no
+        /proc/stat or no sample taken yet).
+        """
+
+        with self._lock:
+
+            now = time()
+            if now - self._last_time < self.interval:
+                return self._load
+
+            times = self._read()
+            if times and self._last_times:
+                total = times[0] - self._last_times[0]
+                idle  = times[1] - self._last_times[1]
+                if total > 0:
+                    self._load = 1.0 - float(idle) / total
+
+            self._last_time  = now
+            self._last_times = times
+
+            return self._load
+
+    def _read(self):
+
+        # first line: cpu user nice system idle iowait irq softirq steal ...
+        try:
+            with open(self.stat_filename) as f:
+                fields = [int(v) for v in f.readline().split()[1:]]
+        except (IOError, OSError, ValueError):
+            return None
+
+        idle = fields[3] + (fields[4] if len(fields) > 4 else 0)
+        return sum(fields[:8]), idle
+
+
+class AdaptiveBeamController(object):
+
+    """
+    Adjusts the search beam of one decoder to the load: when decoding falls
+    behind real time (processing time per second of audio above rtf_high)
+    or the host CPU is saturated (above cpu_high, if a CpuLoad is given)
+    beam, max_active and lattice_beam are narrowed step by step down to
+    min_beam / min_max_active. When there is slack again (below rtf_low and
+    cpu_low) they are slowly widened back up to the decoder's settings at
+    creation time. Decisions are taken every interval seconds of audio,
+    based on all processing time reported meanwhile, so a single slow chunk
+    does not move the beam. Not thread-safe, use one controller per
+    decoder.
+
+    Usage:
+
+        cpu_load   = CpuLoad()                                  # shared
+        controller = AdaptiveBeamController(decoder, cpu_load=cpu_load)
+
+        for chunk in chunks:
+            controller.decode(16000, chunk, False)              # or decode() + update()
+
+        controller.restore()                                    # back to the model's beam
+    """
+
+    def __init__(self, decoder, min_beam=None, min_max_active=None, cpu_load=None,
+                 rtf_high=DEFAULT_RTF_HIGH, rtf_low=DEFAULT_RTF_LOW,
+                 cpu_high=DEFAULT_CPU_HIGH, cpu_low=DEFAULT_CPU_LOW,
+                 narrow_step=DEFAULT_NARROW_STEP, widen_step=DEFAULT_WIDEN_STEP,
+                 interval=DEFAULT_INTERVAL):
+
+        self.decoder  = decoder
+        self.cpu_load = cpu_load
+
+        self.max_beam, self.max_max_active, self.min_active, self.max_lattice_beam = decoder.get_beam()
+
+        self.min_beam       = min_beam if min_beam is not None else self.max_beam * DEFAULT_MIN_BEAM_RATIO
+        self.min_max_active = min_max_active if min_max_active is not None else \
+                              max(self.min_active, int(self.max_max_active * DEFAULT_MIN_MAX_ACTIVE_RATIO))
+
+        if self.min_beam > self.max_beam or self.min_max_active > self.max_max_active:
+            raise Exception('narrowest beam settings (%s, %d) wider than the decoder\'s (%s, %d)'
+                            % (self.min_beam, self.min_max_active, self.max_beam, self.max_max_active))
+
+        self.rtf_high    = rtf_high
+        self.rtf_low     = rtf_low
+        self.cpu_high    = cpu_high
+        self.cpu_low     = cpu_low
+        self.narrow_step = narrow_step
+        self.widen_step  = widen_step
+        self.interval    = interval
+
+        # 1.0: the decoder's settings, 0.0: the narrowest ones
+        self.level = 1.0
+
+        self._audio_time = 0.0
+        self._busy_time  = 0.0
+
+        # stats
+        self.num_narrowed = 0
+        self.num_widened  = 0
+
+    def decode(self, samp_freq, samples, finalize):
+        """
+        decoder.decode() followed by update() with its processing time.
+        """
+
+        time_start = time()
+        res = self.decoder.decode(samp_freq, samples, finalize)
+        self.update(float(_num_samples(samples)) / samp_freq, time() - time_start)
+
+        return res
+
+    def update(self, audio_time, busy_time):
+
+        """
+        Report audio_time seconds of audio processed within busy_time
+        seconds (including any time spent waiting for a thread or decoder).
+        Returns -1 if the beam was narrowed, 1 if it was widened, else 0.
+        """
+
+        self._audio_time += audio_time
+        self._busy_time  += busy_time
+
+        if self._audio_time < self.interval:
+            return 0
+
+        rtf = self._busy_time / self._audio_time
+        self._audio_time = 0.0
+        self._busy_time  = 0.0
+
+        cpu = self.cpu_load.get() if self.cpu_load else None
+
+        if rtf > self.rtf_high or (cpu is not None and cpu > self.cpu_high):
+            level = max(0.0, self.level - self.narrow_step)
+        elif rtf < self.rtf_low and (cpu is None or cpu < self.cpu_low):
+            level = min(1.0, self.level + self.widen_step)
+        else:
+            return 0
+
+        if level == self.level:
+            return 0
+
+        change = -1 if level < self.level else 1
+        if change < 0:
+            self.num_narrowed += 1
+        else:
+            self.num_widened += 1
+
+        logging.debug('beam level %.2f -> %.2f (rtf %.2f, cpu %s)' % (self.level, level, rtf, cpu))
+
+        self.set_level(level)
+
+        return change
+
+    def set_level(self, level):
+
+        """
+        Set the beam to level (0.0: narrowest, 1.0: the decoder's settings at
+        creation time) right away.
+        """
+
+        self.level = level
+
+        beam         = self.min_beam + level * (self.max_beam - self.min_beam)
+        max_active   = int(round(self.min_max_active + level * (self.max_max_active - self.min_max_active)))
+        lattice_beam = self.max_lattice_beam * beam / self.max_beam
+
+        self.decoder.set_beam(beam=beam, max_active=max(max_active, self.min_active),
+                              lattice_beam=lattice_beam)
+
+    def restore(self):
+        """
+        Back to the decoder's settings at creation time.
+        """
+
+        self._audio_time = 0.0
+        self._busy_time  = 0.0
+        self.set_level(1.0)
@@ -0,0 +1,110 @@
+// decoder_stats.h
+//
+// Copyright 2016, 2017 G. Bartsch
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//  http://www.apache.org/licenses/LICENSE-2.0
+//
+// THIS CODE IS PROVIDED *AS IS* BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+// KIND, EITHER EXPRESS OR IMPLIED, INCLUDING WITHOUT LIMITATION ANY IMPLIED
+// WARRANTIES OR CONDITIONS OF TITLE, FITNESS FOR A PARTICULAR PURPOSE,
+// MERCHANTABLITY OR NON-INFRINGEMENT.
+// See the Apache 2 License for the specific language governing permissions and
+// limitations under the License.
+//
+
+// per-stage timing and search statistics of the online decoder wrappers,
+// collected only while instrumentation is enabled
+
+#ifndef KALDIASR_DECODER_STATS_H_
+#define KALDIASR_DECODER_STATS_H_
+
+#include "base/kaldi-common.h"
+
+#include <algorithm>
+#include <chrono>
+#include <vector>
+
+namespace kaldi {
+
+    // stages of a decode, order matches DECODER_STAGES in kaldiasr/metrics.py
+    enum DecoderStage {
+        kStageFeatures = 0, // feature extraction (AcceptWaveform)
+        kStageNnet,         // nnet3 forward pass incl. iVector extraction, nnet3 only
+        kStageSearch,       // beam search (AdvanceDecoding minus the nnet3 forward pass)
+        kStageFinalize,     // final pruning (FinalizeDecoding)
+        kStageDeterminize,  // lattice determinization (GMM: incl. fMLLR rescoring)
+        kStageAlign,        // word alignment
+        kNumDecoderStages
+    };
+
+    // histogram bucket upper bounds, values above the last one are counted
+    // in an extra bucket
+    static const double kStageTimeBounds[]   = { 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                                                 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0 };
+    static const double kActiveTokenBounds[] = { 100, 250, 500, 1000, 2500, 5000, 10000, 25000,
+                                                 50000, 100000 };
+
+    struct StatsHistogram {
+
+        StatsHistogram(const double *bounds, size_t num_bounds) :
+            bounds(bounds, bounds + num_bounds), counts(num_bounds + 1, 0.0), count(0.0), sum(0.0) { }
+
+        void add(double value) {
+            // prometheus semantics: bucket i counts values <= bounds[i]
+            counts[std::lower_bound(bounds.begin(), bounds.end(), value) - bounds.begin()] += 1.0;
+            count += 1.0;
+            sum   += value;
+        }
+
+        std::vector<double> bounds;
+        std::vector<double> counts;
+        double              count;
+        double              sum;
+    };
+
+    // cumulative counters and histograms of one decoder
+    struct DecoderStats {
+
+        DecoderStats() :
+            chunks(0.0), utterances(0.0), frames_decoded(0.0), audio_seconds(0.0), decode_seconds(0.0),
+            active_tokens(kActiveTokenBounds, sizeof(kActiveTokenBounds) / sizeof(double)) {
+            for (int32 i = 0; i < kNumDecoderStages; i++)
+                stages.push_back(StatsHistogram(kStageTimeBounds, sizeof(kStageTimeBounds) / sizeof(double)));
+        }
+
+        double                      chunks;          // decode() calls
+        double                      utterances;      // finished utterances
+        double                      frames_decoded;  // output frames (after frame subsampling)
+        double                      audio_seconds;   // audio fed into decode()
+        double                      decode_seconds;  // time spent decoding it, incl. finalization
+
+        std::vector<StatsHistogram> stages;          // seconds per call, indexed by DecoderStage
+        StatsHistogram              active_tokens;   // on the last frame of each chunk
+    };
+
+    // monotonic wall clock stopwatch, a disabled one never reads the clock
+    class StatsTimer {
+    public:
+        explicit StatsTimer(bool enabled = true) : enabled(enabled) {
+            if (enabled)
+                start = std::chrono::steady_clock::now();
+        }
+
+        double elapsed(void) const {
+            if (!enabled)
+                return 0.0;
+            return std::chrono::duration<double>(std::chrono::steady_clock::now() - start).count();
+        }
+
+    private:
+        bool                                  enabled;
+        std::chrono::steady_clock::time_point start;
+    };
+
+}
+
+#endif
@@ -33,11 +33,123 @@
 #include "fstext/fstext-lib.h"
 #include "lat/lattice-functions.h"
 #include "lat/word-align-lattice-lexicon.h"
+#include "lat/sausages.h"
+
+#include <algorithm>
+#include <limits>
+#include <sstream>
 
 #define VERBOSE 0
 
 namespace kaldi {
 
+    /*
+     * lattice export helpers
+     */
+
+    // copy of a decoder lattice with the acoustic scale removed, the way
+    // kaldi's decoders write their lattices
+
+    static void unscale_lattice(const CompactLattice &clat, BaseFloat acoustic_scale, CompactLattice *out) {
+        *out = clat;
+        if (acoustic_scale != 0.0)
+            fst::ScaleLattice(fst::AcousticLatticeScale(1.0 / acoustic_scale), out);
+    }
+
+    static void compact_lattice_to_arrays(const CompactLattice   &clat,
+                                          int32                  &start,
+                                          std::vector<int32>     &arcs,
+                                          std::vector<BaseFloat> &arc_weights,
+                                          std::vector<int32>     &arc_alignment_offsets,
+                                          std::vector<int32>     &arc_alignments,
+                                          std::vector<BaseFloat> &final_weights,
+                                          std::vector<int32>     &final_alignment_offsets,
+                                          std::vector<int32>     &final_alignments) {
+
+        typedef CompactLattice::StateId StateId;
+
+        start = clat.Start();
+
+        arcs.clear();
+        arc_weights.clear();
+        arc_alignment_offsets.assign(1, 0);
+        arc_alignments.clear();
+        final_weights.clear();
+        final_alignment_offsets.assign(1, 0);
+        final_alignments.clear();
+
+        for (StateId s = 0; s < clat.NumStates(); s++) {
+
+            CompactLatticeWeight final_weight = clat.Final(s);
+            if (final_weight == CompactLatticeWeight::Zero()) {
+                final_weights.push_back(std::numeric_limits<BaseFloat>::infinity());
+                final_weights.push_back(std::numeric_limits<BaseFloat>::infinity());
+            } else {
+                final_weights.push_back(final_weight.Weight().Value1());
+                final_weights.push_back(final_weight.Weight().Value2());
+                final_alignments.insert(final_alignments.end(),
+                                        final_weight.String().begin(), final_weight.String().end());
+            }
+            final_alignment_offsets.push_back(final_alignments.size());
+
+            for (fst::ArcIterator<CompactLattice> aiter(clat, s); !aiter.Done(); aiter.Next()) {
+                const CompactLatticeArc &arc = aiter.Value();
+                arcs.push_back(s);
+                arcs.push_back(arc.nextstate);
+                arcs.push_back(arc.ilabel);
+                arc_weights.push_back(arc.weight.Weight().Value1());
+                arc_weights.push_back(arc.weight.Weight().Value2());
+                arc_alignments.insert(arc_alignments.end(),
+                                      arc.weight.String().begin(), arc.weight.String().end());
+                arc_alignment_offsets.push_back(arc_alignments.size());
+            }
+        }
+    }
+
+    static void compact_lattice_to_bytes(const CompactLattice &clat, std::string &data) {
+
+        // binary kaldi object, as found after the key in a lattice archive
+        std::ostringstream os;
+        InitKaldiOutputStream(os, true);
+        if (!WriteCompactLattice(os, true, clat))
+            KALDI_ERR << "Could not write lattice";
+        data = os.str();
+    }
+
+    static void lattice_nbest(const CompactLattice             &clat,
+                              int32                             n,
+                              std::vector<std::vector<int32> > &word_ids,
+                              std::vector<double>              &likelihoods) {
+
+        Lattice lat, nbest_lat;
+        ConvertLattice(clat, &lat);
+        fst::ShortestPath(lat, &nbest_lat, n);
+
+        std::vector<Lattice> nbest_lats;
+        fst::ConvertNbestToVector(nbest_lat, &nbest_lats);
+
+        // likelihood per frame like get_decoded_string(), best first
+
+        std::vector<std::pair<double, size_t> > order;
+        std::vector<std::vector<int32> >        words(nbest_lats.size());
+
+        for (size_t i = 0; i < nbest_lats.size(); i++) {
+            std::vector<int32> alignment;
+            LatticeWeight      weight;
+            GetLinearSymbolSequence(nbest_lats[i], &alignment, &words[i], &weight);
+            double likelihood = alignment.size() > 0 ? -(weight.Value1() + weight.Value2()) / alignment.size() : 0.0;
+            order.push_back(std::make_pair(-likelihood, i));
+        }
+        std::sort(order.begin(), order.end());
+
+        word_ids.resize(order.size());
+        likelihoods.resize(order.size());
+        for (size_t i = 0; i < order.size(); i++) {
+            word_ids[i].swap(words[order[i].second]);
+            likelihoods[i] = -order[i].first;
+        }
+    }
+
     /*
      * GmmOnlineDecoderWrapper
      */
@@ -48,31 +160,35 @@ namespace kaldi {
 
         tot_frames         = 0;
         tot_frames_decoded = 0;
-
-       
+        num_frames_decoded = 0;
+        endpointed         = false;
+        stats_enabled      = false;
+        decode_config      = model->decode_config;
+
+        // fMLLR transform and CMVN state carry over from one utterance to
+        // the next, until reset(true) is called
+        adaptation_state   = new OnlineGmmAdaptationState ();
     }
 
     GmmOnlineDecoderWrapper::~GmmOnlineDecoderWrapper() {
         free_decoder();
+        delete adaptation_state;
     }
 
     void GmmOnlineDecoderWrapper::start_decoding(void) {
 #if VERBOSE
         KALDI_LOG << "start_decoding..." ;
-        KALDI_LOG << "max_active  :" << model->decode_config.faster_decoder_opts.max_active;
-        KALDI_LOG << "min_active  :" << model->decode_config.faster_decoder_opts.min_active;
-        KALDI_LOG << "beam        :" << model->decode_config.faster_decoder_opts.beam;
-        KALDI_LOG << "lattice_beam:" << model->decode_config.faster_decoder_opts.lattice_beam;
+        KALDI_LOG << "max_active  :" << decode_config.faster_decoder_opts.max_active;
+        KALDI_LOG << "min_active  :" << decode_config.faster_decoder_opts.min_active;
+        KALDI_LOG << "beam        :" << decode_config.faster_decoder_opts.beam;
+        KALDI_LOG << "lattice_beam:" << decode_config.faster_decoder_opts.lattice_beam;
 #endif
         free_decoder();
-#if VERBOSE
-        KALDI_LOG << "alloc: OnlineGmmAdaptationState";
-#endif
-        adaptation_state = new OnlineGmmAdaptationState ();
 #if VERBOSE
         KALDI_LOG << "alloc: SingleUtteranceGmmDecoder";
 #endif
-        decoder = new SingleUtteranceGmmDecoder (model->decode_config,
+        num_frames_decoded = 0;
+        decoder = new SingleUtteranceGmmDecoder (decode_config,
                                                  *model->gmm_models,
                                                  *model->feature_pipeline_prototype,
                                                  *model->decode_fst,//ok
@@ -90,20 +206,150 @@ namespace kaldi {
             delete decoder;
             decoder = NULL;
         }
-        if (adaptation_state) {
-            delete adaptation_state; 
-            adaptation_state = NULL;
+    }
+
+    void GmmOnlineDecoderWrapper::reset(bool reset_adaptation_state) {
+
+        // drop any utterance in progress as well as the last result
+
+        free_decoder();
+        best_path_clat.DeleteStates();
+        lattice_clat.DeleteStates();
+
+        tot_frames         = 0;
+        tot_frames_decoded = 0;
+        endpointed         = false;
+
+        if (reset_adaptation_state) {
+#if VERBOSE
+            KALDI_LOG << "reset: OnlineGmmAdaptationState";
+#endif
+            delete adaptation_state;
+            adaptation_state = new OnlineGmmAdaptationState ();
+        }
+
+        // allocate the decoder right away so the first chunk of the next
+        // utterance does not have to pay for it
+        start_decoding();
+    }
+
+    void GmmOnlineDecoderWrapper::get_adaptation_state(std::string &state) {
+
+        std::ostringstream os;
+        adaptation_state->Write(os, true);
+        state = os.str();
+    }
+
+    void GmmOnlineDecoderWrapper::set_adaptation_state(const std::string &state) {
+
+        OnlineGmmAdaptationState *new_state = new OnlineGmmAdaptationState ();
+        try {
+            std::istringstream is(state);
+            new_state->Read(is, true);
+        } catch (...) {
+            delete new_state;
+            throw;
         }
+
+        delete adaptation_state;
+        adaptation_state = new_state;
+
+        // no audio seen yet: restart the utterance from this state, the
+        // decoder copies it on construction
+        if (decoder && tot_frames == 0)
+            start_decoding();
+    }
+
+    void GmmOnlineDecoderWrapper::set_stats_enabled(bool enabled) {
+        stats_enabled = enabled;
+    }
+
+    void GmmOnlineDecoderWrapper::get_stats(DecoderStats &stats_out) {
+        std::lock_guard<std::mutex> lock(stats_mutex);
+        stats_out = stats;
+    }
+
+    void GmmOnlineDecoderWrapper::reset_stats(void) {
+        std::lock_guard<std::mutex> lock(stats_mutex);
+        stats = DecoderStats();
+    }
+
+    void GmmOnlineDecoderWrapper::get_beam_options(BaseFloat &beam,
+                                                   int32     &max_active,
+                                                   int32     &min_active,
+                                                   BaseFloat &lattice_beam) {
+        beam         = decode_config.faster_decoder_opts.beam;
+        max_active   = decode_config.faster_decoder_opts.max_active;
+        min_active   = decode_config.faster_decoder_opts.min_active;
+        lattice_beam = decode_config.faster_decoder_opts.lattice_beam;
+    }
+
+    void GmmOnlineDecoderWrapper::set_beam_options(BaseFloat beam,
+                                                   int32     max_active,
+                                                   int32     min_active,
+                                                   BaseFloat lattice_beam) {
+
+        // kaldi only asserts these, which would abort the process
+        if (!(beam > 0.0 && lattice_beam > 0.0 && max_active > 1 && min_active >= 0 && min_active <= max_active))
+            KALDI_ERR << "Invalid beam options: beam=" << beam << " max_active=" << max_active
+                      << " min_active=" << min_active << " lattice_beam=" << lattice_beam;
+
+        decode_config.faster_decoder_opts.beam         = beam;
+        decode_config.faster_decoder_opts.max_active   = max_active;
+        decode_config.faster_decoder_opts.min_active   = min_active;
+        decode_config.faster_decoder_opts.lattice_beam = lattice_beam;
+    }
+
+    void GmmOnlineDecoderWrapper::reset_beam_options(void) {
+        const LatticeFasterDecoderConfig &config = model->decode_config.faster_decoder_opts;
+        set_beam_options(config.beam, config.max_active, config.min_active, config.lattice_beam);
+    }
+
+    void GmmOnlineDecoderWrapper::add_stage_time(DecoderStage stage, double seconds) {
+        std::lock_guard<std::mutex> lock(stats_mutex);
+        stats.stages[stage].add(seconds);
+    }
+
+    void GmmOnlineDecoderWrapper::add_decode_time(int32 num_chunks, double audio_seconds, double seconds) {
+        std::lock_guard<std::mutex> lock(stats_mutex);
+        stats.chunks         += num_chunks;
+        stats.audio_seconds  += audio_seconds;
+        stats.decode_seconds += seconds;
     }
 
     void GmmOnlineDecoderWrapper::get_decoded_string(std::string &decoded_string, double &likelihood) {
 
-        //std::string                                decoded_string;
-        //double                                     likelihood;
+        std::vector<int32> words;
+
+        get_decoded_word_ids(words, likelihood);
+        word_ids_to_string(words, decoded_string);
+    }
 
-        Lattice best_path_lat;
+    void GmmOnlineDecoderWrapper::word_ids_to_string(const std::vector<int32> &words,
+                                                     std::string              &decoded_string) {
+
+        const fst::SymbolTable *word_syms = model->get_word_syms();
+
+        std::vector<string> word_strings(words.size());
+        size_t              len = 0;
+        for (size_t i = 0; i < words.size(); i++) {
+            word_strings[i] = word_syms->Find(words[i]);
+            if (word_strings[i] == "")
+                KALDI_ERR << "Word-id " << words[i] << " not in symbol table.";
+            len += word_strings[i].size() + 1;
+        }
+
+        decoded_string.clear();
+        decoded_string.reserve(len);
+        for (size_t i = 0; i < word_strings.size(); i++) {
+            decoded_string.append(word_strings[i]);
+            decoded_string.push_back(' ');
+        }
+    }
 
-        decoded_string = "";
+    void GmmOnlineDecoderWrapper::get_decoded_word_ids(std::vector<int32> &words, double &likelihood) {
+
+        Lattice best_path_lat;
 
         if (decoder) {
 
@@ -120,31 +366,52 @@ namespace kaldi {
             ConvertLattice(best_path_clat, &best_path_lat);
         }
             
-        std::vector<int32> words;
         std::vector<int32> alignment;
         LatticeWeight      weight;
         int32              num_frames;
         GetLinearSymbolSequence(best_path_lat, &alignment, &words, &weight);
         num_frames = alignment.size();
-        likelihood = -(weight.Value1() + weight.Value2()) / num_frames;
-                   
-        for (size_t i = 0; i < words.size(); i++) {
-            std::string s = model->word_syms->Find(words[i]);
-            if (s == "")
-                KALDI_ERR << "Word-id " << words[i] << " not in symbol table.";
-            decoded_string += s + ' ';
-        }
+        // no frames yet, e.g. right after reset()
+        likelihood = num_frames > 0 ? -(weight.Value1() + weight.Value2()) / num_frames : 0.0;
     }
 
     bool GmmOnlineDecoderWrapper::get_word_alignment(std::vector<string> &words,
                                                 std::vector<int32>  &times,
                                                 std::vector<int32>  &lengths) {
 
-        WordAlignLatticeLexiconInfo lexicon_info(model->word_alignment_lexicon);
+        std::vector<int32> word_idxs;
+        if (!get_word_alignment_ids(word_idxs, times, lengths))
+            return false;
+
+        words_to_strings(word_idxs, words);
+        return true;
+    }
+
+    void GmmOnlineDecoderWrapper::words_to_strings(const std::vector<int32> &word_ids, std::vector<string> &words) {
+
+        // lexicon lookup
+        const fst::SymbolTable *word_syms = model->get_word_syms();
+        words.clear();
+        for (size_t i = 0; i < word_ids.size(); i++) {
+            std::string s = word_syms->Find(word_ids[i]);
+            if (s == "") {
+                KALDI_ERR << "Word-id " << word_ids[i] << " not in symbol table.";
+            }
+            words.push_back(s);
+        }
+    }
+
+    bool GmmOnlineDecoderWrapper::get_word_alignment_ids(std::vector<int32> &word_ids,
+                                                         std::vector<int32> &times,
+                                                         std::vector<int32> &lengths) {
+
+        const WordAlignLatticeLexiconInfo &lexicon_info = *model->get_word_alignment_info();
 
 #if VERBOSE
         KALDI_LOG << "word alignment starts...";
 #endif
+        StatsTimer timer(stats_enabled);
+
         CompactLattice aligned_clat;
         WordAlignLatticeLexiconOpts opts;
 
@@ -170,23 +437,16 @@ namespace kaldi {
 
                 // nbest-to-ctm
 
-                std::vector<int32> word_idxs;
-                if (!CompactLatticeToWordAlignment(best_path_aligned, &word_idxs, &times, &lengths)) {
+                if (!CompactLatticeToWordAlignment(best_path_aligned, &word_ids, &times, &lengths)) {
                     KALDI_WARN << "CompactLatticeToWordAlignment failed.";
                     return false;
                 }
-
-                // lexicon lookup
-                words.clear();
-                for (size_t i = 0; i < word_idxs.size(); i++) {
-                    std::string s = model->word_syms->Find(word_idxs[i]);
-                    if (s == "") {
-                        KALDI_ERR << "Word-id " << word_idxs[i] << " not in symbol table.";
-                    }
-                    words.push_back(s);
-                }
             }
         }
+
+        if (stats_enabled)
+            add_stage_time(kStageAlign, timer.elapsed());
+
         return true;
     }
 
@@ -194,21 +454,46 @@ namespace kaldi {
 
     bool GmmOnlineDecoderWrapper::decode(BaseFloat samp_freq, int32 num_frames, BaseFloat *frames, bool finalize) {
 
+        // no copy: the feature pipeline reads straight from the caller's buffer
+        SubVector<BaseFloat> wave_part(frames, num_frames);
+
+        return decode_wave(samp_freq, wave_part, finalize);
+    }
+
+    bool GmmOnlineDecoderWrapper::decode_int16(BaseFloat samp_freq, int32 num_frames, int16 *frames, bool finalize) {
+
+        // convert in one pass into a buffer that only grows, so streaming
+        // small chunks does not allocate on every call
+        if (wave_buf.Dim() < num_frames) {
+            wave_buf.Resize(num_frames, kUndefined);
+        }
+        BaseFloat *buf = wave_buf.Data();
+        for (int32 i=0; i<num_frames; i++) {
+            buf[i] = frames[i];
+        }
+        SubVector<BaseFloat> wave_part(wave_buf, 0, num_frames);
+
+        return decode_wave(samp_freq, wave_part, finalize);
+    }
+
+    bool GmmOnlineDecoderWrapper::decode_wave(BaseFloat samp_freq, const VectorBase<BaseFloat> &wave_part, bool finalize) {
+
         using fst::VectorFst;
 
+        StatsTimer chunk_timer(stats_enabled);
+
         if (!decoder) {
             start_decoding();
         }
 
-        Vector<BaseFloat> wave_part(num_frames, kUndefined);
-        for (int i=0; i<num_frames; i++) {
-            wave_part(i) = frames[i];
-        }
-        tot_frames += num_frames;
+        endpointed  = false;
+        tot_frames += wave_part.Dim();
 
 #if VERBOSE
         KALDI_LOG << "AcceptWaveform...";
 #endif
+        StatsTimer timer(stats_enabled);
+
         decoder->FeaturePipeline().AcceptWaveform(samp_freq, wave_part);
 
         if (finalize) {
@@ -216,35 +501,307 @@ namespace kaldi {
             decoder->FeaturePipeline().InputFinished();
         }
 
-        decoder->AdvanceDecoding();
+        if (stats_enabled)
+            add_stage_time(kStageFeatures, timer.elapsed());
+
+        advance_decoding();
+
+        bool ok = true;
 
         if (finalize) {
-            decoder->FinalizeDecoding();
+            ok = finish_utterance();
+        } else if (model->endpoint_auto_finalize && check_endpoint()) {
+            endpointed = true;
+            ok = end_utterance();
+        }
 
-            CompactLattice clat;
-            bool end_of_utterance = true;
-            decoder->EstimateFmllr(end_of_utterance);
-            bool rescore_if_needed = true;
-            decoder->GetLattice(rescore_if_needed, end_of_utterance, &clat);
+        if (stats_enabled)
+            add_decode_time(1, wave_part.Dim() / samp_freq, chunk_timer.elapsed());
 
-            if (clat.NumStates() == 0) {
-              KALDI_WARN << "Empty lattice.";
-              return false;
-            }
+        return ok;
+    }
 
-            CompactLatticeShortestPath(clat, &best_path_clat);
-            
-            tot_frames_decoded = tot_frames;
-            tot_frames         = 0;
+    void GmmOnlineDecoderWrapper::advance_decoding(void) {
 
-            free_decoder();
+        StatsTimer timer(stats_enabled);
 
+        decoder->AdvanceDecoding();
+
+        double seconds = timer.elapsed();
+
+        // SingleUtteranceGmmDecoder does not expose NumFramesDecoded(), but
+        // AdvanceDecoding() decodes all frames ready, so that is where the
+        // search stands now
+        int32 num_frames   = decoder->FeaturePipeline().NumFramesReady();
+        int32 new_frames   = num_frames - num_frames_decoded;
+        num_frames_decoded = num_frames;
+
+        if (!stats_enabled)
+            return;
+
+        std::lock_guard<std::mutex> lock(stats_mutex);
+        stats.stages[kStageSearch].add(seconds);
+        stats.frames_decoded += new_frames;
+    }
+
+    bool GmmOnlineDecoderWrapper::end_utterance(void) {
+
+        // flush out frames still buffered in the feature pipeline
+        decoder->FeaturePipeline().InputFinished();
+        advance_decoding();
+
+        return finish_utterance();
+    }
+
+    bool GmmOnlineDecoderWrapper::finish_utterance(void) {
+
+        if (num_frames_decoded == 0) {
+            // nothing decoded (no or too little audio since the decoder was
+            // started): no lattice to get, just drop the utterance
+            discard_utterance();
+            return false;
         }
-        
+
+        StatsTimer timer(stats_enabled);
+
+        decoder->FinalizeDecoding();
+
+        if (stats_enabled)
+            add_stage_time(kStageFinalize, timer.elapsed());
+
+        StatsTimer det_timer(stats_enabled);
+
+        CompactLattice clat;
+        bool end_of_utterance = true;
+        decoder->EstimateFmllr(end_of_utterance);
+        bool rescore_if_needed = true;
+        decoder->GetLattice(rescore_if_needed, end_of_utterance, &clat);
+
+        if (stats_enabled) {
+            add_stage_time(kStageDeterminize, det_timer.elapsed());
+            std::lock_guard<std::mutex> lock(stats_mutex);
+            stats.utterances += 1.0;
+        }
+
+        // keep the fMLLR transform estimated above so the next utterance of
+        // this speaker is decoded adapted in a single pass
+        decoder->GetAdaptationState(adaptation_state);
+
+        tot_frames_decoded = tot_frames;
+        tot_frames         = 0;
+
+        free_decoder();
+
+        if (clat.NumStates() == 0) {
+          KALDI_WARN << "Empty lattice.";
+          best_path_clat.DeleteStates();
+          lattice_clat.DeleteStates();
+          return false;
+        }
+
+        CompactLatticeShortestPath(clat, &best_path_clat);
+        // keep the full lattice for get_nbest() / get_lattice()
+        lattice_clat = clat;
+
+        return true;
+    }
+
+    void GmmOnlineDecoderWrapper::discard_utterance(void) {
+
+        tot_frames_decoded = tot_frames;
+        tot_frames         = 0;
+
+        free_decoder();
+
+        best_path_clat.DeleteStates();
+        lattice_clat.DeleteStates();
+    }
+
+    bool GmmOnlineDecoderWrapper::endpoint_detected(void) {
+
+        if (!decoder) {
+            // utterance has been finalized already, by the last decode()
+            // call in case of auto-finalization
+            return endpointed;
+        }
+
+        return check_endpoint();
+    }
+
+    bool GmmOnlineDecoderWrapper::check_endpoint(void) {
+
+        const OnlineEndpointConfig &config = model->endpoint_config;
+
+        if (!config.silence_phones.empty())
+            return decoder->EndpointDetected(config);
+
+        // without silence phones kaldi's trailing silence computation asserts
+        // (aborting the process): count the whole utterance as speech, so
+        // only rules without a minimum trailing silence (rule5, the maximum
+        // utterance length, by default) can fire. The final relative cost
+        // is not accessible here, so rules limiting it never fire.
+
+        if (num_frames_decoded == 0)
+            return false;
+
+        return EndpointDetected(config, num_frames_decoded, 0, decoder->FeaturePipeline().FrameShiftInSeconds(),
+                                std::numeric_limits<BaseFloat>::infinity());
+    }
+
+    bool GmmOnlineDecoderWrapper::finalize_decoding(void) {
+
+        if (!decoder) {
+            return false;
+        }
+
+        StatsTimer timer(stats_enabled);
+
+        bool ok = end_utterance();
+
+        if (stats_enabled)
+            add_decode_time(0, 0.0, timer.elapsed());
+
+        return ok;
+    }
+
+    bool GmmOnlineDecoderWrapper::get_nbest(int32                             n,
+                                            std::vector<std::vector<int32> > &word_ids,
+                                            std::vector<double>              &likelihoods) {
+
+        word_ids.clear();
+        likelihoods.clear();
+
+        if (lattice_clat.NumStates() == 0)
+            return false;
+
+        lattice_nbest(lattice_clat, n, word_ids, likelihoods);
+        return true;
+    }
+
+    bool GmmOnlineDecoderWrapper::get_lattice(int32                  &start,
+                                              std::vector<int32>     &arcs,
+                                              std::vector<BaseFloat> &arc_weights,
+                                              std::vector<int32>     &arc_alignment_offsets,
+                                              std::vector<int32>     &arc_alignments,
+                                              std::vector<BaseFloat> &final_weights,
+                                              std::vector<int32>     &final_alignment_offsets,
+                                              std::vector<int32>     &final_alignments) {
+
+        if (lattice_clat.NumStates() == 0)
+            return false;
+
+        CompactLattice clat;
+        unscale_lattice(lattice_clat, model->decode_config.acoustic_scale, &clat);
+        compact_lattice_to_arrays(clat, start, arcs, arc_weights, arc_alignment_offsets, arc_alignments,
+                                  final_weights, final_alignment_offsets, final_alignments);
+        return true;
+    }
+
+    bool GmmOnlineDecoderWrapper::get_lattice_bytes(std::string &data) {
+
+        if (lattice_clat.NumStates() == 0)
+            return false;
+
+        CompactLattice clat;
+        unscale_lattice(lattice_clat, model->decode_config.acoustic_scale, &clat);
+        compact_lattice_to_bytes(clat, data);
+        return true;
+    }
+
+    bool GmmOnlineDecoderWrapper::get_word_confidences(std::vector<BaseFloat> &confidences) {
+
+        confidences.clear();
+
+        if (lattice_clat.NumStates() == 0 || best_path_clat.NumStates() == 0)
+            return false;
+
+        Lattice            best_path_lat;
+        std::vector<int32> alignment, words;
+        LatticeWeight      weight;
+        ConvertLattice(best_path_clat, &best_path_lat);
+        GetLinearSymbolSequence(best_path_lat, &alignment, &words, &weight);
+
+        if (words.empty())
+            return true;
+
+        // confidences for the words we already decoded instead of an MBR
+        // hypothesis of its own, so they line up with the best path
+
+        MinimumBayesRiskOptions mbr_opts;
+        mbr_opts.decode_mbr = false;
+
+        MinimumBayesRisk mbr(lattice_clat, words, mbr_opts);
+        confidences = mbr.GetOneBestConfidences();
+
+        return true;
+    }
+
+    bool GmmOnlineDecoderWrapper::get_word_alignment_confidences(std::vector<string>    &words,
+                                                                 std::vector<int32>     &times,
+                                                                 std::vector<int32>     &lengths,
+                                                                 std::vector<BaseFloat> &confidences) {
+
+        std::vector<int32>     word_ids;
+        std::vector<BaseFloat> word_confidences;
+
+        if (!get_word_alignment_ids(word_ids, times, lengths))
+            return false;
+
+        words_to_strings(word_ids, words);
+        get_word_confidences(word_confidences);
+
+        // alignment entries without a word of the best path (optional
+        // silence, word id 0) have no confidence of their own
+
+        confidences.assign(word_ids.size(), std::numeric_limits<BaseFloat>::quiet_NaN());
+        for (size_t i = 0, j = 0; i < word_ids.size() && j < word_confidences.size(); i++) {
+            if (word_ids[i] != 0)
+                confidences[i] = word_confidences[j++];
+        }
+
         return true;
     }
 
 
+    /*
+     * decoding graph I/O
+     */
+
+    void convert_fst_for_mapping(const std::string &fst_in_str, const std::string &fst_out_str) {
+
+        fst::Fst<fst::StdArc> *fst = fst::ReadFstKaldiGeneric(fst_in_str);
+        fst::ConstFst<fst::StdArc> const_fst(*fst);
+        delete fst;
+
+        // aligned so the arrays can be mapped straight from the page cache
+
+        std::ofstream strm(fst_out_str.c_str(), std::ios_base::out | std::ios_base::binary);
+        fst::FstWriteOptions wopts(fst_out_str);
+        wopts.align = true;
+
+        if (!strm || !const_fst.Write(strm, wopts) || !strm.flush())
+            KALDI_ERR << "Could not write decoding graph to " << fst_out_str;
+    }
+
+    static fst::Fst<fst::StdArc> *read_fst_mapped(const std::string &fst_in_str) {
+
+        std::ifstream strm(fst_in_str.c_str(), std::ios_base::in | std::ios_base::binary);
+        if (!strm)
+            KALDI_ERR << "Could not open decoding graph " << fst_in_str;
+
+        // MAP mode: the arrays of the ConstFst are memory-mapped read-only,
+        // processes mapping the same file share its pages
+
+        fst::FstReadOptions ropts(fst_in_str);
+        ropts.mode = fst::FstReadOptions::MAP;
+
+        fst::Fst<fst::StdArc> *fst = fst::ConstFst<fst::StdArc>::Read(strm, ropts);
+        if (!fst)
+            KALDI_ERR << "Could not read decoding graph " << fst_in_str << " (not a ConstFst?)";
+
+        return fst;
+    }
+
     /*
      * GmmOnlineModelWrapper
      */
@@ -263,7 +820,10 @@ namespace kaldi {
                                                  std::string &word_syms_filename, 
                                                  std::string &fst_in_str,
                                                  std::string &config,
-                                                 std::string &align_lex_filename)
+                                                 std::string &align_lex_filename,
+                                                 bool         mmap_fst,
+                                                 bool         endpoint_auto_finalize,
+                                                 bool         lazy_load)
 
     {
 
@@ -288,6 +848,8 @@ namespace kaldi {
         endpoint_config.Register(&po);
         po.ReadConfigFile(config);
 
+        this->endpoint_auto_finalize                    = endpoint_auto_finalize;
+
         decode_config.faster_decoder_opts.max_active    = max_active;
         decode_config.faster_decoder_opts.min_active    = min_active;
         decode_config.faster_decoder_opts.beam          = beam;
@@ -300,32 +862,115 @@ namespace kaldi {
         gmm_models = new OnlineGmmDecodingModels(decode_config);
 
         // Input FST is just one FST, not a table of FSTs.
-        decode_fst = fst::ReadFstKaldiGeneric(fst_in_str);
+        if (mmap_fst) {
+            decode_fst = read_fst_mapped(fst_in_str);
+        } else {
+            decode_fst = fst::ReadFstKaldiGeneric(fst_in_str);
+        }
+
+        this->word_syms_filename = word_syms_filename;
+        this->align_lex_filename = align_lex_filename;
+        word_syms                = NULL;
+        word_alignment           = align_lex_filename != "";
+        word_alignment_info      = NULL;
+
+        if (!lazy_load) {
+            if (word_syms_filename != "")
+                load_word_syms();
+            if (word_alignment)
+                load_word_alignment_lexicon();
+        }
+    }
 
-        word_syms = NULL;
-        if (word_syms_filename != "") 
-          if (!(word_syms = fst::SymbolTable::ReadText(word_syms_filename)))
+    void GmmOnlineModelWrapper::load_word_syms(void) {
+
+        if (word_syms_filename == "")
+            KALDI_ERR << "Model was loaded without word symbols.";
+#if VERBOSE
+        KALDI_LOG << "loading word symbol table...";
+#endif
+        if (!(word_syms = fst::SymbolTable::ReadText(word_syms_filename)))
             KALDI_ERR << "Could not read symbol table from file "
-                       << word_syms_filename;
+                      << word_syms_filename;
+    }
+
+    void GmmOnlineModelWrapper::load_word_alignment_lexicon(void) {
 
 #if VERBOSE
         KALDI_LOG << "loading word alignment lexicon...";
 #endif
-        {
-            bool binary_in;
-            Input ki(align_lex_filename, &binary_in);
-            KALDI_ASSERT(!binary_in && "Not expecting binary file for lexicon");
-            if (!ReadLexiconForWordAlign(ki.Stream(), &word_alignment_lexicon)) {
-                KALDI_ERR << "Error reading alignment lexicon from "
-                          << align_lex_filename;
-            }
+        bool binary_in;
+        Input ki(align_lex_filename, &binary_in);
+        KALDI_ASSERT(!binary_in && "Not expecting binary file for lexicon");
+        if (!ReadLexiconForWordAlign(ki.Stream(), &word_alignment_lexicon)) {
+            KALDI_ERR << "Error reading alignment lexicon from "
+                      << align_lex_filename;
+        }
+    }
+
+    const fst::SymbolTable *GmmOnlineModelWrapper::get_word_syms(void) {
+
+        std::lock_guard<std::mutex> lock(resource_mutex);
+
+        if (!word_syms)
+            load_word_syms();
+
+        return word_syms;
+    }
+
+    const WordAlignLatticeLexiconInfo *GmmOnlineModelWrapper::get_word_alignment_info(void) {
+
+        std::lock_guard<std::mutex> lock(resource_mutex);
+
+        if (!word_alignment_info) {
+            if (!word_alignment)
+                KALDI_ERR << "Model was loaded without word alignment support.";
+            if (word_alignment_lexicon.empty())
+                load_word_alignment_lexicon();
+#if VERBOSE
+            KALDI_LOG << "alloc: WordAlignLatticeLexiconInfo";
+#endif
+            word_alignment_info = new WordAlignLatticeLexiconInfo(word_alignment_lexicon);
+            // lexicon info keeps its own copy in a form suitable for lookups
+            std::vector<std::vector<int32> >().swap(word_alignment_lexicon);
         }
+
+        return word_alignment_info;
+    }
+
+    BaseFloat GmmOnlineModelWrapper::frame_shift(void) {
+
+        const std::string &feature_type = feature_config->feature_type;
+
+        if (feature_type == "plp")
+            return feature_config->plp_opts.frame_opts.frame_shift_ms / 1000.0;
+        if (feature_type == "fbank")
+            return feature_config->fbank_opts.frame_opts.frame_shift_ms / 1000.0;
+        return feature_config->mfcc_opts.frame_opts.frame_shift_ms / 1000.0;
+    }
+
+    void GmmOnlineModelWrapper::get_word_symbols(std::vector<std::string> &symbols) {
+
+        // dense id -> symbol list, ids missing from the table map to ""
+
+        const fst::SymbolTable *syms = get_word_syms();
+
+        int64 max_id = -1;
+        for (fst::SymbolTableIterator siter(*syms); !siter.Done(); siter.Next())
+            max_id = std::max(max_id, static_cast<int64>(siter.Value()));
+
+        symbols.assign(max_id + 1, "");
+        for (fst::SymbolTableIterator siter(*syms); !siter.Done(); siter.Next())
+            symbols[siter.Value()] = siter.Symbol();
     }
 
     GmmOnlineModelWrapper::~GmmOnlineModelWrapper() {
         delete feature_config;
         delete feature_pipeline_prototype;
         delete gmm_models;
+        delete decode_fst;
+        delete word_syms;
+        delete word_alignment_info;
     }
 
 }
@@ -32,8 +32,17 @@
 #include "lat/lattice-functions.h"
 #include "lat/word-align-lattice-lexicon.h"
 
+#include "decoder_stats.h"
+
+#include <mutex>
+
 
 namespace kaldi {
+
+    // convert a decoding graph to an aligned ConstFst file which can be
+    // memory-mapped by the model wrapper (mmap_fst)
+    void convert_fst_for_mapping(const std::string &fst_in_str, const std::string &fst_out_str);
+
     class GmmOnlineModelWrapper {
     friend class GmmOnlineDecoderWrapper;
     public:
@@ -45,12 +54,25 @@ namespace kaldi {
                               std::string &word_syms_filename, 
                               std::string &fst_in_str,
                               std::string &config,
-                              std::string &align_lex_filename
+                              std::string &align_lex_filename,
+                              bool         mmap_fst,
+                              bool         endpoint_auto_finalize,
+                              bool         lazy_load
                              );
         ~GmmOnlineModelWrapper();
 
+        // time between two frames in seconds
+        BaseFloat                                  frame_shift(void);
+        void                                       get_word_symbols(std::vector<std::string> &symbols);
+
     private:
 
+        // word symbol table: read at startup unless lazy_load is set (then on
+        // first use) or there is none (empty word_syms_filename)
+        const fst::SymbolTable                    *get_word_syms(void);
+        void                                       load_word_syms(void);
+
+        std::string                                word_syms_filename;
         fst::SymbolTable                          *word_syms;
 
         OnlineGmmDecodingConfig                     decode_config;
@@ -59,12 +81,24 @@ namespace kaldi {
         OnlineFeaturePipelineConfig                 *feature_config;
         OnlineFeaturePipeline                       *feature_pipeline_prototype;
         OnlineEndpointConfig                        endpoint_config;
+        bool                                        endpoint_auto_finalize;
 
         OnlineGmmDecodingModels                     *gmm_models;
         fst::Fst<fst::StdArc>                     *decode_fst;
 
-        // word alignment:
+        // word alignment: the lexicon is read at startup unless lazy_load is
+        // set or alignment is disabled (empty align_lex_filename), lexicon
+        // info is built on first use and shared by all decoders
+        const WordAlignLatticeLexiconInfo         *get_word_alignment_info(void);
+        void                                       load_word_alignment_lexicon(void);
+
+        std::string                                align_lex_filename;
+        bool                                       word_alignment;
         std::vector<std::vector<int32> >           word_alignment_lexicon;
+        WordAlignLatticeLexiconInfo               *word_alignment_info;
+
+        // guards lazy loading of the resources above
+        std::mutex                                 resource_mutex;
     };
 
     class GmmOnlineDecoderWrapper {
@@ -77,27 +111,135 @@ namespace kaldi {
                                   int32      num_frames, 
                                   BaseFloat *frames, 
                                   bool       finalize);
+        bool               decode_int16(BaseFloat  samp_freq, 
+                                        int32      num_frames, 
+                                        int16     *frames, 
+                                        bool       finalize);
 
         void               get_decoded_string(std::string &decoded_string, 
                                               double &likelihood);
+        void               get_decoded_word_ids(std::vector<int32> &word_ids, 
+                                                double             &likelihood);
         bool               get_word_alignment(std::vector<string> &words,
                                               std::vector<int32>  &times,
                                               std::vector<int32>  &lengths);
+        bool               get_word_alignment_ids(std::vector<int32> &word_ids,
+                                                  std::vector<int32> &times,
+                                                  std::vector<int32> &lengths);
+
+        void               reset(bool reset_adaptation_state);
+
+        // speaker adaptation (fMLLR transform and CMVN) state, updated each
+        // time an utterance is finished, as an opaque binary blob. A state
+        // set before the first chunk of an utterance applies to it, else it
+        // applies from the next utterance on.
+        void               get_adaptation_state(std::string &state);
+        void               set_adaptation_state(const std::string &state);
+
+        // endpointing: has the current utterance ended (trailing silence,
+        // maximum length)? finalize_decoding() then finishes it without
+        // further audio, the next decode() call starts a new one. With
+        // endpoint_auto_finalize set decode() does that by itself and
+        // endpoint_detected() reports whether the last call finalized.
+        bool               endpoint_detected(void);
+        bool               finalize_decoding(void);
+
+        // n best hypotheses of the last finished utterance (best first)
+        // and its full word lattice, with the acoustic scale removed like
+        // in lattices written by kaldi's decoders: as arrays (arcs as source
+        // state, destination state, word id triples; graph and acoustic cost
+        // pairs; transition id sequences concatenated, with offsets) or in
+        // kaldi's binary format. Return false if there is no lattice.
+        bool               get_nbest(int32                             n,
+                                     std::vector<std::vector<int32> > &word_ids,
+                                     std::vector<double>              &likelihoods);
+        bool               get_lattice(int32                  &start,
+                                       std::vector<int32>     &arcs,
+                                       std::vector<BaseFloat> &arc_weights,
+                                       std::vector<int32>     &arc_alignment_offsets,
+                                       std::vector<int32>     &arc_alignments,
+                                       std::vector<BaseFloat> &final_weights,
+                                       std::vector<int32>     &final_alignment_offsets,
+                                       std::vector<int32>     &final_alignments);
+        bool               get_lattice_bytes(std::string &data);
+
+        // lattice posterior (MBR) confidence of each word of the best path
+        // of the last finished utterance, false if there is none
+        bool               get_word_confidences(std::vector<BaseFloat> &confidences);
+        // word alignment plus the confidence of each of its entries, NaN for
+        // optional silence (word id 0) which is no word of the best path
+        bool               get_word_alignment_confidences(std::vector<string>    &words,
+                                                          std::vector<int32>     &times,
+                                                          std::vector<int32>     &lengths,
+                                                          std::vector<BaseFloat> &confidences);
+        void               word_ids_to_string(const std::vector<int32> &word_ids,
+                                              std::string              &decoded_string);
+
+        // instrumentation: per-stage timing and real time factor, see
+        // decoder_stats.h. There is no separate nnet stage (GMM likelihoods
+        // are part of the search) and no active token counts, kaldi's GMM
+        // decoder does not expose its search. Off by default, get_stats()
+        // may be called from any thread.
+        void               set_stats_enabled(bool enabled);
+        void               get_stats(DecoderStats &stats_out);
+        void               reset_stats(void);
+
+        // search beam settings of this decoder, initially the model's.
+        // kaldi's GMM decoder copies beam and active token limits when an
+        // utterance starts, so changes to them apply from the next
+        // utterance on, lattice_beam right away. reset_beam_options()
+        // restores the model's settings.
+        void               get_beam_options(BaseFloat &beam,
+                                            int32     &max_active,
+                                            int32     &min_active,
+                                            BaseFloat &lattice_beam);
+        void               set_beam_options(BaseFloat beam,
+                                            int32     max_active,
+                                            int32     min_active,
+                                            BaseFloat lattice_beam);
+        void               reset_beam_options(void);
 
     private:
 
+        bool decode_wave(BaseFloat                samp_freq, 
+                         const VectorBase<BaseFloat> &wave_part, 
+                         bool                     finalize);
+        void advance_decoding(void);
+        bool end_utterance(void);
+        bool finish_utterance(void);
+        void discard_utterance(void);
+        bool check_endpoint(void);
+
+        void words_to_strings(const std::vector<int32> &word_ids, std::vector<string> &words);
+
         void start_decoding(void);
         void free_decoder(void);
 
+        void add_stage_time(DecoderStage stage, double seconds);
+        void add_decode_time(int32 num_chunks, double audio_seconds, double seconds);
+
         GmmOnlineModelWrapper                   *model;
 
+        // referenced by the decoder for as long as it lives
+        OnlineGmmDecodingConfig                  decode_config;
+
         OnlineGmmAdaptationState                *adaptation_state;
         SingleUtteranceGmmDecoder               *decoder;
 
         int32                                      tot_frames, tot_frames_decoded;
+        int32                                      num_frames_decoded; // search position in the current utterance
+        bool                                       endpointed;
+
+        // reused for int16 -> float conversion of incoming samples
+        Vector<BaseFloat>                          wave_buf;
 
         // decoding result:
         CompactLattice                             best_path_clat;
+        CompactLattice                             lattice_clat;
+
+        bool                                       stats_enabled;
+        DecoderStats                               stats;
+        std::mutex                                 stats_mutex;
 
     };
 
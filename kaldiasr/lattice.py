@@ -0,0 +1,113 @@
+#
+# Copyright 2016, 2017, 2018 G. Bartsch
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# THIS CODE IS PROVIDED *AS IS* BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, EITHER EXPRESS OR IMPLIED, INCLUDING WITHOUT LIMITATION ANY IMPLIED
+# WARRANTIES OR CONDITIONS OF TITLE, FITNESS FOR A PARTICULAR PURPOSE,
+# MERCHANTABLITY OR NON-INFRINGEMENT.
+# See the Apache 2 License for the specific language governing permissions and
+# limitations under the License.
+#
+#
+# array backed word lattices as returned by the decoders' get_lattice()
+#
+
+import numpy as np
+
+
+class Lattice(object):
+
+    """
+    Word lattice (kaldi CompactLattice) stored in numpy arrays:
+
+        start                    start state
+        arcs                     (num_arcs, 3) int32: source state,
+                                 destination state, word id (0: epsilon)
+        arc_weights              (num_arcs, 2) float32: graph cost, acoustic
+                                 cost
+        arc_alignments           int32 transition ids of all arcs
+                                 concatenated, arc_alignment_offsets
+                                 (num_arcs + 1) marks where each arc's start
+        final_weights            (num_states, 2) float32, inf for states that
+                                 are not final
+        final_alignments         likewise for final weights, with
+                                 final_alignment_offsets (num_states + 1)
+
+    Arcs are sorted by source state. Costs are negated log probabilities with
+    the acoustic scale removed, as in lattices written by kaldi's decoders.
+    The decoders' get_lattice_bytes() returns the same lattice in kaldi's
+    binary format, see write_ark_entry().
+    """
+
+    def __init__(self, start, arcs, arc_weights, arc_alignment_offsets, arc_alignments,
+                 final_weights, final_alignment_offsets, final_alignments):
+
+        self.start                   = start
+        self.arcs                    = arcs.reshape(-1, 3)
+        self.arc_weights             = arc_weights.reshape(-1, 2)
+        self.arc_alignment_offsets   = arc_alignment_offsets
+        self.arc_alignments          = arc_alignments
+        self.final_weights           = final_weights.reshape(-1, 2)
+        self.final_alignment_offsets = final_alignment_offsets
+        self.final_alignments        = final_alignments
+
+        # first arc of each state, arcs of state s are
+        # state_offsets[s]:state_offsets[s+1]
+        self.state_offsets = np.searchsorted(self.arcs[:, 0], np.arange(self.num_states + 1)).astype(np.int32)
+
+    @property
+    def num_states(self):
+        return self.final_weights.shape[0]
+
+    @property
+    def num_arcs(self):
+        return self.arcs.shape[0]
+
+    def out_arcs(self, state):
+        """
+        Indices of the arcs leaving state, usable with arcs and arc_weights.
+        """
+        return np.arange(self.state_offsets[state], self.state_offsets[state + 1])
+
+    def final_states(self):
+        """
+        Array of all final states.
+        """
+        return np.nonzero(np.isfinite(self.final_weights[:, 0]))[0]
+
+    def arc_alignment(self, arc):
+        """
+        Transition ids of one arc.
+        """
+        return self.arc_alignments[self.arc_alignment_offsets[arc]:self.arc_alignment_offsets[arc + 1]]
+
+    def final_alignment(self, state):
+        """
+        Transition ids of the final weight of state.
+        """
+        return self.final_alignments[self.final_alignment_offsets[state]:self.final_alignment_offsets[state + 1]]
+
+    def __repr__(self):
+        return '<Lattice: %d states, %d arcs>' % (self.num_states, self.num_arcs)
+
+
+def write_ark_entry(f, key, data):
+    """
+    Write a lattice in kaldi binary format (get_lattice_bytes()) to the
+    binary file f as one entry of a kaldi archive, readable by kaldi tools as
+    ark:filename.
+    """
+
+    if not isinstance(key, bytes):
+        key = key.encode('utf8')
+    if not key or b' ' in key:
+        raise Exception('invalid archive key: %r' % key)
+
+    f.write(key + b' ')
+    f.write(data)
@@ -0,0 +1,182 @@
+#
+# Copyright 2016, 2017, 2018 G. Bartsch
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# THIS CODE IS PROVIDED *AS IS* BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, EITHER EXPRESS OR IMPLIED, INCLUDING WITHOUT LIMITATION ANY IMPLIED
+# WARRANTIES OR CONDITIONS OF TITLE, FITNESS FOR A PARTICULAR PURPOSE,
+# MERCHANTABLITY OR NON-INFRINGEMENT.
+# See the Apache 2 License for the specific language governing permissions and
+# limitations under the License.
+#
+#
+# decoder instrumentation statistics and prometheus text exposition
+#
+
+import numpy as np
+
+# stages timed by instrumented decoders, see enable_stats() of
+# KaldiNNet3OnlineDecoder and KaldiGmmOnlineDecoder
+DECODER_STAGES = ['features', 'nnet', 'search', 'finalize', 'determinize', 'align']
+
+DECODER_COUNTERS = ['chunks', 'utterances', 'frames_decoded', 'audio_seconds', 'decode_seconds']
+
+CONTENT_TYPE     = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def merge_histograms(histograms):
+
+    """
+    Sum histograms (dicts of 'bounds', 'counts', 'count' and 'sum' as
+    returned by get_stats()) which share the same bucket bounds.
+    """
+
+    histograms = list(histograms)
+
+    merged = {'bounds' : histograms[0]['bounds'],
+              'counts' : np.zeros(len(histograms[0]['counts']), dtype=np.int64),
+              'count'  : 0,
+              'sum'    : 0.0}
+
+    for h in histograms:
+        merged['counts'] += h['counts']
+        merged['count']  += h['count']
+        merged['sum']    += h['sum']
+
+    return merged
+
+
+def merge_decoder_stats(stats_list):
+
+    """
+    Sum the get_stats() dicts of several decoders, e.g. of all decoders of a
+    DecoderPool. Returns None for an empty list.
+    """
+
+    stats_list = list(stats_list)
+    if not stats_list:
+        return None
+
+    merged = {}
+    for counter in DECODER_COUNTERS:
+        merged[counter] = sum(s[counter] for s in stats_list)
+
+    merged['real_time_factor'] = merged['decode_seconds'] / merged['audio_seconds'] if merged['audio_seconds'] > 0.0 else 0.0
+
+    merged['stages'] = {}
+    for stage in DECODER_STAGES:
+        merged['stages'][stage] = merge_histograms(s['stages'][stage] for s in stats_list)
+
+    merged['active_tokens'] = merge_histograms(s['active_tokens'] for s in stats_list)
+
+    return merged
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (k, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+                             for k, v in sorted(labels.items()))
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+
+class MetricsWriter(object):
+
+    """
+    Collects metrics in the prometheus text exposition format. Every metric
+    takes a list of (labels, value) samples, labels being a dict or None.
+
+    Usage:
+
+        writer = MetricsWriter('kaldiasr')
+        writer.gauge('sessions', 'Open sessions.', [(None, 3)])
+        writer.decoder_stats(merge_decoder_stats(d.get_stats() for d in decoders))
+
+        body = writer.text().encode('utf8')   # served as metrics.CONTENT_TYPE
+    """
+
+    def __init__(self, prefix='kaldiasr'):
+        self.prefix = prefix
+        self._lines = []
+
+    def counter(self, name, help_text, samples):
+        self._family(name, 'counter', help_text)
+        for labels, value in samples:
+            self._sample(name, labels, value)
+
+    def gauge(self, name, help_text, samples):
+        self._family(name, 'gauge', help_text)
+        for labels, value in samples:
+            self._sample(name, labels, value)
+
+    def histogram(self, name, help_text, samples):
+
+        """
+        samples: list of (labels, histogram) with histograms as returned by
+        get_stats(), their per-bucket counts are made cumulative here.
+        """
+
+        self._family(name, 'histogram', help_text)
+
+        for labels, h in samples:
+            cumulative = np.cumsum(h['counts'])
+            for bound, count in zip(list(h['bounds']) + [float('inf')], cumulative):
+                bucket_labels = dict(labels or {})
+                bucket_labels['le'] = _format_value(bound)
+                self._sample(name + '_bucket', bucket_labels, count)
+            self._sample(name + '_sum', labels, h['sum'])
+            self._sample(name + '_count', labels, h['count'])
+
+    def decoder_stats(self, stats, labels=None):
+
+        """
+        Add the decoder metrics of stats, a dict as returned by get_stats()
+        or merge_decoder_stats().
+        """
+
+        self.counter('decoder_chunks_total', 'Audio chunks decoded.',
+                     [(labels, stats['chunks'])])
+        self.counter('decoder_utterances_total', 'Utterances finished.',
+                     [(labels, stats['utterances'])])
+        self.counter('decoder_frames_total', 'Frames decoded (after frame subsampling).',
+                     [(labels, stats['frames_decoded'])])
+        self.counter('decoder_audio_seconds_total', 'Seconds of audio decoded.',
+                     [(labels, stats['audio_seconds'])])
+        self.counter('decoder_decode_seconds_total', 'Seconds spent decoding, including finalization.',
+                     [(labels, stats['decode_seconds'])])
+        self.gauge('decoder_real_time_factor', 'Decoding time per second of audio since start.',
+                   [(labels, stats['real_time_factor'])])
+
+        stage_samples = []
+        for stage in DECODER_STAGES:
+            stage_labels = dict(labels or {})
+            stage_labels['stage'] = stage
+            stage_samples.append((stage_labels, stats['stages'][stage]))
+
+        self.histogram('decoder_stage_seconds', 'Time spent per decoder call and stage.', stage_samples)
+        self.histogram('decoder_active_tokens', 'Active search tokens at the end of each chunk.',
+                       [(labels, stats['active_tokens'])])
+
+    def text(self):
+        return '\n'.join(self._lines) + '\n'
+
+    def _family(self, name, metric_type, help_text):
+        name = self._name(name)
+        self._lines.append('# HELP %s %s' % (name, help_text.replace('\\', '\\\\').replace('\n', '\\n')))
+        self._lines.append('# TYPE %s %s' % (name, metric_type))
+
+    def _sample(self, name, labels, value):
+        self._lines.append('%s%s %s' % (self._name(name), _format_labels(labels), _format_value(value)))
+
+    def _name(self, name):
+        return '%s_%s' % (self.prefix, name) if self.prefix else name
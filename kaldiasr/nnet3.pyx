@@ -21,14 +21,24 @@
 import cython
 from libcpp.string cimport string
 from libcpp.vector cimport vector
+from libc.string cimport memcpy
 import numpy as np
 cimport numpy as cnp
-import struct
 import wave
 import os
 from tempfile import NamedTemporaryFile
 from cpython.version cimport PY_MAJOR_VERSION
 
+from kaldiasr.lattice import Lattice
+from kaldiasr.metrics import DECODER_STAGES
+from kaldiasr.speaker import SpeakerStateCache
+from kaldiasr.symbols import WordSymbolTable
+
+cnp.import_array()
+
+# decode_wav_file() / decode_pcm_file() feed files to the decoder in blocks of this many seconds
+DEFAULT_BLOCK_SECS = 10.0
+
 cdef unicode _text(s):
     if type(s) is unicode:
         # Fast path for most common case(s).
@@ -48,26 +58,227 @@ cdef unicode _text(s):
     else:
         raise TypeError("Could not convert to unicode.")
 
-cdef extern from "nnet3_wrappers.h" namespace "kaldi":
+cdef cnp.ndarray _int32_array(vector[int] &values):
+    # copy a C++ vector into a new numpy array in one go
+    cdef cnp.ndarray arr = np.empty(values.size(), dtype=np.int32)
+    if values.size() > 0:
+        memcpy(arr.data, &values[0], values.size() * sizeof(int))
+    return arr
+
+cdef cnp.ndarray _float32_array(vector[float] &values):
+    cdef cnp.ndarray arr = np.empty(values.size(), dtype=np.float32)
+    if values.size() > 0:
+        memcpy(arr.data, &values[0], values.size() * sizeof(float))
+    return arr
+
+cdef cnp.ndarray _as_samples(object samples):
+
+    """
+    Turn samples into a contiguous 1-d int16 or float32 numpy array, without
+    copying whenever the input already is one. Accepts numpy arrays and any
+    buffer protocol object (memoryview, array.array, ...) as well as plain
+    sequences of numbers. Raw bytes-like objects are taken to be little-endian
+    signed 16 bit PCM. Any other sample type is converted to float32 in a single
+    vectorized pass.
+    """
+
+    cdef cnp.ndarray arr
+
+    if isinstance(samples, cnp.ndarray):
+        arr = samples
+    elif isinstance(samples, (bytes, bytearray)):
+        arr = np.frombuffer(samples, dtype='<i2')
+    else:
+        arr = np.asarray(samples)
+        if arr.dtype.itemsize == 1:
+            arr = np.frombuffer(samples, dtype='<i2')
+
+    if arr.ndim != 1:
+        raise TypeError('samples must be 1-dimensional, got %d dimensions' % arr.ndim)
+
+    if arr.dtype == np.int16 or arr.dtype == np.float32:
+        return np.ascontiguousarray(arr)
+
+    return np.ascontiguousarray(arr, dtype=np.float32)
+
+ENDPOINT_RULE_OPTIONS = ['must_contain_nonsilence', 'min_trailing_silence', 'max_relative_cost', 'min_utterance_length']
+
+cdef list _endpoint_options(unicode silence_csl_filename, object endpoint_rules):
+
+    """
+    Kaldi config file lines (--endpoint.*) for endpoint detection: silence
+    phones read from silence_csl_filename if it exists plus overrides from
+    endpoint_rules, a dict like {'rule2.min_trailing_silence': 0.5} with keys
+    'rule1' ... 'rule5' followed by one of ENDPOINT_RULE_OPTIONS. Without
+    silence phones the decoders count the whole utterance as speech, so only
+    rules with min_trailing_silence 0 can fire, by default just rule5 (the
+    maximum utterance length of 20s).
+    """
+
+    cdef list options = []
+
+    if os.path.isfile(silence_csl_filename.encode('utf8')):
+        with open(silence_csl_filename.encode('utf8'), 'rb') as silence_csl_f:
+            options.append(u'--endpoint.silence-phones=%s' % silence_csl_f.read().decode('utf8').strip())
+
+    if endpoint_rules:
+        for key in sorted(endpoint_rules):
+            parts = key.split('.')
+            if len(parts) != 2 or parts[0] not in ['rule%d' % i for i in range(1, 6)] or parts[1] not in ENDPOINT_RULE_OPTIONS:
+                raise Exception ('unknown endpoint rule option: %s' % key)
+            value = endpoint_rules[key]
+            if isinstance(value, bool):
+                value = u'true' if value else u'false'
+            options.append(u'--endpoint.%s=%s' % (key.replace('_', '-'), value))
+
+    return options
+
+cdef extern from "decoder_stats.h" namespace "kaldi" nogil:
+
+    cdef cppclass StatsHistogram:
+        vector[double] bounds
+        vector[double] counts
+        double         count
+        double         sum
+
+    cdef cppclass DecoderStats:
+        DecoderStats() except +
+
+        double                 chunks
+        double                 utterances
+        double                 frames_decoded
+        double                 audio_seconds
+        double                 decode_seconds
+
+        vector[StatsHistogram] stages
+        StatsHistogram         active_tokens
+
+cdef dict _histogram(StatsHistogram &h):
+    return {'bounds' : np.array(h.bounds, dtype=np.float64),
+            'counts' : np.array(h.counts, dtype=np.int64),
+            'count'  : int(h.count),
+            'sum'    : h.sum}
+
+cdef dict _decoder_stats(DecoderStats &stats):
+
+    cdef dict res = {'chunks'           : int(stats.chunks),
+                     'utterances'       : int(stats.utterances),
+                     'frames_decoded'   : int(stats.frames_decoded),
+                     'audio_seconds'    : stats.audio_seconds,
+                     'decode_seconds'   : stats.decode_seconds,
+                     'real_time_factor' : stats.decode_seconds / stats.audio_seconds if stats.audio_seconds > 0.0 else 0.0,
+                     'stages'           : {},
+                     'active_tokens'    : _histogram(stats.active_tokens)}
+
+    for i, stage in enumerate(DECODER_STAGES):
+        res['stages'][stage] = _histogram(stats.stages[i])
+
+    return res
+
+cdef extern from "nnet3_wrappers.h" namespace "kaldi" nogil:
+
+    void convert_fst_for_mapping(string &, string &) except +
 
     cdef cppclass NNet3OnlineModelWrapper:
         NNet3OnlineModelWrapper() except +
-        NNet3OnlineModelWrapper(float, int, int, float, float, int, string, string, string, string, string, string) except +
+        NNet3OnlineModelWrapper(float, int, int, float, float, int, string, string, string, string, string, string, string, bint, bint, bint) except +
+        NNet3OnlineModelWrapper(float, int, int, float, float, int, string, string, bint, bint, bint, bint, bint) except +
+
+        void save_bundle(string &) except +
+
+        bint has_word_symbols()
+        bint has_word_alignment()
+
+        float frame_shift()
+        void get_word_symbols(vector[string] &) except +
+        void load_resources() except +
 
     cdef cppclass NNet3OnlineDecoderWrapper:
         NNet3OnlineDecoderWrapper() except +
         NNet3OnlineDecoderWrapper(NNet3OnlineModelWrapper *) except +
 
         bint decode(float, int, float *, bint) except +
+        bint decode_int16(float, int, short *, bint) except +
 
-        void get_decoded_string(string &, float &) except +
+        void get_decoded_string(string &, double &) except +
+        void get_decoded_word_ids(vector[int] &, double &) except +
         bint get_word_alignment(vector[string] &, vector[int] &, vector[int] &) except +
+        bint get_word_alignment_ids(vector[int] &, vector[int] &, vector[int] &) except +
+
+        void reset(bint) except +
+
+        void get_adaptation_state(string &) except +
+        void set_adaptation_state(string &) except +
+
+        bint endpoint_detected() except +
+        bint finalize_decoding() except +
+
+        void set_stats_enabled(bint)
+        void get_stats(DecoderStats &) except +
+        void reset_stats() except +
+
+        void get_beam_options(float &, int &, int &, float &)
+        void set_beam_options(float, int, int, float) except +
+        void reset_beam_options() except +
+
+        bint get_nbest(int, vector[vector[int]] &, vector[double] &) except +
+        bint get_lattice(int &, vector[int] &, vector[float] &, vector[int] &, vector[int] &, vector[float] &, vector[int] &, vector[int] &) except +
+        bint get_lattice_bytes(string &) except +
+        bint get_word_confidences(vector[float] &) except +
+        bint get_word_alignment_confidences(vector[string] &, vector[int] &, vector[int] &, vector[float] &) except +
+        void word_ids_to_string(vector[int] &, string &) except +
+
+        bint get_partial_hypothesis(int, vector[int] &, int &, double &) except +
+        void word_ids_to_strings(vector[int] &, vector[string] &) except +
+        bint get_partial_word_alignment(vector[int] &, vector[int] &, vector[int] &, int &) except +
+
+    cdef cppclass NNet3BatchDecoderWrapper:
+        NNet3BatchDecoderWrapper() except +
+        NNet3BatchDecoderWrapper(NNet3OnlineModelWrapper *, int, int) except +
+
+        int decode_batch(float, vector[int] &, vector[float *] &) except +
+
+        bint get_decoded_string(int, string &, double &) except +
+        bint get_word_alignment(int, vector[string] &, vector[int] &, vector[int] &) except +
+
+def _fst_map_filename(unicode fst_in_str, object fst_cache):
+
+    """
+    Make sure a memory-mappable (aligned ConstFst) copy of the decoding graph
+    exists, converting it on first use, and return its filename. The copy is
+    rebuilt whenever the original graph is newer.
+    """
+
+    cdef unicode fst_map_str
+
+    if fst_cache is None:
+        fst_map_str = os.path.splitext(fst_in_str)[0] + u'.mmap.fst'
+    else:
+        fst_map_str = _text(fst_cache)
+
+    if os.path.isfile(fst_map_str.encode('utf8')) and \
+       os.path.getmtime(fst_map_str.encode('utf8')) >= os.path.getmtime(fst_in_str.encode('utf8')):
+        return fst_map_str
+
+    # convert to a temp file first so concurrently starting processes never
+    # see (and map) a partially written graph
+
+    cdef unicode tmp_str = u'%s.%d.tmp' % (fst_map_str, os.getpid())
+    convert_fst_for_mapping(fst_in_str.encode('utf8'), tmp_str.encode('utf8'))
+    os.rename(tmp_str.encode('utf8'), fst_map_str.encode('utf8'))
+
+    return fst_map_str
 
 cdef class KaldiNNet3OnlineModel:
 
     cdef NNet3OnlineModelWrapper* model_wrapper
     cdef unicode                  modeldir, model
     cdef object                   ie_conf_f
+    cdef object                   word_symbol_table
+    cdef readonly int             frame_subsampling_factor
+    cdef readonly bint            endpoint_auto_finalize
+    cdef readonly bint            word_alignment
+    cdef readonly bint            word_symbols
 
     def __cinit__(self, object modeldir, 
                         object model                    = None,
@@ -82,9 +293,56 @@ cdef class KaldiNNet3OnlineModel:
                         float  min_post                 = 0.025,
                         float  posterior_scale          = 0.1,
                         int    max_count                = 0,
-                        int    online_ivector_period    = 10):
+                        int    online_ivector_period    = 10,
+
+                        bint   mmap_fst                 = False,
+                        object fst_cache                = None,
+
+                        object endpoint_rules           = None,
+                        bint   endpoint_auto_finalize   = False,
+
+                        bint   word_alignment           = True,
+                        bint   word_symbols             = True,
+                        bint   lazy_load                = False,
+
+                        object bundle                   = None):
+
+        self.frame_subsampling_factor = frame_subsampling_factor
+        self.endpoint_auto_finalize   = endpoint_auto_finalize
+
+        cdef unicode bundle_str
+
+        if bundle is not None:
+
+            #
+            # everything comes from the bundle, see save_bundle()
+            #
+
+            bundle_str = _text(bundle)
+            if not os.path.isfile(bundle_str.encode('utf8')):
+                raise Exception ('%s not found.' % bundle_str)
+
+            self.model_wrapper = new NNet3OnlineModelWrapper(beam, 
+                                                             max_active, 
+                                                             min_active, 
+                                                             lattice_beam, 
+                                                             acoustic_scale, 
+                                                             frame_subsampling_factor, 
+                                                             bundle_str.encode('utf8'),
+                                                             u'\n'.join(_endpoint_options(u'', endpoint_rules)).encode('utf8'),
+                                                             mmap_fst,
+                                                             endpoint_auto_finalize,
+                                                             word_symbols,
+                                                             word_alignment,
+                                                             lazy_load)
 
-        self.modeldir         = _text(modeldir)
+            self.word_alignment = self.model_wrapper.has_word_alignment()
+            self.word_symbols   = self.model_wrapper.has_word_symbols()
+            return
+
+        self.modeldir                 = _text(modeldir)
+        self.word_alignment           = word_alignment
+        self.word_symbols             = word_symbols
         if model is None:
             self.model        = _text('model')
         else:
@@ -96,17 +354,35 @@ cdef class KaldiNNet3OnlineModel:
         cdef unicode splice_conf_filename  = u'%s/ivectors_test_hires/conf/splice.conf'  % self.modeldir
         cdef unicode fst_in_str            = u'%s/%s/graph/HCLG.fst'                     % (self.modeldir, self.model)
         cdef unicode align_lex_filename    = u'%s/%s/graph/phones/align_lexicon.int'     % (self.modeldir, self.model)
+        cdef unicode silence_csl_filename  = u'%s/%s/graph/phones/silence.csl'           % (self.modeldir, self.model)
 
         #
         # make sure all model files required exist
         #
 
-        for conff in [mfcc_config, word_symbol_table, model_in_filename, splice_conf_filename, fst_in_str, align_lex_filename]:
+        required = [mfcc_config, model_in_filename, splice_conf_filename, fst_in_str]
+        if word_symbols:
+            required.append(word_symbol_table)
+        else:
+            word_symbol_table = u''
+        if word_alignment:
+            required.append(align_lex_filename)
+        else:
+            align_lex_filename = u''
+
+        for conff in required:
             if not os.path.isfile(conff.encode('utf8')): 
                 raise Exception ('%s not found.' % conff)
             if not os.access(conff.encode('utf8'), os.R_OK):
                 raise Exception ('%s is not readable' % conff) 
 
+        #
+        # memory-mapped decoding graph?
+        #
+
+        if mmap_fst:
+            fst_in_str = _fst_map_filename(fst_in_str, fst_cache)
+
         #
         # generate ivector_extractor.conf
         #
@@ -142,7 +418,89 @@ cdef class KaldiNNet3OnlineModel:
                                                          fst_in_str.encode('utf8'), 
                                                          mfcc_config.encode('utf8'),
                                                          self.ie_conf_f.name.encode('utf8'),
-                                                         align_lex_filename.encode('utf8'))
+                                                         align_lex_filename.encode('utf8'),
+                                                         u'\n'.join(_endpoint_options(silence_csl_filename, endpoint_rules)).encode('utf8'),
+                                                         mmap_fst,
+                                                         endpoint_auto_finalize,
+                                                         lazy_load)
+
+    @classmethod
+    def load_bundle(cls, object path, **kwargs):
+
+        """
+        Load a model from a bundle written by save_bundle(). Decoder options
+        (beam, acoustic_scale, endpoint rules, mmap_fst, word_symbols, ...)
+        are passed as usual, feature and ivector options are taken from the
+        bundle. With mmap_fst the decoding graph is mapped straight from the
+        bundle file.
+        """
+
+        return cls(None, bundle=path, **kwargs)
+
+    def save_bundle(self, object path):
+
+        """
+        Write acoustic model (already collapsed), feature and ivector
+        configuration and objects, decoding graph (aligned ConstFst), word
+        symbols and alignment lexicon to one versioned binary file which
+        load_bundle() reads without any text parsing or model preparation.
+        """
+
+        cdef unicode bundle_str = _text(path)
+        cdef unicode tmp_str    = u'%s.%d.tmp' % (bundle_str, os.getpid())
+        cdef string  c_tmp_str  = tmp_str.encode('utf8')
+
+        # write to a temp file first so concurrently starting processes never
+        # see a partially written bundle
+
+        try:
+            with nogil:
+                self.model_wrapper.save_bundle(c_tmp_str)
+        except:
+            if os.path.exists(tmp_str.encode('utf8')):
+                os.remove(tmp_str.encode('utf8'))
+            raise
+        os.rename(tmp_str.encode('utf8'), bundle_str.encode('utf8'))
+
+    @property
+    def frame_shift(self):
+        """
+        Time between two decoder output frames in seconds (feature frame
+        shift times frame_subsampling_factor), the unit of word alignment
+        times and lengths.
+        """
+        return self.model_wrapper.frame_shift()
+
+    def get_word_symbol_table(self):
+
+        """
+        The model's word symbol table as a WordSymbolTable for vectorized
+        lookups of the word ids returned by get_word_alignment_arrays(). Built
+        on first call and shared afterwards.
+        """
+
+        cdef vector[string] symbols
+
+        if not self.word_symbols:
+            raise Exception ('model was loaded with word_symbols=False')
+
+        if self.word_symbol_table is None:
+            with nogil:
+                self.model_wrapper.get_word_symbols(symbols)
+            self.word_symbol_table = WordSymbolTable(symbols)
+
+        return self.word_symbol_table
+
+    def load_resources(self):
+
+        """
+        Load the word symbol table and build the word alignment lexicon info
+        now instead of on first use (with lazy_load, or always for the lexicon
+        info), e.g. before forking worker processes which should share them.
+        """
+
+        with nogil:
+            self.model_wrapper.load_resources()
 
     def __dealloc__(self):
         if self.ie_conf_f:
@@ -152,11 +510,26 @@ cdef class KaldiNNet3OnlineModel:
 
 cdef class KaldiNNet3OnlineDecoder:
 
+    """
+    Online nnet3 decoder, holds the state of one audio stream.
+
+    decode(), get_decoded_string() and get_word_alignment() release the GIL
+    while kaldi is working, so decoders living in different threads run in
+    parallel. A single KaldiNNet3OnlineModel may be shared by any number of
+    decoders used concurrently, the model is read-only once loaded. A decoder
+    itself is not thread-safe: each instance must only be used by one thread
+    at a time.
+    """
+
     cdef NNet3OnlineDecoderWrapper* decoder_wrapper
+    cdef KaldiNNet3OnlineModel      model
     cdef object                     ie_conf_f
 
     def __cinit__(self, KaldiNNet3OnlineModel model):
 
+        # keep the model alive for as long as this decoder is using it
+        self.model = model
+
         #
         # instantiate our C++ wrapper class
         #
@@ -166,43 +539,616 @@ cdef class KaldiNNet3OnlineDecoder:
     def __dealloc__(self):
         del self.decoder_wrapper
 
-    def decode(self, samp_freq, cnp.ndarray[float, ndim=1, mode="c"] samples not None, finalize):
-        return self.decoder_wrapper.decode(samp_freq, samples.shape[0], <float *> samples.data, finalize)
+    def decode(self, samp_freq, object samples, finalize):
+
+        """
+        Feed a chunk of audio to the decoder, finish the utterance if finalize
+        is set. samples can be an int16 or float32 numpy array, any other
+        buffer protocol object or raw little-endian 16 bit PCM bytes, see
+        _as_samples(). int16 and float32 arrays are not copied.
+        """
+
+        cdef cnp.ndarray arr         = _as_samples(samples)
+        cdef float       c_samp_freq = samp_freq
+        cdef int         num_samples = arr.shape[0]
+        cdef bint        c_finalize  = finalize
+        cdef bint        ok
+
+        # arr stays referenced for the duration of this call, so handing
+        # its buffer to the C++ side without the GIL is safe
+
+        if arr.dtype == np.int16:
+            with nogil:
+                ok = self.decoder_wrapper.decode_int16(c_samp_freq, num_samples, <short *> arr.data, c_finalize)
+        else:
+            with nogil:
+                ok = self.decoder_wrapper.decode(c_samp_freq, num_samples, <float *> arr.data, c_finalize)
+        return ok
 
     def get_decoded_string(self):
         cdef string decoded_string
         cdef double likelihood=0.0
-        self.decoder_wrapper.get_decoded_string(decoded_string, likelihood)
+        if not self.model.word_symbols:
+            raise Exception ('model was loaded with word_symbols=False, use get_decoded_word_ids()')
+        with nogil:
+            self.decoder_wrapper.get_decoded_string(decoded_string, likelihood)
         return decoded_string.decode('utf8'), likelihood
 
-    def get_word_alignment(self):
+    def get_decoded_word_ids(self):
+        """
+        Like get_decoded_string() but returns the list of word ids instead of
+        a string, works without the word symbol table being loaded.
+        """
+        cdef vector[int] word_ids
+        cdef double likelihood=0.0
+        with nogil:
+            self.decoder_wrapper.get_decoded_word_ids(word_ids, likelihood)
+        return word_ids, likelihood
+
+    def get_word_alignment(self, confidences=False):
+        """
+        Words of the last finished utterance with start times and lengths in
+        frames, (words, times, lengths), None if alignment failed. Optional
+        silence is aligned as word id 0 (<eps>). With confidences set a
+        float32 numpy array with the confidence of each entry (see
+        get_word_confidences()) is returned as a fourth element, NaN for
+        optional silence.
+        """
         cdef vector[string] words
         cdef vector[int] times
         cdef vector[int] lengths
-        if not self.decoder_wrapper.get_word_alignment(words, times, lengths):
+        cdef vector[float] word_confidences
+        cdef bint ok
+        if not self.model.word_alignment:
+            raise Exception ('model was loaded with word_alignment=False')
+        if not self.model.word_symbols:
+            raise Exception ('model was loaded with word_symbols=False')
+        if confidences:
+            with nogil:
+                ok = self.decoder_wrapper.get_word_alignment_confidences(words, times, lengths, word_confidences)
+            if not ok:
+                return None
+            return words, times, lengths, _float32_array(word_confidences)
+        with nogil:
+            ok = self.decoder_wrapper.get_word_alignment(words, times, lengths)
+        if not ok:
             return None
         return words, times, lengths
 
+    def get_word_alignment_arrays(self, seconds=False):
+        """
+        Like get_word_alignment() but returns contiguous int32 numpy arrays
+        (word_ids, starts, lengths) with times in frames, or float32 arrays of
+        seconds for starts and lengths if seconds is set (see
+        KaldiNNet3OnlineModel.frame_shift). Works without word symbols, map
+        the ids with the model's get_word_symbol_table(). None if alignment
+        failed.
+        """
+        cdef vector[int] word_ids
+        cdef vector[int] times
+        cdef vector[int] lengths
+        cdef bint ok
+        if not self.model.word_alignment:
+            raise Exception ('model was loaded with word_alignment=False')
+        with nogil:
+            ok = self.decoder_wrapper.get_word_alignment_ids(word_ids, times, lengths)
+        if not ok:
+            return None
+        if seconds:
+            frame_shift = np.float32(self.model.frame_shift)
+            return (_int32_array(word_ids),
+                    _int32_array(times).astype(np.float32) * frame_shift,
+                    _int32_array(lengths).astype(np.float32) * frame_shift)
+        return _int32_array(word_ids), _int32_array(times), _int32_array(lengths)
+
+    def get_word_confidences(self):
+        """
+        Confidence of each word of the best path of the last finished
+        utterance: its posterior probability in the utterance's lattice (as
+        in kaldi's MBR decoding), computed natively. Returns a float32 numpy
+        array in the order of get_decoded_word_ids(), None if no utterance
+        has been finished. Unlike get_word_alignment() this has no entries
+        for optional silence, use get_word_alignment(confidences=True) for
+        confidences matching the alignment.
+        """
+        cdef vector[float] confidences
+        cdef bint ok
+        with nogil:
+            ok = self.decoder_wrapper.get_word_confidences(confidences)
+        if not ok:
+            return None
+        return _float32_array(confidences)
+
+    def get_partial_hypothesis(self, as_ids=False, float stable_secs=1.0):
+
+        """
+        Cheap partial result for frequent polling while decoding: only the
+        part of the best path that changed since the last call is traced
+        back. Returns None if the hypothesis did not change since the last
+        call, otherwise a (stable, unstable, likelihood) tuple. stable is
+        the list of leading words that have not changed for stable_secs
+        seconds of audio, unstable the words after them. Words are returned
+        as unicode strings or, if as_ids is set, as word ids. Once the
+        utterance is finalized, all of its words are stable.
+        """
+
+        cdef vector[int]    word_ids
+        cdef vector[string] words
+        cdef int            num_stable    = 0
+        cdef double         likelihood    = 0.0
+        cdef int            stable_frames = int(stable_secs / self.model.frame_shift)
+        cdef bint           c_as_ids      = as_ids
+        cdef bint           changed
+
+        if not as_ids and not self.model.word_symbols:
+            raise Exception ('model was loaded with word_symbols=False, use as_ids=True')
+
+        with nogil:
+            changed = self.decoder_wrapper.get_partial_hypothesis(stable_frames, word_ids, num_stable, likelihood)
+            if changed and not c_as_ids:
+                self.decoder_wrapper.word_ids_to_strings(word_ids, words)
+
+        if not changed:
+            return None
+
+        if as_ids:
+            res = word_ids
+        else:
+            res = [word.decode('utf8') for word in words]
+
+        return res[:num_stable], res[num_stable:], likelihood
+
+    def get_partial_word_alignment(self, as_ids=False):
+
+        """
+        Word alignment of the current partial best path while decoding, for
+        live captioning. Returns (words, times, lengths, num_aligned) with
+        times and lengths in frames like get_word_alignment(): the first
+        num_aligned words are aligned by the lexicon, the words after them
+        are not complete yet and get provisional times. Words aligned by an
+        earlier call are reused as long as their part of the best path did
+        not change, so polling after every chunk only aligns the last few
+        words. Once the utterance is finalized this is the alignment of its
+        best path. None if alignment failed.
+        """
+
+        cdef vector[int]    word_ids
+        cdef vector[int]    times
+        cdef vector[int]    lengths
+        cdef vector[string] words
+        cdef int            num_aligned = 0
+        cdef bint           c_as_ids    = as_ids
+        cdef bint           ok
+
+        if not self.model.word_alignment:
+            raise Exception ('model was loaded with word_alignment=False')
+        if not as_ids and not self.model.word_symbols:
+            raise Exception ('model was loaded with word_symbols=False, use as_ids=True')
+
+        with nogil:
+            ok = self.decoder_wrapper.get_partial_word_alignment(word_ids, times, lengths, num_aligned)
+            if ok and not c_as_ids:
+                self.decoder_wrapper.word_ids_to_strings(word_ids, words)
+
+        if not ok:
+            return None
+
+        if as_ids:
+            res = word_ids
+        else:
+            res = [word.decode('utf8') for word in words]
+
+        return res, times, lengths, num_aligned
+
+    def get_nbest(self, int n, as_ids=False):
+        """
+        Up to n best hypotheses of the last finished utterance, best first,
+        as a list of (string, likelihood) tuples like get_decoded_string()
+        returns, or (word ids, likelihood) with as_ids set. Empty if no
+        utterance has been finished.
+        """
+        cdef vector[vector[int]] word_ids
+        cdef vector[double]      likelihoods
+        cdef string              decoded_string
+        if not as_ids and not self.model.word_symbols:
+            raise Exception ('model was loaded with word_symbols=False, use as_ids=True')
+        with nogil:
+            self.decoder_wrapper.get_nbest(n, word_ids, likelihoods)
+        res = []
+        for i in range(word_ids.size()):
+            if as_ids:
+                res.append((word_ids[i], likelihoods[i]))
+            else:
+                self.decoder_wrapper.word_ids_to_string(word_ids[i], decoded_string)
+                res.append((decoded_string.decode('utf8'), likelihoods[i]))
+        return res
+
+    def get_lattice(self):
+        """
+        Word lattice of the last finished utterance as a
+        kaldiasr.lattice.Lattice (numpy arrays of arcs, weights and
+        transition ids), None if no utterance has been finished.
+        """
+        cdef int           start = -1
+        cdef vector[int]   arcs, arc_alignment_offsets, arc_alignments
+        cdef vector[int]   final_alignment_offsets, final_alignments
+        cdef vector[float] arc_weights, final_weights
+        cdef bint          ok
+        with nogil:
+            ok = self.decoder_wrapper.get_lattice(start, arcs, arc_weights, arc_alignment_offsets, arc_alignments,
+                                                  final_weights, final_alignment_offsets, final_alignments)
+        if not ok:
+            return None
+        return Lattice(start,
+                       _int32_array(arcs), _float32_array(arc_weights),
+                       _int32_array(arc_alignment_offsets), _int32_array(arc_alignments),
+                       _float32_array(final_weights),
+                       _int32_array(final_alignment_offsets), _int32_array(final_alignments))
+
+    def get_lattice_bytes(self):
+        """
+        Word lattice of the last finished utterance in kaldi's binary
+        CompactLattice format (bytes), None if no utterance has been
+        finished. See kaldiasr.lattice.write_ark_entry().
+        """
+        cdef string data
+        cdef bint   ok
+        with nogil:
+            ok = self.decoder_wrapper.get_lattice_bytes(data)
+        if not ok:
+            return None
+        return data
+
+    def reset(self, reset_speaker=False):
+        """
+        Discard the utterance in progress (if any) and the last result, then
+        prepare the decoder for a new utterance. If reset_speaker is set, the
+        iVector adaptation state is cleared as well, which is what you want
+        when the next utterance comes from a different speaker.
+        """
+        cdef bint c_reset_speaker = reset_speaker
+        with nogil:
+            self.decoder_wrapper.reset(c_reset_speaker)
+
+    def get_adaptation_state(self):
+        """
+        Speaker adaptation (iVector and online CMVN) state as a binary blob
+        (bytes). It is updated each time an utterance is finished, so after
+        finalizing an utterance the state reflects all audio of this speaker
+        so far. See set_adaptation_state() and kaldiasr.speaker.
+        """
+        cdef string state
+        with nogil:
+            self.decoder_wrapper.get_adaptation_state(state)
+        return state
+
+    def set_adaptation_state(self, object state):
+        """
+        Resume adaptation from a blob returned by get_adaptation_state(),
+        possibly of another decoder or process using the same model. If the
+        current utterance has not seen any audio yet it starts from this
+        state, otherwise the state applies from the next utterance on.
+        """
+        cdef string c_state = bytes(state)
+        with nogil:
+            self.decoder_wrapper.set_adaptation_state(c_state)
+
+    def endpoint_detected(self):
+        """
+        True if kaldi's endpointing rules consider the current utterance
+        finished (enough trailing silence or maximum length reached). If the
+        model was created with endpoint_auto_finalize, decode() finalizes
+        such an utterance right away and this tells whether the last decode()
+        call did, its result is then available via get_decoded_string().
+        """
+        cdef bint res
+        with nogil:
+            res = self.decoder_wrapper.endpoint_detected()
+        return res
+
+    def finalize_decoding(self):
+        """
+        Finish the current utterance without further audio, e.g. after an
+        endpoint has been detected. Returns False if there was nothing to
+        decode. The result is available through get_decoded_string() and
+        get_word_alignment(), the next decode() call starts a new utterance.
+        """
+        cdef bint ok
+        with nogil:
+            ok = self.decoder_wrapper.finalize_decoding()
+        return ok
+
+    def enable_stats(self, enabled=True):
+        """
+        Turn instrumentation on or off (the default): the time spent in each
+        stage of decoding, the number of active search tokens and the real
+        time factor are accumulated in get_stats(). When off, this costs
+        nothing but a flag check per stage.
+        """
+        cdef bint c_enabled = enabled
+        self.decoder_wrapper.set_stats_enabled(c_enabled)
+
+    def get_stats(self):
+        """
+        Cumulative instrumentation statistics as a dict: counters (chunks,
+        utterances, frames_decoded, audio_seconds, decode_seconds), the
+        resulting real_time_factor and histograms, dicts of bucket upper
+        'bounds', per bucket 'counts' (plus one bucket for values above the
+        last bound), total 'count' and 'sum'. 'stages' holds one histogram
+        of seconds per call for each of
+        kaldiasr.metrics.DECODER_STAGES: features (feature extraction),
+        nnet (forward pass incl. iVector extraction), search (beam search),
+        finalize, determinize (lattice determinization) and align (word
+        alignment). 'active_tokens' counts the search tokens left on the
+        last frame of each chunk. May be called from any thread, see
+        kaldiasr.metrics to merge and export statistics.
+        """
+        cdef DecoderStats stats
+        with nogil:
+            self.decoder_wrapper.get_stats(stats)
+        return _decoder_stats(stats)
+
+    def reset_stats(self):
+        """
+        Clear the statistics returned by get_stats().
+        """
+        with nogil:
+            self.decoder_wrapper.reset_stats()
+
+    def get_beam(self):
+        """
+        Search beam settings of this decoder as a (beam, max_active,
+        min_active, lattice_beam) tuple, initially those of the model.
+        """
+        cdef float beam         = 0.0
+        cdef int   max_active   = 0
+        cdef int   min_active   = 0
+        cdef float lattice_beam = 0.0
+        self.decoder_wrapper.get_beam_options(beam, max_active, min_active, lattice_beam)
+        return beam, max_active, min_active, lattice_beam
+
+    def set_beam(self, beam=None, max_active=None, min_active=None, lattice_beam=None):
+        """
+        Change the search beam settings of this decoder, options left at None
+        keep their current value. Narrower beams and fewer active tokens
+        decode faster at some loss of accuracy. Changes apply from the next
+        decode() call on, also in the middle of an utterance, so the beam can
+        follow the load (see kaldiasr.beam.AdaptiveBeamController).
+        reset_beam() restores the model's settings.
+        """
+        cur_beam, cur_max_active, cur_min_active, cur_lattice_beam = self.get_beam()
+        cdef float c_beam         = cur_beam         if beam         is None else beam
+        cdef int   c_max_active   = cur_max_active   if max_active   is None else max_active
+        cdef int   c_min_active   = cur_min_active   if min_active   is None else min_active
+        cdef float c_lattice_beam = cur_lattice_beam if lattice_beam is None else lattice_beam
+        self.decoder_wrapper.set_beam_options(c_beam, c_max_active, c_min_active, c_lattice_beam)
+
+    def reset_beam(self):
+        """
+        Restore the search beam settings of the model, see set_beam().
+        """
+        self.decoder_wrapper.reset_beam_options()
+
+    def stream(self, object chunks, samp_freq, endpointing=True, partial_results=True):
+
+        """
+        Generator decoding an audio stream of arbitrary length. chunks can be
+        any iterable of sample chunks decode() accepts, e.g. numpy arrays or
+        raw 16 bit PCM read from a file or socket:
+
+            for hstr, likelihood, final in decoder.stream(iter(lambda: sock.recv(4096), b''), 16000):
+                ...
+
+        Yields (hstr, likelihood, final) tuples: a partial result after each
+        chunk (unless partial_results is False) and a final one at the end of
+        each utterance. Models loaded with word_symbols=False yield lists of
+        word ids instead of hstr. With endpointing the decoder finalizes the
+        utterance whenever an endpoint is detected and starts a new one with
+        the next chunk, so lattice memory is bounded by utterance length, not
+        stream length. The last utterance is finalized when chunks is
+        exhausted.
+        """
+
+        get_result = self.get_decoded_string if self.model.word_symbols else self.get_decoded_word_ids
+
+        pending = b''
+
+        for chunk in chunks:
+
+            # raw PCM may be split anywhere, e.g. by socket reads: carry
+            # an odd trailing byte over to the next chunk
+
+            if isinstance(chunk, (bytes, bytearray)):
+                if pending:
+                    chunk   = pending + chunk
+                    pending = b''
+                if len(chunk) & 1:
+                    pending = chunk[-1:]
+                    chunk   = chunk[:-1]
+
+            ok = self.decode(samp_freq, chunk, False)
+
+            if (endpointing or self.model.endpoint_auto_finalize) and self.endpoint_detected():
+                if not self.model.endpoint_auto_finalize:
+                    ok = self.finalize_decoding()
+                if ok:
+                    hstr, likelihood = get_result()
+                    yield hstr, likelihood, True
+
+            elif partial_results:
+                hstr, likelihood = get_result()
+                yield hstr, likelihood, False
+
+        if self.finalize_decoding():
+            hstr, likelihood = get_result()
+            yield hstr, likelihood, True
+
     #
     # various convenience functions below
     #
 
-    def decode_wav_file(self, object wavfile):
+    def decode_wav_file(self, object wavfile, float block_secs=DEFAULT_BLOCK_SECS):
+
+        """
+        Decode a mono 16 bit WAV file (file name or file object). The file is
+        streamed into the decoder in blocks of block_secs seconds, so memory
+        use stays flat regardless of its length.
+        """
 
         wavf = wave.open(wavfile, 'rb')
 
-        # check format
-        assert wavf.getnchannels()==1
-        assert wavf.getsampwidth()==2
-        assert wavf.getnframes()>0
+        try:
+            # check format
+            assert wavf.getnchannels()==1
+            assert wavf.getsampwidth()==2
+            assert wavf.getnframes()>0
+
+            samp_freq = wavf.getframerate()
+            remaining = wavf.getnframes()
+            block_len = max(1, int(block_secs * samp_freq))
+
+            while remaining > 0:
+
+                num_frames = min(block_len, remaining)
+                frames     = wavf.readframes(num_frames)
+                remaining -= num_frames
+
+                if len(frames) < 2 * num_frames:
+                    # truncated file, header promised more frames
+                    frames    = frames[:len(frames) & ~1]
+                    remaining = 0
+
+                if not self.decode(samp_freq, frames, remaining == 0):
+                    return False
+
+        finally:
+            wavf.close()
+
+        return True
+
+    def decode_pcm_file(self, object pcmfile, samp_freq, float block_secs=DEFAULT_BLOCK_SECS):
+
+        """
+        Decode a headerless file of mono, little-endian signed 16 bit samples
+        recorded at samp_freq. Like decode_wav_file() the file is streamed in
+        blocks of block_secs seconds, read into a single reused buffer.
+        """
+
+        cdef int block_len = max(1, int(block_secs * samp_freq))
+
+        buf = bytearray(2 * block_len)
+        mv  = memoryview(buf)
+
+        with open(pcmfile, 'rb') as pcmf:
+
+            remaining = os.fstat(pcmf.fileno()).st_size // 2
+            if remaining == 0:
+                return False
+
+            while remaining > 0:
+
+                num_frames = min(block_len, remaining)
+                num_bytes  = pcmf.readinto(mv[:2 * num_frames])
+                remaining -= num_frames
+
+                if num_bytes < 2 * num_frames:
+                    # file shrunk while we were reading it
+                    num_bytes = num_bytes & ~1
+                    remaining = 0
+
+                if not self.decode(samp_freq, mv[:num_bytes], remaining == 0):
+                    return False
+
+        return True
+
+
+cdef class KaldiNNet3BatchDecoder:
+
+    """
+    Offline decoder for many utterances at once. Neural network chunks of
+    all utterances in flight are stacked into larger minibatches, beam search
+    runs separately per utterance on num_threads threads.
+
+    The model may be shared with online decoders running concurrently.
+    """
+
+    cdef NNet3BatchDecoderWrapper* decoder_wrapper
+    cdef KaldiNNet3OnlineModel     model
+
+    def __cinit__(self, KaldiNNet3OnlineModel model,
+                        int num_threads    = 1,
+                        int minibatch_size = 128):
+
+        # keep the model alive for as long as this decoder is using it
+        self.model = model
+
+        #
+        # instantiate our C++ wrapper class
+        #
+
+        self.decoder_wrapper = new NNet3BatchDecoderWrapper(model.model_wrapper, num_threads, minibatch_size)
+
+    def __dealloc__(self):
+        del self.decoder_wrapper
+
+    def decode_batch(self, samp_freq, object utterances, word_alignment=None):
+        """
+        Decode a list of utterances, each one a 1-d array of samples.
+
+        Returns a list with one entry per utterance, None if decoding that
+        utterance failed, (hstr, likelihood, alignment) otherwise where
+        alignment is the (words, times, lengths) tuple get_word_alignment()
+        returns for online decoders (None if word_alignment is not set or
+        alignment failed). word_alignment defaults to whether the model was
+        loaded with word alignment support.
+        """
+
+        cdef float                                 c_samp_freq = samp_freq
+        cdef vector[int]                           num_frames
+        cdef vector[float *]                       frames
+        cdef cnp.ndarray[float, ndim=1, mode="c"]  samples
+        cdef string                                decoded_string
+        cdef double                                likelihood = 0.0
+        cdef vector[string]                        words
+        cdef vector[int]                           times
+        cdef vector[int]                           lengths
+        cdef int                                   utt
+        cdef bint                                  ok
+
+        if not self.model.word_symbols:
+            raise Exception ('model was loaded with word_symbols=False')
+
+        if word_alignment is None:
+            word_alignment = self.model.word_alignment
+        elif word_alignment and not self.model.word_alignment:
+            raise Exception ('model was loaded with word_alignment=False')
+
+        # keep references to the converted arrays while kaldi reads them
+        arrays = [np.ascontiguousarray(u, dtype=np.float32) for u in utterances]
+
+        for samples in arrays:
+            num_frames.push_back(samples.shape[0])
+            frames.push_back(<float *> samples.data)
+
+        with nogil:
+            self.decoder_wrapper.decode_batch(c_samp_freq, num_frames, frames)
 
-        # read the whole file into memory, for now
-        num_frames = wavf.getnframes()
-        frames = wavf.readframes(num_frames)
+        results = []
+        for utt in range(len(arrays)):
 
-        samples = struct.unpack_from('<%dh' % num_frames, frames)
+            with nogil:
+                ok = self.decoder_wrapper.get_decoded_string(utt, decoded_string, likelihood)
+            if not ok:
+                results.append(None)
+                continue
 
-        wavf.close()
+            alignment = None
+            if word_alignment:
+                with nogil:
+                    ok = self.decoder_wrapper.get_word_alignment(utt, words, times, lengths)
+                if ok:
+                    alignment = (words, times, lengths)
 
-        return self.decode(wavf.getframerate(), np.array(samples, dtype=np.float32), True)
+            results.append((decoded_string.decode('utf8'), likelihood, alignment))
 
+        return results
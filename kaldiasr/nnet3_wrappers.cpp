@@ -24,69 +24,198 @@
 
 #include "nnet3_wrappers.h"
 
+#include <algorithm>
+#include <fstream>
+#include <limits>
+#include <sstream>
+
 #include "lat/lattice-functions.h"
 #include "lat/word-align-lattice-lexicon.h"
+#include "lat/sausages.h"
 #include "nnet3/nnet-utils.h"
 
 #define VERBOSE 0
 
 namespace kaldi {
 
+    /*
+     * lattice export helpers
+     */
+
+    // copy of a decoder lattice with the acoustic scale removed, the way
+    // kaldi's decoders write their lattices
+
+    // label of a word cut off at the end of a partial best path
+    static const int32 kPartialWordLabel = std::numeric_limits<int32>::max();
+
+    static void unscale_lattice(const CompactLattice &clat, BaseFloat acoustic_scale, CompactLattice *out) {
+        *out = clat;
+        if (acoustic_scale != 0.0)
+            fst::ScaleLattice(fst::AcousticLatticeScale(1.0 / acoustic_scale), out);
+    }
+
+    static void compact_lattice_to_arrays(const CompactLattice   &clat,
+                                          int32                  &start,
+                                          std::vector<int32>     &arcs,
+                                          std::vector<BaseFloat> &arc_weights,
+                                          std::vector<int32>     &arc_alignment_offsets,
+                                          std::vector<int32>     &arc_alignments,
+                                          std::vector<BaseFloat> &final_weights,
+                                          std::vector<int32>     &final_alignment_offsets,
+                                          std::vector<int32>     &final_alignments) {
+
+        typedef CompactLattice::StateId StateId;
+
+        start = clat.Start();
+
+        arcs.clear();
+        arc_weights.clear();
+        arc_alignment_offsets.assign(1, 0);
+        arc_alignments.clear();
+        final_weights.clear();
+        final_alignment_offsets.assign(1, 0);
+        final_alignments.clear();
+
+        for (StateId s = 0; s < clat.NumStates(); s++) {
+
+            CompactLatticeWeight final_weight = clat.Final(s);
+            if (final_weight == CompactLatticeWeight::Zero()) {
+                final_weights.push_back(std::numeric_limits<BaseFloat>::infinity());
+                final_weights.push_back(std::numeric_limits<BaseFloat>::infinity());
+            } else {
+                final_weights.push_back(final_weight.Weight().Value1());
+                final_weights.push_back(final_weight.Weight().Value2());
+                final_alignments.insert(final_alignments.end(),
+                                        final_weight.String().begin(), final_weight.String().end());
+            }
+            final_alignment_offsets.push_back(final_alignments.size());
+
+            for (fst::ArcIterator<CompactLattice> aiter(clat, s); !aiter.Done(); aiter.Next()) {
+                const CompactLatticeArc &arc = aiter.Value();
+                arcs.push_back(s);
+                arcs.push_back(arc.nextstate);
+                arcs.push_back(arc.ilabel);
+                arc_weights.push_back(arc.weight.Weight().Value1());
+                arc_weights.push_back(arc.weight.Weight().Value2());
+                arc_alignments.insert(arc_alignments.end(),
+                                      arc.weight.String().begin(), arc.weight.String().end());
+                arc_alignment_offsets.push_back(arc_alignments.size());
+            }
+        }
+    }
+
+    static void compact_lattice_to_bytes(const CompactLattice &clat, std::string &data) {
+
+        // binary kaldi object, as found after the key in a lattice archive
+        std::ostringstream os;
+        InitKaldiOutputStream(os, true);
+        if (!WriteCompactLattice(os, true, clat))
+            KALDI_ERR << "Could not write lattice";
+        data = os.str();
+    }
+
+    static void lattice_nbest(const CompactLattice             &clat,
+                              int32                             n,
+                              std::vector<std::vector<int32> > &word_ids,
+                              std::vector<double>              &likelihoods) {
+
+        Lattice lat, nbest_lat;
+        ConvertLattice(clat, &lat);
+        fst::ShortestPath(lat, &nbest_lat, n);
+
+        std::vector<Lattice> nbest_lats;
+        fst::ConvertNbestToVector(nbest_lat, &nbest_lats);
+
+        // likelihood per frame like get_decoded_string(), best first
+
+        std::vector<std::pair<double, size_t> > order;
+        std::vector<std::vector<int32> >        words(nbest_lats.size());
+
+        for (size_t i = 0; i < nbest_lats.size(); i++) {
+            std::vector<int32> alignment;
+            LatticeWeight      weight;
+            GetLinearSymbolSequence(nbest_lats[i], &alignment, &words[i], &weight);
+            double likelihood = alignment.size() > 0 ? -(weight.Value1() + weight.Value2()) / alignment.size() : 0.0;
+            order.push_back(std::make_pair(-likelihood, i));
+        }
+        std::sort(order.begin(), order.end());
+
+        word_ids.resize(order.size());
+        likelihoods.resize(order.size());
+        for (size_t i = 0; i < order.size(); i++) {
+            word_ids[i].swap(words[order[i].second]);
+            likelihoods[i] = -order[i].first;
+        }
+    }
+
     /*
      * NNet3OnlineDecoderWrapper
      */
 
+    // forwards to the nnet3 decodable, measuring the time spent in the
+    // first likelihood request of each frame: that is the one which makes
+    // the decodable compute the nnet output of a new chunk of frames
+
+    class TimedDecodable : public DecodableInterface {
+    public:
+
+        TimedDecodable(DecodableInterface *decodable) : decodable(decodable), last_frame(-1), seconds(0.0) { }
+
+        virtual BaseFloat LogLikelihood(int32 frame, int32 index) {
+            if (frame == last_frame)
+                return decodable->LogLikelihood(frame, index);
+            last_frame = frame;
+            StatsTimer timer;
+            BaseFloat loglike = decodable->LogLikelihood(frame, index);
+            seconds += timer.elapsed();
+            return loglike;
+        }
+
+        virtual bool IsLastFrame(int32 frame) const { return decodable->IsLastFrame(frame); }
+        virtual int32 NumFramesReady() const { return decodable->NumFramesReady(); }
+        virtual int32 NumIndices() const { return decodable->NumIndices(); }
+
+        DecodableInterface *decodable;
+        int32               last_frame;
+        double              seconds;
+    };
+
     NNet3OnlineDecoderWrapper::NNet3OnlineDecoderWrapper(NNet3OnlineModelWrapper *aModel) : model(aModel) {
         decoder            = NULL;
+        decodable          = NULL;
         silence_weighting  = NULL;
         feature_pipeline   = NULL;
         adaptation_state   = NULL;
-        decodable_info     = NULL;
 
         tot_frames         = 0;
         tot_frames_decoded = 0;
+        endpointed         = false;
+        stats_enabled      = false;
+        decoder_config     = model->lattice_faster_decoder_config;
+
+        clear_partial();
 
 #if VERBOSE
         KALDI_LOG << "alloc: OnlineIvectorExtractorAdaptationState";
 #endif
         adaptation_state  = new OnlineIvectorExtractorAdaptationState (model->feature_info->ivector_extractor_info);
-
-#if VERBOSE
-        KALDI_LOG << "alloc: OnlineSilenceWeighting";
-#endif
-        silence_weighting = new OnlineSilenceWeighting (model->trans_model, 
-                                                        model->feature_info->silence_weighting_config,
-                                                        model->decodable_opts.frame_subsampling_factor);
-        
-#if VERBOSE
-        KALDI_LOG << "alloc: nnet3::DecodableNnetSimpleLoopedInfo";
-#endif
-        decodable_info = new nnet3::DecodableNnetSimpleLoopedInfo(model->decodable_opts, &model->am_nnet);
     }
 
     NNet3OnlineDecoderWrapper::~NNet3OnlineDecoderWrapper() {
         free_decoder();
-        if (silence_weighting) {
-            delete silence_weighting ;
-            silence_weighting = NULL;
-        }
         if (adaptation_state) {
             delete adaptation_state ;
             adaptation_state = NULL;
         }
-        if (decodable_info) {
-            delete decodable_info;
-            decodable_info = NULL;
-        }
     }
 
     void NNet3OnlineDecoderWrapper::start_decoding(void) {
 #if VERBOSE
         KALDI_LOG << "start_decoding..." ;
-        KALDI_LOG << "max_active  :" << model->lattice_faster_decoder_config.max_active;
-        KALDI_LOG << "min_active  :" << model->lattice_faster_decoder_config.min_active;
-        KALDI_LOG << "beam        :" << model->lattice_faster_decoder_config.beam;
-        KALDI_LOG << "lattice_beam:" << model->lattice_faster_decoder_config.lattice_beam;
+        KALDI_LOG << "max_active  :" << decoder_config.max_active;
+        KALDI_LOG << "min_active  :" << decoder_config.min_active;
+        KALDI_LOG << "beam        :" << decoder_config.beam;
+        KALDI_LOG << "lattice_beam:" << decoder_config.lattice_beam;
 #endif
         free_decoder();
 #if VERBOSE
@@ -95,13 +224,20 @@ namespace kaldi {
         feature_pipeline  = new OnlineNnet2FeaturePipeline (*model->feature_info);
         feature_pipeline->SetAdaptationState(*adaptation_state);
 #if VERBOSE
-        KALDI_LOG << "alloc: SingleUtteranceNnet3Decoder";
+        KALDI_LOG << "alloc: OnlineSilenceWeighting";
+#endif
+        silence_weighting = new OnlineSilenceWeighting (model->trans_model, 
+                                                        model->feature_info->silence_weighting_config,
+                                                        model->decodable_opts.frame_subsampling_factor);
+#if VERBOSE
+        KALDI_LOG << "alloc: DecodableAmNnetLoopedOnline, LatticeFasterOnlineDecoder";
 #endif
-        decoder           = new SingleUtteranceNnet3Decoder (model->lattice_faster_decoder_config,
-                                                             model->trans_model,
-                                                             *decodable_info,
-                                                             *model->decode_fst,
-                                                             feature_pipeline);
+        decodable         = new nnet3::DecodableAmNnetLoopedOnline (model->trans_model,
+                                                                    *model->decodable_info,
+                                                                    feature_pipeline->InputFeature(),
+                                                                    feature_pipeline->IvectorFeature());
+        decoder           = new InstrumentedLatticeDecoder (*model->decode_fst, decoder_config);
+        decoder->InitDecoding();
 #if VERBOSE
         KALDI_LOG << "start_decoding...done" ;
 #endif
@@ -115,125 +251,463 @@ namespace kaldi {
             delete decoder ;
             decoder = NULL;
         }
+        if (decodable) {
+            delete decodable ;
+            decodable = NULL;
+        }
+        if (silence_weighting) {
+            delete silence_weighting ;
+            silence_weighting = NULL;
+        }
         if (feature_pipeline) {
             delete feature_pipeline ; 
             feature_pipeline = NULL;
         }
+        // token pointers are only valid as long as the decoder is
+        clear_partial();
+    }
+
+    void NNet3OnlineDecoderWrapper::reset(bool reset_adaptation_state) {
+
+        // drop any utterance in progress as well as the last result
+
+        free_decoder();
+        best_path_clat.DeleteStates();
+        lattice_clat.DeleteStates();
+
+        tot_frames         = 0;
+        tot_frames_decoded = 0;
+        endpointed         = false;
+
+        if (reset_adaptation_state) {
+#if VERBOSE
+            KALDI_LOG << "reset: OnlineIvectorExtractorAdaptationState";
+#endif
+            delete adaptation_state;
+            adaptation_state = new OnlineIvectorExtractorAdaptationState (model->feature_info->ivector_extractor_info);
+        }
+
+        // allocate decoder and feature pipeline right away so the first
+        // chunk of the next utterance does not have to pay for it
+
+        start_decoding();
     }
 
     void NNet3OnlineDecoderWrapper::get_decoded_string(std::string &decoded_string, double &likelihood) {
 
-        //std::string                                decoded_string;
-        //double                                     likelihood;
+        std::vector<int32> word_ids;
 
-        Lattice best_path_lat;
+        get_decoded_word_ids(word_ids, likelihood);
+        model->words_to_string(word_ids, decoded_string);
+    }
 
-        decoded_string = "";
+    void NNet3OnlineDecoderWrapper::get_decoded_word_ids(std::vector<int32> &word_ids, double &likelihood) {
 
         if (decoder) {
 
-            // decoding is not finished yet, so we will look up the best partial result so far
+            // decoding is not finished yet, so we will look up the best partial result so far,
+            // tracing back only the part of the best path that changed since the last call
+
+            update_partial();
+            word_ids   = partial_words;
+            likelihood = partial_likelihood;
 
-            if (decoder->NumFramesDecoded() == 0) {
-                likelihood = 0.0;
-                return;
+        } else {
+
+            word_ids.clear();
+            likelihood = 0.0;
+
+            if (best_path_clat.NumStates() > 0) {
+                Lattice            best_path_lat;
+                std::vector<int32> alignment;
+                LatticeWeight      weight;
+                ConvertLattice(best_path_clat, &best_path_lat);
+                GetLinearSymbolSequence(best_path_lat, &alignment, &word_ids, &weight);
+                if (alignment.size() > 0)
+                    likelihood = -(weight.Value1() + weight.Value2()) / alignment.size();
             }
+        }
+    }
 
-            decoder->GetBestPath(false, &best_path_lat);
+    void NNet3OnlineDecoderWrapper::clear_partial(void) {
+        partial_frames.clear();
+        partial_words.clear();
+        partial_word_frames.clear();
+        partial_initial_cost      = 0.0;
+        partial_likelihood        = 0.0;
+        partial_num_stable_frames = 0;
+        partial_reported          = false;
+
+        partial_align_words.clear();
+        partial_align_times.clear();
+        partial_align_lengths.clear();
+        partial_align_valid_frames.clear();
+        partial_align_num_labels  = 0;
+    }
 
-        } else {
-            ConvertLattice(best_path_clat, &best_path_lat);
+    void NNet3OnlineDecoderWrapper::update_partial(void) {
+
+        const LatticeFasterOnlineDecoder &lat_decoder = *decoder;
+
+        int32 num_frames = lat_decoder.NumFramesDecoded();
+
+        if (num_frames == 0) {
+            clear_partial();
+            return;
         }
-            
+
+        PartialFrame empty_frame;
+        empty_frame.tok        = NULL;
+        empty_frame.tid        = 0;
+        empty_frame.cost       = 0.0;
+        empty_frame.tot_cost   = 0.0;
+        empty_frame.changed_at = num_frames;
+        partial_frames.resize(num_frames, empty_frame);
+
+        // trace back from the best token of the last frame until we reach a
+        // token we have been through before. note: iter.frame is one less
+        // than the frame the arcs just traced back belong to.
+
+        LatticeFasterOnlineDecoder::BestPathIterator iter = lat_decoder.BestPathEnd(false, NULL);
+
+        int32 frame = num_frames - 1;
         std::vector<int32> words;
-        std::vector<int32> alignment;
-        LatticeWeight      weight;
-        int32              num_frames;
-        GetLinearSymbolSequence(best_path_lat, &alignment, &words, &weight);
-        num_frames = alignment.size();
-        likelihood = -(weight.Value1() + weight.Value2()) / num_frames;
-                   
-        for (size_t i = 0; i < words.size(); i++) {
-            std::string s = model->word_syms->Find(words[i]);
-            if (s == "")
-                KALDI_ERR << "Word-id " << words[i] << " not in symbol table.";
-            decoded_string += s + ' ';
+
+        while (frame >= 0) {
+
+            PartialFrame &pf = partial_frames[frame];
+
+            LatticeArc arc;
+            double     cost = 0.0;
+            words.clear();
+
+            arc.ilabel = 0;
+            while (arc.ilabel == 0) { // skip over input epsilons
+                iter = lat_decoder.TraceBackBestPath(iter, &arc);
+                if (arc.olabel != 0)
+                    words.push_back(arc.olabel);
+                cost += arc.weight.Value1() + arc.weight.Value2();
+            }
+            std::reverse(words.begin(), words.end());
+
+            bool joined = (pf.tok == iter.tok);
+
+            if (!joined || pf.words != words) {
+                pf.words.swap(words);
+                pf.changed_at = num_frames;
+            }
+            pf.tok  = iter.tok;
+            pf.tid  = arc.ilabel;
+            pf.cost = cost;
+
+            if (joined)
+                break;
+            frame--;
+        }
+
+        int32 first_changed = frame;
+
+        if (frame < 0) {
+
+            // traced back all the way: collect words on epsilon arcs
+            // leaving the start state, before the first frame
+
+            first_changed        = 0;
+            partial_initial_cost = 0.0;
+            partial_words.clear();
+            partial_word_frames.clear();
+
+            words.clear();
+            while (!iter.Done()) {
+                LatticeArc arc;
+                iter = lat_decoder.TraceBackBestPath(iter, &arc);
+                if (arc.olabel != 0)
+                    words.push_back(arc.olabel);
+                partial_initial_cost += arc.weight.Value1() + arc.weight.Value2();
+            }
+            for (int32 i = words.size() - 1; i >= 0; i--) {
+                partial_words.push_back(words[i]);
+                partial_word_frames.push_back(-1);
+            }
+        }
+
+        // drop aligned words depending on frames that changed
+
+        while (!partial_align_valid_frames.empty() && partial_align_valid_frames.back() > first_changed) {
+            if (partial_align_words.back() != 0)
+                partial_align_num_labels--;
+            partial_align_words.pop_back();
+            partial_align_times.pop_back();
+            partial_align_lengths.pop_back();
+            partial_align_valid_frames.pop_back();
+        }
+
+        // replace words and path costs of frames that changed
+
+        while (!partial_word_frames.empty() && partial_word_frames.back() >= first_changed) {
+            partial_words.pop_back();
+            partial_word_frames.pop_back();
+        }
+
+        double tot_cost = first_changed > 0 ? partial_frames[first_changed - 1].tot_cost : partial_initial_cost;
+
+        for (int32 f = first_changed; f < num_frames; f++) {
+            PartialFrame &pf = partial_frames[f];
+            for (size_t i = 0; i < pf.words.size(); i++) {
+                partial_words.push_back(pf.words[i]);
+                partial_word_frames.push_back(f);
+            }
+            tot_cost    += pf.cost;
+            pf.tot_cost  = tot_cost;
+        }
+
+        partial_likelihood = -tot_cost / num_frames;
+
+        // changes only ever affect a suffix of the frames, so changed_at does
+        // not decrease with the frame index and the stable frames are a prefix
+
+        if (first_changed < partial_num_stable_frames) {
+            int32 f = first_changed;
+            while (f < num_frames && partial_frames[f].changed_at != num_frames)
+                f++;
+            partial_num_stable_frames = std::min(partial_num_stable_frames, f);
         }
     }
 
-    bool NNet3OnlineDecoderWrapper::get_word_alignment(std::vector<string> &words,
-                                                std::vector<int32>  &times,
-                                                std::vector<int32>  &lengths) {
+    bool NNet3OnlineDecoderWrapper::get_partial_hypothesis(int32               stable_frames,
+                                                           std::vector<int32> &word_ids,
+                                                           int32              &num_stable,
+                                                           double             &likelihood) {
 
-        WordAlignLatticeLexiconInfo lexicon_info(model->word_alignment_lexicon);
+        if (decoder) {
 
-#if VERBOSE
-        KALDI_LOG << "word alignment starts...";
-#endif
-        CompactLattice aligned_clat;
-        WordAlignLatticeLexiconOpts opts;
+            update_partial();
 
-        bool ok = WordAlignLatticeLexicon(best_path_clat, model->trans_model, lexicon_info, opts, &aligned_clat);
+            int32 num_frames = partial_frames.size();
+            while (partial_num_stable_frames < num_frames &&
+                   partial_frames[partial_num_stable_frames].changed_at + stable_frames <= num_frames)
+                partial_num_stable_frames++;
+
+            word_ids   = partial_words;
+            num_stable = std::lower_bound(partial_word_frames.begin(), partial_word_frames.end(),
+                                          partial_num_stable_frames) - partial_word_frames.begin();
+            likelihood = partial_likelihood;
 
-        if (!ok) {
-            KALDI_WARN << "Lattice did not align correctly";
-            return false;
         } else {
-            if (aligned_clat.Start() == fst::kNoStateId) {
-                KALDI_WARN << "Lattice was empty";
+
+            // utterance finished, its best path is final as a whole
+
+            get_decoded_word_ids(word_ids, likelihood);
+            num_stable = word_ids.size();
+        }
+
+        if (partial_reported && word_ids == reported_words && num_stable == reported_num_stable)
+            return false;
+
+        partial_reported    = true;
+        reported_words      = word_ids;
+        reported_num_stable = num_stable;
+
+        return true;
+    }
+
+    bool NNet3OnlineDecoderWrapper::get_partial_word_alignment(std::vector<int32> &word_ids,
+                                                               std::vector<int32> &times,
+                                                               std::vector<int32> &lengths,
+                                                               int32              &num_aligned) {
+
+        if (!decoder) {
+
+            // utterance finished, align its best path as a whole
+
+            if (!get_word_alignment_ids(word_ids, times, lengths))
                 return false;
-            } else {
-#if VERBOSE
-                KALDI_LOG << "Aligned lattice.";
-#endif
-                TopSortCompactLatticeIfNeeded(&aligned_clat);
+            num_aligned = word_ids.size();
+            return true;
+        }
 
-                // lattice-1best
+        StatsTimer timer(stats_enabled);
 
-                CompactLattice best_path_aligned;
-                CompactLatticeShortestPath(aligned_clat, &best_path_aligned); 
+        update_partial();
 
-                // nbest-to-ctm
+        int32 num_frames  = partial_frames.size();
+        int32 start_frame = partial_align_times.empty() ? 0 : partial_align_times.back() + partial_align_lengths.back();
+        int32 first_label = partial_align_num_labels;
+        int32 num_labels  = partial_words.size();
 
-                std::vector<int32> word_idxs;
-                if (!CompactLatticeToWordAlignment(best_path_aligned, &word_idxs, &times, &lengths)) {
-                    KALDI_WARN << "CompactLatticeToWordAlignment failed.";
-                    return false;
-                }
+        // linear lattice of the rest of the best path: one arc per word
+        // label carrying the transition ids up to the next label, labels
+        // output before start_frame go first
 
-                // lexicon lookup
-                words.clear();
-                for (size_t i = 0; i < word_idxs.size(); i++) {
-                    std::string s = model->word_syms->Find(word_idxs[i]);
-                    if (s == "") {
-                        KALDI_ERR << "Word-id " << word_idxs[i] << " not in symbol table.";
-                    }
-                    words.push_back(s);
+        CompactLattice clat;
+        CompactLattice::StateId state = clat.AddState();
+        clat.SetStart(state);
+
+        std::vector<int32> tids;
+        int32              olabel = 0;
+        int32              label  = first_label;
+
+        for (int32 f = start_frame; f < num_frames; f++) {
+            while (label < num_labels && partial_word_frames[label] <= f) {
+                if (olabel != 0 || !tids.empty()) {
+                    CompactLattice::StateId next = clat.AddState();
+                    clat.AddArc(state, CompactLatticeArc(olabel, olabel, CompactLatticeWeight(LatticeWeight::One(), tids), next));
+                    state = next;
                 }
+                olabel = partial_words[label++];
+                tids.clear();
+            }
+            tids.push_back(partial_frames[f].tid);
+        }
+        if (olabel != 0 || !tids.empty()) {
+            CompactLattice::StateId next = clat.AddState();
+            clat.AddArc(state, CompactLatticeArc(olabel, olabel, CompactLatticeWeight(LatticeWeight::One(), tids), next));
+            state = next;
+        }
+        clat.SetFinal(state, CompactLatticeWeight::One());
+
+        std::vector<int32> new_words, new_times, new_lengths;
+        bool ok = num_frames > start_frame && model->align_best_path_ids(clat, new_words, new_times, new_lengths, true);
+
+        // the partial word at the end and anything after it is not aligned
+
+        int32 num_new = 0, new_labels = 0;
+        if (ok) {
+            while (num_new < (int32) new_words.size() && new_words[num_new] != kPartialWordLabel) {
+                if (new_words[num_new] != 0)
+                    new_labels++;
+                num_new++;
             }
+            if (first_label + new_labels > num_labels)
+                num_new = new_labels = 0; // should not happen: more words than on the best path
+        }
+
+        // words ending before the last frame are complete, remember them
+
+        int32 valid_frames = partial_align_valid_frames.empty() ? 0 : partial_align_valid_frames.back();
+        label = first_label;
+        int32 num_cached = 0;
+        for (; num_cached < num_new; num_cached++) {
+            int32 end = start_frame + new_times[num_cached] + new_lengths[num_cached];
+            if (end >= num_frames)
+                break;
+            valid_frames = std::max(valid_frames, end);
+            if (new_words[num_cached] != 0)
+                valid_frames = std::max(valid_frames, partial_word_frames[label++] + 1);
+
+            partial_align_words.push_back(new_words[num_cached]);
+            partial_align_times.push_back(start_frame + new_times[num_cached]);
+            partial_align_lengths.push_back(new_lengths[num_cached]);
+            partial_align_valid_frames.push_back(valid_frames);
+        }
+        partial_align_num_labels = label;
+
+        word_ids = partial_align_words;
+        times    = partial_align_times;
+        lengths  = partial_align_lengths;
+
+        for (int32 i = num_cached; i < num_new; i++) {
+            word_ids.push_back(new_words[i]);
+            times.push_back(start_frame + new_times[i]);
+            lengths.push_back(new_lengths[i]);
         }
+        num_aligned = word_ids.size();
+
+        // provisional times for the remaining words: from where the aligned
+        // words end (or the word was output, if later) to the next word
+
+        int32 start = times.empty() ? 0 : times.back() + lengths.back();
+        for (label = first_label + new_labels; label < num_labels; label++) {
+            start = std::min(std::max(start, partial_word_frames[label]), num_frames);
+            if (label > first_label + new_labels && lengths.size() > 0)
+                lengths.back() = start - times.back();
+            word_ids.push_back(partial_words[label]);
+            times.push_back(start);
+            lengths.push_back(num_frames - start);
+        }
+
+        if (stats_enabled)
+            add_stage_time(kStageAlign, timer.elapsed());
+
         return true;
     }
 
+    void NNet3OnlineDecoderWrapper::word_ids_to_strings(const std::vector<int32> &word_ids,
+                                                        std::vector<string>      &words) {
+        model->words_to_strings(word_ids, words);
+    }
+
+    void NNet3OnlineDecoderWrapper::word_ids_to_string(const std::vector<int32> &word_ids,
+                                                       std::string              &decoded_string) {
+        model->words_to_string(word_ids, decoded_string);
+    }
+
+    bool NNet3OnlineDecoderWrapper::get_word_alignment(std::vector<string> &words,
+                                                std::vector<int32>  &times,
+                                                std::vector<int32>  &lengths) {
+
+        StatsTimer timer(stats_enabled);
+        bool ok = model->align_best_path(best_path_clat, words, times, lengths);
+        if (stats_enabled)
+            add_stage_time(kStageAlign, timer.elapsed());
+        return ok;
+    }
+
+    bool NNet3OnlineDecoderWrapper::get_word_alignment_ids(std::vector<int32> &word_ids,
+                                                           std::vector<int32> &times,
+                                                           std::vector<int32> &lengths) {
+
+        StatsTimer timer(stats_enabled);
+        bool ok = model->align_best_path_ids(best_path_clat, word_ids, times, lengths);
+        if (stats_enabled)
+            add_stage_time(kStageAlign, timer.elapsed());
+        return ok;
+    }
+
 
 
     bool NNet3OnlineDecoderWrapper::decode(BaseFloat samp_freq, int32 num_frames, BaseFloat *frames, bool finalize) {
 
+        // no copy: the feature pipeline reads straight from the caller's buffer
+        SubVector<BaseFloat> wave_part(frames, num_frames);
+
+        return decode_wave(samp_freq, wave_part, finalize);
+    }
+
+    bool NNet3OnlineDecoderWrapper::decode_int16(BaseFloat samp_freq, int32 num_frames, int16 *frames, bool finalize) {
+
+        // convert in one pass into a buffer that only grows, so streaming
+        // small chunks does not allocate on every call
+        if (wave_buf.Dim() < num_frames) {
+            wave_buf.Resize(num_frames, kUndefined);
+        }
+        BaseFloat *buf = wave_buf.Data();
+        for (int32 i=0; i<num_frames; i++) {
+            buf[i] = frames[i];
+        }
+        SubVector<BaseFloat> wave_part(wave_buf, 0, num_frames);
+
+        return decode_wave(samp_freq, wave_part, finalize);
+    }
+
+    bool NNet3OnlineDecoderWrapper::decode_wave(BaseFloat samp_freq, const VectorBase<BaseFloat> &wave_part, bool finalize) {
+
         using fst::VectorFst;
 
+        StatsTimer chunk_timer(stats_enabled);
+
         if (!decoder) {
             start_decoding();
         }
 
-        Vector<BaseFloat> wave_part(num_frames, kUndefined);
-        for (int i=0; i<num_frames; i++) {
-            wave_part(i) = frames[i];
-        }
-        tot_frames += num_frames;
+        endpointed  = false;
+        tot_frames += wave_part.Dim();
 
 #if VERBOSE
         KALDI_LOG << "AcceptWaveform...";
 #endif
+        StatsTimer timer(stats_enabled);
+
         feature_pipeline->AcceptWaveform(samp_freq, wave_part);
 
         if (finalize) {
@@ -241,70 +715,704 @@ namespace kaldi {
             feature_pipeline->InputFinished();
         }
 
+        if (stats_enabled)
+            add_stage_time(kStageFeatures, timer.elapsed());
+
         if (silence_weighting->Active() && feature_pipeline->IvectorFeature() != NULL) {
-            silence_weighting->ComputeCurrentTraceback(decoder->Decoder());
+            silence_weighting->ComputeCurrentTraceback(*decoder);
             silence_weighting->GetDeltaWeights(feature_pipeline->NumFramesReady(),
                                                &delta_weights);
             feature_pipeline->IvectorFeature()->UpdateFrameWeights(delta_weights);
         }
 
-        decoder->AdvanceDecoding();
+        advance_decoding();
 
-        if (finalize) {
-            decoder->FinalizeDecoding();
+        bool ok = true;
 
-            CompactLattice clat;
-            bool end_of_utterance = true;
-            decoder->GetLattice(end_of_utterance, &clat);
+        if (finalize) {
+            ok = finish_utterance();
+        } else if (model->endpoint_auto_finalize && check_endpoint()) {
+            endpointed = true;
+            ok = end_utterance();
+        }
 
-            if (clat.NumStates() == 0) {
-              KALDI_WARN << "Empty lattice.";
-              return false;
-            }
+        if (stats_enabled)
+            add_decode_time(1, wave_part.Dim() / samp_freq, chunk_timer.elapsed());
 
-            CompactLatticeShortestPath(clat, &best_path_clat);
-            
-            tot_frames_decoded = tot_frames;
-            tot_frames         = 0;
+        return ok;
+    }
 
-            free_decoder();
+    void NNet3OnlineDecoderWrapper::advance_decoding(void) {
 
+        if (!stats_enabled) {
+            decoder->AdvanceDecoding(decodable);
+            return;
         }
-        
-        return true;
+
+        int32          num_frames = decoder->NumFramesDecoded();
+        TimedDecodable timed_decodable(decodable);
+        StatsTimer     timer;
+
+        decoder->AdvanceDecoding(&timed_decodable);
+
+        double seconds    = timer.elapsed();
+        int32  num_tokens = decoder->NumActiveTokens();
+        num_frames = decoder->NumFramesDecoded() - num_frames;
+
+        std::lock_guard<std::mutex> lock(stats_mutex);
+        stats.stages[kStageNnet].add(timed_decodable.seconds);
+        stats.stages[kStageSearch].add(seconds - timed_decodable.seconds);
+        stats.frames_decoded += num_frames;
+        if (num_frames > 0)
+            stats.active_tokens.add(num_tokens);
     }
 
+    bool NNet3OnlineDecoderWrapper::end_utterance(void) {
 
-    /*
-     * NNet3OnlineModelWrapper
-     */
+        // flush out frames still buffered in the feature pipeline
+        feature_pipeline->InputFinished();
+        advance_decoding();
 
-    // typedef void (*LogHandler)(const LogMessageEnvelope &envelope,
-    //                            const char *message);
-    void silent_log_handler (const LogMessageEnvelope &envelope,
-                             const char *message) {
-        // nothing - this handler simply keeps silent
+        return finish_utterance();
     }
 
-    NNet3OnlineModelWrapper::NNet3OnlineModelWrapper(BaseFloat    beam,                       
-                                                     int32        max_active,
-                                                     int32        min_active,
-                                                     BaseFloat    lattice_beam,
-                                                     BaseFloat    acoustic_scale, 
-                                                     int32        frame_subsampling_factor,
-                                                     std::string &word_syms_filename, 
-                                                     std::string &model_in_filename,
-                                                     std::string &fst_in_str,
-                                                     std::string &mfcc_config,
-                                                     std::string &ie_conf_filename,
-                                                     std::string &align_lex_filename)
+    bool NNet3OnlineDecoderWrapper::finish_utterance(void) {
 
-    {
+        if (decoder->NumFramesDecoded() == 0) {
+            // nothing decoded (no or too little audio since the decoder was
+            // started): no lattice to get, just drop the utterance
+            discard_utterance();
+            return false;
+        }
 
-        using namespace kaldi;
-        using namespace fst;
-        
-        typedef kaldi::int32 int32;
+        StatsTimer timer(stats_enabled);
+
+        decoder->FinalizeDecoding();
+
+        if (stats_enabled)
+            add_stage_time(kStageFinalize, timer.elapsed());
+
+        StatsTimer det_timer(stats_enabled);
+
+        Lattice raw_lat;
+        bool use_final_probs = true;
+        decoder->GetRawLattice(&raw_lat, use_final_probs);
+
+        CompactLattice clat;
+        DeterminizeLatticePhonePrunedWrapper(model->trans_model, &raw_lat,
+                                             decoder_config.lattice_beam, &clat, decoder_config.det_opts);
+
+        if (stats_enabled) {
+            add_stage_time(kStageDeterminize, det_timer.elapsed());
+            std::lock_guard<std::mutex> lock(stats_mutex);
+            stats.utterances += 1.0;
+        }
+
+        tot_frames_decoded = tot_frames;
+        tot_frames         = 0;
+
+        // carry speaker adaptation over to the next utterance
+        feature_pipeline->GetAdaptationState(adaptation_state);
+
+        free_decoder();
+
+        if (clat.NumStates() == 0) {
+          KALDI_WARN << "Empty lattice.";
+          best_path_clat.DeleteStates();
+          lattice_clat.DeleteStates();
+          return false;
+        }
+
+        CompactLatticeShortestPath(clat, &best_path_clat);
+        // keep the full lattice for get_nbest() / get_lattice()
+        lattice_clat = clat;
+
+        return true;
+    }
+
+    void NNet3OnlineDecoderWrapper::discard_utterance(void) {
+
+        tot_frames_decoded = tot_frames;
+        tot_frames         = 0;
+
+        free_decoder();
+
+        best_path_clat.DeleteStates();
+        lattice_clat.DeleteStates();
+    }
+
+    bool NNet3OnlineDecoderWrapper::endpoint_detected(void) {
+
+        if (!decoder) {
+            // utterance has been finalized already, by the last decode()
+            // call in case of auto-finalization
+            return endpointed;
+        }
+
+        return check_endpoint();
+    }
+
+    bool NNet3OnlineDecoderWrapper::check_endpoint(void) {
+
+        const OnlineEndpointConfig &config = model->endpoint_config;
+
+        if (!config.silence_phones.empty())
+            return EndpointDetected(config, model->trans_model, model->frame_shift(), *decoder);
+
+        // without silence phones kaldi's trailing silence computation asserts
+        // (aborting the process): count the whole utterance as speech, so
+        // only rules without a minimum trailing silence (rule5, the maximum
+        // utterance length, by default) can fire
+
+        int32 num_frames = decoder->NumFramesDecoded();
+        if (num_frames == 0)
+            return false;
+
+        return EndpointDetected(config, num_frames, 0, model->frame_shift(), decoder->FinalRelativeCost());
+    }
+
+    bool NNet3OnlineDecoderWrapper::finalize_decoding(void) {
+
+        if (!decoder) {
+            return false;
+        }
+
+        StatsTimer timer(stats_enabled);
+
+        bool ok = end_utterance();
+
+        if (stats_enabled)
+            add_decode_time(0, 0.0, timer.elapsed());
+
+        return ok;
+    }
+
+    bool NNet3OnlineDecoderWrapper::get_nbest(int32                             n,
+                                              std::vector<std::vector<int32> > &word_ids,
+                                              std::vector<double>              &likelihoods) {
+
+        word_ids.clear();
+        likelihoods.clear();
+
+        if (lattice_clat.NumStates() == 0)
+            return false;
+
+        lattice_nbest(lattice_clat, n, word_ids, likelihoods);
+        return true;
+    }
+
+    bool NNet3OnlineDecoderWrapper::get_lattice(int32                  &start,
+                                                std::vector<int32>     &arcs,
+                                                std::vector<BaseFloat> &arc_weights,
+                                                std::vector<int32>     &arc_alignment_offsets,
+                                                std::vector<int32>     &arc_alignments,
+                                                std::vector<BaseFloat> &final_weights,
+                                                std::vector<int32>     &final_alignment_offsets,
+                                                std::vector<int32>     &final_alignments) {
+
+        if (lattice_clat.NumStates() == 0)
+            return false;
+
+        CompactLattice clat;
+        unscale_lattice(lattice_clat, model->decodable_opts.acoustic_scale, &clat);
+        compact_lattice_to_arrays(clat, start, arcs, arc_weights, arc_alignment_offsets, arc_alignments,
+                                  final_weights, final_alignment_offsets, final_alignments);
+        return true;
+    }
+
+    bool NNet3OnlineDecoderWrapper::get_lattice_bytes(std::string &data) {
+
+        if (lattice_clat.NumStates() == 0)
+            return false;
+
+        CompactLattice clat;
+        unscale_lattice(lattice_clat, model->decodable_opts.acoustic_scale, &clat);
+        compact_lattice_to_bytes(clat, data);
+        return true;
+    }
+
+    bool NNet3OnlineDecoderWrapper::get_word_confidences(std::vector<BaseFloat> &confidences) {
+
+        confidences.clear();
+
+        if (lattice_clat.NumStates() == 0 || best_path_clat.NumStates() == 0)
+            return false;
+
+        Lattice            best_path_lat;
+        std::vector<int32> alignment, words;
+        LatticeWeight      weight;
+        ConvertLattice(best_path_clat, &best_path_lat);
+        GetLinearSymbolSequence(best_path_lat, &alignment, &words, &weight);
+
+        if (words.empty())
+            return true;
+
+        // confidences for the words we already decoded instead of an MBR
+        // hypothesis of its own, so they line up with the best path
+
+        MinimumBayesRiskOptions mbr_opts;
+        mbr_opts.decode_mbr = false;
+
+        MinimumBayesRisk mbr(lattice_clat, words, mbr_opts);
+        confidences = mbr.GetOneBestConfidences();
+
+        return true;
+    }
+
+    bool NNet3OnlineDecoderWrapper::get_word_alignment_confidences(std::vector<string>    &words,
+                                                                   std::vector<int32>     &times,
+                                                                   std::vector<int32>     &lengths,
+                                                                   std::vector<BaseFloat> &confidences) {
+
+        std::vector<int32>     word_ids;
+        std::vector<BaseFloat> word_confidences;
+
+        if (!get_word_alignment_ids(word_ids, times, lengths))
+            return false;
+
+        model->words_to_strings(word_ids, words);
+        get_word_confidences(word_confidences);
+
+        // alignment entries without a word of the best path (optional
+        // silence, word id 0) have no confidence of their own
+
+        confidences.assign(word_ids.size(), std::numeric_limits<BaseFloat>::quiet_NaN());
+        for (size_t i = 0, j = 0; i < word_ids.size() && j < word_confidences.size(); i++) {
+            if (word_ids[i] != 0)
+                confidences[i] = word_confidences[j++];
+        }
+
+        return true;
+    }
+
+    void NNet3OnlineDecoderWrapper::get_adaptation_state(std::string &state) {
+
+        std::ostringstream os;
+        adaptation_state->Write(os, true);
+        state = os.str();
+    }
+
+    void NNet3OnlineDecoderWrapper::set_adaptation_state(const std::string &state) {
+
+        const OnlineIvectorExtractionInfo &ie_info = model->feature_info->ivector_extractor_info;
+
+        OnlineIvectorExtractorAdaptationState *new_state = new OnlineIvectorExtractorAdaptationState(ie_info);
+        try {
+            std::istringstream is(state);
+            new_state->Read(is, true);
+            if (new_state->ivector_stats.IvectorDim() != ie_info.extractor.IvectorDim())
+                KALDI_ERR << "Adaptation state has iVector dimension " << new_state->ivector_stats.IvectorDim()
+                          << ", model expects " << ie_info.extractor.IvectorDim();
+        } catch (...) {
+            delete new_state;
+            throw;
+        }
+
+        delete adaptation_state;
+        adaptation_state = new_state;
+
+        // no audio seen yet: the utterance can still start from this state
+        if (feature_pipeline && tot_frames == 0)
+            feature_pipeline->SetAdaptationState(*adaptation_state);
+    }
+
+    void NNet3OnlineDecoderWrapper::set_stats_enabled(bool enabled) {
+        stats_enabled = enabled;
+    }
+
+    void NNet3OnlineDecoderWrapper::get_stats(DecoderStats &stats_out) {
+        std::lock_guard<std::mutex> lock(stats_mutex);
+        stats_out = stats;
+    }
+
+    void NNet3OnlineDecoderWrapper::reset_stats(void) {
+        std::lock_guard<std::mutex> lock(stats_mutex);
+        stats = DecoderStats();
+    }
+
+    void NNet3OnlineDecoderWrapper::get_beam_options(BaseFloat &beam,
+                                                     int32     &max_active,
+                                                     int32     &min_active,
+                                                     BaseFloat &lattice_beam) {
+        beam         = decoder_config.beam;
+        max_active   = decoder_config.max_active;
+        min_active   = decoder_config.min_active;
+        lattice_beam = decoder_config.lattice_beam;
+    }
+
+    void NNet3OnlineDecoderWrapper::set_beam_options(BaseFloat beam,
+                                                     int32     max_active,
+                                                     int32     min_active,
+                                                     BaseFloat lattice_beam) {
+
+        // kaldi only asserts these, which would abort the process
+        if (!(beam > 0.0 && lattice_beam > 0.0 && max_active > 1 && min_active >= 0 && min_active <= max_active))
+            KALDI_ERR << "Invalid beam options: beam=" << beam << " max_active=" << max_active
+                      << " min_active=" << min_active << " lattice_beam=" << lattice_beam;
+
+        decoder_config.beam         = beam;
+        decoder_config.max_active   = max_active;
+        decoder_config.min_active   = min_active;
+        decoder_config.lattice_beam = lattice_beam;
+
+        // the lattice decoder reads them afresh for every frame
+        if (decoder)
+            decoder->SetOptions(decoder_config);
+    }
+
+    void NNet3OnlineDecoderWrapper::reset_beam_options(void) {
+        const LatticeFasterDecoderConfig &config = model->lattice_faster_decoder_config;
+        set_beam_options(config.beam, config.max_active, config.min_active, config.lattice_beam);
+    }
+
+    void NNet3OnlineDecoderWrapper::add_stage_time(DecoderStage stage, double seconds) {
+        std::lock_guard<std::mutex> lock(stats_mutex);
+        stats.stages[stage].add(seconds);
+    }
+
+    void NNet3OnlineDecoderWrapper::add_decode_time(int32 num_chunks, double audio_seconds, double seconds) {
+        std::lock_guard<std::mutex> lock(stats_mutex);
+        stats.chunks         += num_chunks;
+        stats.audio_seconds  += audio_seconds;
+        stats.decode_seconds += seconds;
+    }
+
+
+    /*
+     * NNet3BatchDecoderWrapper
+     */
+
+    NNet3BatchDecoderWrapper::NNet3BatchDecoderWrapper(NNet3OnlineModelWrapper *aModel,
+                                                       int32                    aNumThreads,
+                                                       int32                    minibatch_size) 
+                                                       : model(aModel), num_threads(aNumThreads) {
+
+        batch_opts.acoustic_scale           = model->decodable_opts.acoustic_scale;
+        batch_opts.frame_subsampling_factor = model->decodable_opts.frame_subsampling_factor;
+        batch_opts.minibatch_size           = minibatch_size;
+    }
+
+    NNet3BatchDecoderWrapper::~NNet3BatchDecoderWrapper() {
+    }
+
+    void NNet3BatchDecoderWrapper::compute_features(BaseFloat          samp_freq, 
+                                                    int32              num_frames, 
+                                                    BaseFloat         *frames,
+                                                    Matrix<BaseFloat> *features,
+                                                    Matrix<BaseFloat> *online_ivectors) {
+
+        // run the online feature pipeline over the whole utterance so we get
+        // exactly the features and iVectors online decoding would see
+
+        OnlineIvectorExtractorAdaptationState adaptation_state(model->feature_info->ivector_extractor_info);
+        OnlineNnet2FeaturePipeline            feature_pipeline(*model->feature_info);
+        feature_pipeline.SetAdaptationState(adaptation_state);
+
+        SubVector<BaseFloat> wave(frames, num_frames);
+        feature_pipeline.AcceptWaveform(samp_freq, wave);
+        feature_pipeline.InputFinished();
+
+        OnlineFeatureInterface *input = feature_pipeline.InputFeature();
+        int32 num_feature_frames = input->NumFramesReady();
+
+        features->Resize(num_feature_frames, input->Dim(), kUndefined);
+        for (int32 t = 0; t < num_feature_frames; t++) {
+            SubVector<BaseFloat> row(*features, t);
+            input->GetFrame(t, &row);
+        }
+
+        OnlineIvectorFeature *ivector_feature = feature_pipeline.IvectorFeature();
+        if (ivector_feature == NULL) {
+            online_ivectors->Resize(0, 0);
+            return;
+        }
+
+        int32 period       = model->feature_info->ivector_extractor_info.ivector_period;
+        int32 num_ivectors = (num_feature_frames + period - 1) / period;
+
+        online_ivectors->Resize(num_ivectors, ivector_feature->Dim(), kUndefined);
+        for (int32 i = 0; i < num_ivectors; i++) {
+            SubVector<BaseFloat> row(*online_ivectors, i);
+            ivector_feature->GetFrame(i * period, &row);
+        }
+    }
+
+    int32 NNet3BatchDecoderWrapper::decode_batch(BaseFloat                samp_freq, 
+                                                 std::vector<int32>      &num_frames, 
+                                                 std::vector<BaseFloat*> &frames) {
+
+        KALDI_ASSERT(num_frames.size() == frames.size());
+
+        int32 num_utts = frames.size();
+        int32 period   = model->feature_info->ivector_extractor_info.ivector_period;
+        int32 num_ok   = 0;
+
+        best_path_clats.clear();
+        best_path_clats.resize(num_utts);
+
+        // the computer collects chunks from all utterances in flight into
+        // minibatches, the decoder runs one beam search per utterance
+
+        nnet3::NnetBatchComputer computer(batch_opts, model->am_nnet.GetNnet(), model->am_nnet.Priors());
+
+        {
+            nnet3::NnetBatchDecoder decoder(*model->decode_fst, 
+                                            model->lattice_faster_decoder_config,
+                                            model->trans_model, 
+                                            NULL, // word_syms: we build result strings ourselves
+                                            false, // allow_partial
+                                            num_threads, 
+                                            &computer);
+
+            std::string    utt_id, sentence;
+            CompactLattice clat;
+
+            for (int32 utt = 0; utt <= num_utts; utt++) {
+
+                if (utt < num_utts) {
+
+                    Matrix<BaseFloat> features, online_ivectors;
+                    compute_features(samp_freq, num_frames[utt], frames[utt], &features, &online_ivectors);
+
+                    if (features.NumRows() == 0) {
+                        KALDI_WARN << "Utterance " << utt << " is too short.";
+                        continue;
+                    }
+
+                    decoder.AcceptInput(std::to_string(utt), 
+                                        features, 
+                                        NULL,
+                                        online_ivectors.NumRows() ? &online_ivectors : NULL,
+                                        period);
+                } else {
+                    decoder.Finished();
+                }
+
+                while (decoder.GetOutput(&utt_id, &clat, &sentence)) {
+
+                    if (clat.NumStates() == 0) {
+                        KALDI_WARN << "Empty lattice for utterance " << utt_id;
+                        continue;
+                    }
+
+                    // the batch decoder undoes the acoustic scale on its output
+                    // lattices, re-apply it so likelihoods match online decoding
+
+                    fst::ScaleLattice(fst::AcousticLatticeScale(batch_opts.acoustic_scale), &clat);
+
+                    CompactLatticeShortestPath(clat, &best_path_clats[std::stoi(utt_id)]);
+                    num_ok++;
+                }
+            }
+        }
+
+        return num_ok;
+    }
+
+    bool NNet3BatchDecoderWrapper::get_decoded_string(int32        utt,
+                                                      std::string &decoded_string, 
+                                                      double      &likelihood) {
+
+        decoded_string = "";
+        likelihood     = 0.0;
+
+        if (utt < 0 || utt >= best_path_clats.size() || best_path_clats[utt].NumStates() == 0)
+            return false;
+
+        Lattice best_path_lat;
+        ConvertLattice(best_path_clats[utt], &best_path_lat);
+
+        model->best_path_to_string(best_path_lat, decoded_string, likelihood);
+
+        return true;
+    }
+
+    bool NNet3BatchDecoderWrapper::get_word_alignment(int32                utt,
+                                                      std::vector<string> &words,
+                                                      std::vector<int32>  &times,
+                                                      std::vector<int32>  &lengths) {
+
+        if (utt < 0 || utt >= best_path_clats.size() || best_path_clats[utt].NumStates() == 0)
+            return false;
+
+        return model->align_best_path(best_path_clats[utt], words, times, lengths);
+    }
+
+
+    /*
+     * decoding graph I/O
+     */
+
+    void convert_fst_for_mapping(const std::string &fst_in_str, const std::string &fst_out_str) {
+
+        fst::Fst<fst::StdArc> *fst = fst::ReadFstKaldiGeneric(fst_in_str);
+        fst::ConstFst<fst::StdArc> const_fst(*fst);
+        delete fst;
+
+        // aligned so the arrays can be mapped straight from the page cache
+
+        std::ofstream strm(fst_out_str.c_str(), std::ios_base::out | std::ios_base::binary);
+        fst::FstWriteOptions wopts(fst_out_str);
+        wopts.align = true;
+
+        if (!strm || !const_fst.Write(strm, wopts) || !strm.flush())
+            KALDI_ERR << "Could not write decoding graph to " << fst_out_str;
+    }
+
+    static fst::Fst<fst::StdArc> *read_fst_mapped(const std::string &fst_in_str) {
+
+        std::ifstream strm(fst_in_str.c_str(), std::ios_base::in | std::ios_base::binary);
+        if (!strm)
+            KALDI_ERR << "Could not open decoding graph " << fst_in_str;
+
+        // MAP mode: the arrays of the ConstFst are memory-mapped read-only,
+        // processes mapping the same file share its pages
+
+        fst::FstReadOptions ropts(fst_in_str);
+        ropts.mode = fst::FstReadOptions::MAP;
+
+        fst::Fst<fst::StdArc> *fst = fst::ConstFst<fst::StdArc>::Read(strm, ropts);
+        if (!fst)
+            KALDI_ERR << "Could not read decoding graph " << fst_in_str << " (not a ConstFst?)";
+
+        return fst;
+    }
+
+    /*
+     * config texts and model bundle I/O
+     */
+
+    // parse the contents of a kaldi config file (--name=value lines,
+    // # comments) without going through the file system
+
+    static void parse_config_text(const std::string &text, ParseOptions *po) {
+
+        std::vector<std::string> args(1, "config");
+        std::istringstream       is(text);
+        std::string              line;
+
+        while (std::getline(is, line)) {
+            size_t pos = line.find('#');
+            if (pos != std::string::npos)
+                line.erase(pos);
+            Trim(&line);
+            if (line.empty())
+                continue;
+            if (line.compare(0, 2, "--") != 0)
+                KALDI_ERR << "Invalid line in config: " << line;
+            args.push_back(line);
+        }
+
+        std::vector<const char *> argv;
+        for (size_t i = 0; i < args.size(); i++)
+            argv.push_back(args[i].c_str());
+
+        po->Read(argv.size(), &argv[0]);
+        if (po->NumArgs() != 0)
+            KALDI_ERR << "Unexpected arguments in config: " << text;
+    }
+
+    static std::string read_text_file(const std::string &filename) {
+
+        std::ifstream strm(filename.c_str());
+        if (!strm)
+            KALDI_ERR << "Could not open " << filename;
+
+        std::ostringstream os;
+        os << strm.rdbuf();
+        return os.str();
+    }
+
+    static void write_text(std::ostream &os, const std::string &text) {
+        WriteBasicType(os, true, static_cast<int64>(text.size()));
+        os.write(text.data(), text.size());
+    }
+
+    static void read_text(std::istream &is, std::string *text) {
+        int64 size;
+        ReadBasicType(is, true, &size);
+        if (size < 0)
+            KALDI_ERR << "Corrupt model bundle";
+        text->resize(size);
+        if (size > 0)
+            is.read(&(*text)[0], size);
+        if (!is)
+            KALDI_ERR << "Unexpected end of model bundle";
+    }
+
+    // online_cmvn_iextractor only exists in newer kaldi versions, copy it
+    // if it is there
+
+    template<typename C, typename I>
+    static auto copy_online_cmvn_iextractor(const C &config, I *info, int)
+        -> decltype(info->online_cmvn_iextractor = config.online_cmvn_iextractor, void()) {
+        info->online_cmvn_iextractor = config.online_cmvn_iextractor;
+    }
+
+    template<typename C, typename I>
+    static void copy_online_cmvn_iextractor(const C &config, I *info, long) {
+    }
+
+    static const int32 kNNet3BundleVersion = 1;
+
+    /*
+     * NNet3OnlineModelWrapper
+     */
+
+    // typedef void (*LogHandler)(const LogMessageEnvelope &envelope,
+    //                            const char *message);
+    void silent_log_handler (const LogMessageEnvelope &envelope,
+                             const char *message) {
+        // nothing - this handler simply keeps silent
+    }
+
+    void NNet3OnlineModelWrapper::init_options(BaseFloat          beam,
+                                               int32              max_active,
+                                               int32              min_active,
+                                               BaseFloat          lattice_beam,
+                                               BaseFloat          acoustic_scale, 
+                                               int32              frame_subsampling_factor,
+                                               const std::string &endpoint_options,
+                                               bool               endpoint_auto_finalize) {
+
+        lattice_faster_decoder_config.max_active   = max_active;
+        lattice_faster_decoder_config.min_active   = min_active;
+        lattice_faster_decoder_config.beam         = beam;
+        lattice_faster_decoder_config.lattice_beam = lattice_beam;
+        decodable_opts.acoustic_scale              = acoustic_scale;
+        decodable_opts.frame_subsampling_factor    = frame_subsampling_factor;
+
+        {
+            ParseOptions po("");
+            endpoint_config.Register(&po);
+            parse_config_text(endpoint_options, &po);
+        }
+        this->endpoint_auto_finalize               = endpoint_auto_finalize;
+    }
+
+    NNet3OnlineModelWrapper::NNet3OnlineModelWrapper(BaseFloat    beam,                       
+                                                     int32        max_active,
+                                                     int32        min_active,
+                                                     BaseFloat    lattice_beam,
+                                                     BaseFloat    acoustic_scale, 
+                                                     int32        frame_subsampling_factor,
+                                                     std::string &word_syms_filename, 
+                                                     std::string &model_in_filename,
+                                                     std::string &fst_in_str,
+                                                     std::string &mfcc_config,
+                                                     std::string &ie_conf_filename,
+                                                     std::string &align_lex_filename,
+                                                     std::string &endpoint_options,
+                                                     bool         mmap_fst,
+                                                     bool         endpoint_auto_finalize,
+                                                     bool         lazy_load)
+
+    {
+
+        using namespace kaldi;
+        using namespace fst;
+        
+        typedef kaldi::int32 int32;
         typedef kaldi::int64 int64;
     
 #if VERBOSE
@@ -321,15 +1429,22 @@ namespace kaldi {
         feature_config.mfcc_config                 = mfcc_config;
         feature_config.ivector_extraction_config   = ie_conf_filename;
 
-        lattice_faster_decoder_config.max_active   = max_active;
-        lattice_faster_decoder_config.min_active   = min_active;
-        lattice_faster_decoder_config.beam         = beam;
-        lattice_faster_decoder_config.lattice_beam = lattice_beam;
-        decodable_opts.acoustic_scale              = acoustic_scale;
-        decodable_opts.frame_subsampling_factor    = frame_subsampling_factor;
+        init_options(beam, max_active, min_active, lattice_beam, acoustic_scale,
+                     frame_subsampling_factor, endpoint_options, endpoint_auto_finalize);
 
         feature_info = new OnlineNnet2FeaturePipelineInfo(this->feature_config);
 
+        // keep the feature configuration around for save_bundle()
+        {
+            OnlineIvectorExtractionConfig ie_config;
+            ReadConfigFromFile(ie_conf_filename, &ie_config);
+
+            mfcc_config_text   = read_text_file(mfcc_config);
+            ie_config_text     = read_text_file(ie_conf_filename);
+            cmvn_config_text   = read_text_file(ie_config.cmvn_config_rxfilename);
+            splice_config_text = read_text_file(ie_config.splice_config_rxfilename);
+        }
+
         // load model...
         {
             bool binary;
@@ -341,31 +1456,508 @@ namespace kaldi {
             nnet3::CollapseModel(nnet3::CollapseModelConfig(), &(this->am_nnet.GetNnet()));
         }
 
+        // compile the looped computation once, decoders share it read-only
+#if VERBOSE
+        KALDI_LOG << "alloc: nnet3::DecodableNnetSimpleLoopedInfo";
+#endif
+        decodable_info = new nnet3::DecodableNnetSimpleLoopedInfo(decodable_opts, &am_nnet);
+
         // Input FST is just one FST, not a table of FSTs.
-        decode_fst = fst::ReadFstKaldiGeneric(fst_in_str);
+        if (mmap_fst) {
+            decode_fst = read_fst_mapped(fst_in_str);
+        } else {
+            decode_fst = fst::ReadFstKaldiGeneric(fst_in_str);
+        }
 
-        word_syms = NULL;
-        if (word_syms_filename != "") 
-          if (!(word_syms = fst::SymbolTable::ReadText(word_syms_filename)))
-            KALDI_ERR << "Could not read symbol table from file "
-                       << word_syms_filename;
+        this->word_syms_filename = word_syms_filename;
+        this->align_lex_filename = align_lex_filename;
+        word_syms                = NULL;
+        word_syms_offset         = -1;
+        align_lex_offset         = -1;
+        word_alignment           = align_lex_filename != "";
+        word_alignment_info      = NULL;
+
+        if (!lazy_load) {
+            if (word_syms_filename != "")
+                load_word_syms();
+            if (word_alignment)
+                load_word_alignment_lexicon(word_alignment_lexicon);
+        }
+    }
+
+    NNet3OnlineModelWrapper::NNet3OnlineModelWrapper(BaseFloat    beam,                       
+                                                     int32        max_active,
+                                                     int32        min_active,
+                                                     BaseFloat    lattice_beam,
+                                                     BaseFloat    acoustic_scale, 
+                                                     int32        frame_subsampling_factor,
+                                                     std::string &bundle_filename,
+                                                     std::string &endpoint_options,
+                                                     bool         mmap_fst,
+                                                     bool         endpoint_auto_finalize,
+                                                     bool         word_symbols,
+                                                     bool         word_alignment,
+                                                     bool         lazy_load)
 
+    {
 #if VERBOSE
-        KALDI_LOG << "loading word alignment lexicon...";
+        KALDI_LOG << "bundle_filename:           " << bundle_filename;
+#else
+        // silence kaldi output as well
+        SetLogHandler(silent_log_handler);
+#endif
+
+        std::ifstream strm(bundle_filename.c_str(), std::ios_base::in | std::ios_base::binary);
+        if (!strm)
+            KALDI_ERR << "Could not open model bundle " << bundle_filename;
+
+        std::istream &is = strm;
+        int32         version;
+
+        ExpectToken(is, true, "<NNet3ModelBundle>");
+        ExpectToken(is, true, "<Version>");
+        ReadBasicType(is, true, &version);
+        if (version != kNNet3BundleVersion)
+            KALDI_ERR << "Model bundle " << bundle_filename << " has version " << version
+                      << ", expected " << kNNet3BundleVersion << " - please recreate it.";
+
+        // feature pipeline: configs are parsed from the bundle, the binary
+        // objects are read directly instead of from one file each
+
+        ExpectToken(is, true, "<MfccConfig>");
+        read_text(is, &mfcc_config_text);
+        ExpectToken(is, true, "<IvectorExtractionConfig>");
+        read_text(is, &ie_config_text);
+        ExpectToken(is, true, "<CmvnConfig>");
+        read_text(is, &cmvn_config_text);
+        ExpectToken(is, true, "<SpliceConfig>");
+        read_text(is, &splice_config_text);
+        ExpectToken(is, true, "<SilencePhones>");
+        read_text(is, &endpoint_config.silence_phones);
+
+        // endpoint rules from the caller apply on top of the silence phones
+        // stored in the bundle
+        init_options(beam, max_active, min_active, lattice_beam, acoustic_scale,
+                     frame_subsampling_factor, endpoint_options, endpoint_auto_finalize);
+
+        feature_info = new OnlineNnet2FeaturePipelineInfo();
+        feature_info->feature_type = "mfcc";
+        feature_info->use_ivectors = true;
+        {
+            ParseOptions po("");
+            feature_info->mfcc_opts.Register(&po);
+            parse_config_text(mfcc_config_text, &po);
+        }
+
+        OnlineIvectorExtractionInfo &ie_info = feature_info->ivector_extractor_info;
+        {
+            // same as OnlineIvectorExtractionInfo::Init(), minus the file I/O
+
+            OnlineIvectorExtractionConfig ie_config;
+            {
+                ParseOptions po("");
+                ie_config.Register(&po);
+                parse_config_text(ie_config_text, &po);
+            }
+
+            ie_info.ivector_period           = ie_config.ivector_period;
+            ie_info.num_gselect              = ie_config.num_gselect;
+            ie_info.min_post                 = ie_config.min_post;
+            ie_info.posterior_scale          = ie_config.posterior_scale;
+            ie_info.max_count                = ie_config.max_count;
+            ie_info.num_cg_iters             = ie_config.num_cg_iters;
+            ie_info.use_most_recent_ivector  = ie_config.use_most_recent_ivector || ie_config.greedy_ivector_extractor;
+            ie_info.greedy_ivector_extractor = ie_config.greedy_ivector_extractor;
+            ie_info.max_remembered_frames    = ie_config.max_remembered_frames;
+            copy_online_cmvn_iextractor(ie_config, &ie_info, 0);
+
+            ParseOptions cmvn_po("");
+            ie_info.cmvn_opts.Register(&cmvn_po);
+            parse_config_text(cmvn_config_text, &cmvn_po);
+
+            ParseOptions splice_po("");
+            ie_info.splice_opts.Register(&splice_po);
+            parse_config_text(splice_config_text, &splice_po);
+        }
+
+        ExpectToken(is, true, "<LdaMatrix>");
+        ie_info.lda_mat.Read(is, true);
+        ExpectToken(is, true, "<GlobalCmvnStats>");
+        ie_info.global_cmvn_stats.Read(is, true);
+        ExpectToken(is, true, "<DiagUbm>");
+        ie_info.diag_ubm.Read(is, true);
+        ExpectToken(is, true, "<IvectorExtractor>");
+        ie_info.extractor.Read(is, true);
+        ie_info.Check();
+
+        // acoustic model, collapsed before it was written
+
+        ExpectToken(is, true, "<AcousticModel>");
+        trans_model.Read(is, true);
+        am_nnet.Read(is, true);
+        SetBatchnormTestMode(true, &(am_nnet.GetNnet()));
+        SetDropoutTestMode(true, &(am_nnet.GetNnet()));
+
+#if VERBOSE
+        KALDI_LOG << "alloc: nnet3::DecodableNnetSimpleLoopedInfo";
 #endif
+        decodable_info = new nnet3::DecodableNnetSimpleLoopedInfo(decodable_opts, &am_nnet);
+
+        // decoding graph, aligned ConstFst which can be mapped straight
+        // from the bundle file
+
+        ExpectToken(is, true, "<DecodingGraph>");
+        {
+            fst::FstReadOptions ropts(bundle_filename);
+            if (mmap_fst)
+                ropts.mode = fst::FstReadOptions::MAP;
+            decode_fst = fst::ConstFst<fst::StdArc>::Read(is, ropts);
+            if (!decode_fst)
+                KALDI_ERR << "Could not read decoding graph from " << bundle_filename;
+        }
+
+        // optional sections: only their offsets are noted here, they are
+        // read by load_word_syms() / load_word_alignment_lexicon()
+
+        int64 size;
+
+        ExpectToken(is, true, "<WordSymbols>");
+        ReadBasicType(is, true, &size);
+        word_syms_offset = (word_symbols && size > 0) ? static_cast<int64>(is.tellg()) : -1;
+        is.seekg(size, std::ios_base::cur);
+
+        ExpectToken(is, true, "<AlignLexicon>");
+        ReadBasicType(is, true, &size);
+        align_lex_offset = (word_alignment && size > 0) ? static_cast<int64>(is.tellg()) : -1;
+        is.seekg(size, std::ios_base::cur);
+
+        ExpectToken(is, true, "</NNet3ModelBundle>");
+
+        this->bundle_filename    = bundle_filename;
+        this->word_alignment     = align_lex_offset >= 0;
+        word_syms                = NULL;
+        word_alignment_info      = NULL;
+
+        if (!lazy_load) {
+            if (word_syms_offset >= 0)
+                load_word_syms();
+            if (this->word_alignment)
+                load_word_alignment_lexicon(word_alignment_lexicon);
+        }
+    }
+
+    void NNet3OnlineModelWrapper::save_bundle(const std::string &bundle_filename) {
+
+        std::ofstream strm(bundle_filename.c_str(), std::ios_base::out | std::ios_base::binary);
+        if (!strm)
+            KALDI_ERR << "Could not open " << bundle_filename << " for writing";
+
+        std::ostream &os = strm;
+
+        WriteToken(os, true, "<NNet3ModelBundle>");
+        WriteToken(os, true, "<Version>");
+        WriteBasicType(os, true, kNNet3BundleVersion);
+
+        WriteToken(os, true, "<MfccConfig>");
+        write_text(os, mfcc_config_text);
+        WriteToken(os, true, "<IvectorExtractionConfig>");
+        write_text(os, ie_config_text);
+        WriteToken(os, true, "<CmvnConfig>");
+        write_text(os, cmvn_config_text);
+        WriteToken(os, true, "<SpliceConfig>");
+        write_text(os, splice_config_text);
+        WriteToken(os, true, "<SilencePhones>");
+        write_text(os, endpoint_config.silence_phones);
+
+        const OnlineIvectorExtractionInfo &ie_info = feature_info->ivector_extractor_info;
+
+        WriteToken(os, true, "<LdaMatrix>");
+        ie_info.lda_mat.Write(os, true);
+        WriteToken(os, true, "<GlobalCmvnStats>");
+        ie_info.global_cmvn_stats.Write(os, true);
+        WriteToken(os, true, "<DiagUbm>");
+        ie_info.diag_ubm.Write(os, true);
+        WriteToken(os, true, "<IvectorExtractor>");
+        ie_info.extractor.Write(os, true);
+
+        WriteToken(os, true, "<AcousticModel>");
+        trans_model.Write(os, true);
+        am_nnet.Write(os, true);
+
+        WriteToken(os, true, "<DecodingGraph>");
         {
-            bool binary_in;
-            Input ki(align_lex_filename, &binary_in);
-            KALDI_ASSERT(!binary_in && "Not expecting binary file for lexicon");
-            if (!ReadLexiconForWordAlign(ki.Stream(), &word_alignment_lexicon)) {
-                KALDI_ERR << "Error reading alignment lexicon from "
-                          << align_lex_filename;
+            fst::FstWriteOptions wopts(bundle_filename);
+            wopts.align = true;
+
+            bool ok;
+            if (decode_fst->Type() == "const") {
+                ok = decode_fst->Write(os, wopts);
+            } else {
+                fst::ConstFst<fst::StdArc> const_fst(*decode_fst);
+                ok = const_fst.Write(os, wopts);
             }
+            if (!ok)
+                KALDI_ERR << "Could not write decoding graph to " << bundle_filename;
+        }
+
+        // optional sections are prefixed by their size so they can be
+        // skipped, a size of 0 means not present
+
+        WriteToken(os, true, "<WordSymbols>");
+        if (has_word_symbols()) {
+            std::ostringstream ss;
+            get_word_syms()->Write(ss);
+            write_text(os, ss.str());
+        } else {
+            WriteBasicType(os, true, static_cast<int64>(0));
+        }
+
+        WriteToken(os, true, "<AlignLexicon>");
+        if (word_alignment) {
+            std::vector<std::vector<int32> > lexicon;
+            load_word_alignment_lexicon(lexicon);
+
+            std::ostringstream ss;
+            WriteBasicType(ss, true, static_cast<int32>(lexicon.size()));
+            for (size_t i = 0; i < lexicon.size(); i++)
+                WriteIntegerVector(ss, true, lexicon[i]);
+            write_text(os, ss.str());
+        } else {
+            WriteBasicType(os, true, static_cast<int64>(0));
         }
+
+        WriteToken(os, true, "</NNet3ModelBundle>");
+
+        if (!strm.flush())
+            KALDI_ERR << "Could not write model bundle " << bundle_filename;
+    }
+
+    bool NNet3OnlineModelWrapper::has_word_symbols(void) {
+        return word_syms_offset >= 0 || word_syms_filename != "";
+    }
+
+    bool NNet3OnlineModelWrapper::has_word_alignment(void) {
+        return word_alignment;
+    }
+
+    BaseFloat NNet3OnlineModelWrapper::frame_shift(void) {
+        return feature_info->FrameShiftInSeconds() * decodable_opts.frame_subsampling_factor;
+    }
+
+    void NNet3OnlineModelWrapper::load_resources(void) {
+        if (has_word_symbols())
+            get_word_syms();
+        if (word_alignment)
+            get_word_alignment_info();
+    }
+
+    void NNet3OnlineModelWrapper::get_word_symbols(std::vector<std::string> &symbols) {
+
+        // dense id -> symbol list, ids missing from the table map to ""
+
+        const fst::SymbolTable *syms = get_word_syms();
+
+        int64 max_id = -1;
+        for (fst::SymbolTableIterator siter(*syms); !siter.Done(); siter.Next())
+            max_id = std::max(max_id, static_cast<int64>(siter.Value()));
+
+        symbols.assign(max_id + 1, "");
+        for (fst::SymbolTableIterator siter(*syms); !siter.Done(); siter.Next())
+            symbols[siter.Value()] = siter.Symbol();
+    }
+
+    void NNet3OnlineModelWrapper::load_word_syms(void) {
+
+        if (!has_word_symbols())
+            KALDI_ERR << "Model was loaded without word symbols.";
+#if VERBOSE
+        KALDI_LOG << "loading word symbol table...";
+#endif
+        if (word_syms_offset >= 0) {
+            std::ifstream strm(bundle_filename.c_str(), std::ios_base::in | std::ios_base::binary);
+            strm.seekg(word_syms_offset);
+            if (!(word_syms = fst::SymbolTable::Read(strm, bundle_filename)))
+                KALDI_ERR << "Could not read symbol table from model bundle "
+                          << bundle_filename;
+        } else {
+            if (!(word_syms = fst::SymbolTable::ReadText(word_syms_filename)))
+                KALDI_ERR << "Could not read symbol table from file "
+                          << word_syms_filename;
+        }
+    }
+
+    void NNet3OnlineModelWrapper::load_word_alignment_lexicon(std::vector<std::vector<int32> > &lexicon) {
+
+#if VERBOSE
+        KALDI_LOG << "loading word alignment lexicon...";
+#endif
+        if (align_lex_offset >= 0) {
+            std::ifstream strm(bundle_filename.c_str(), std::ios_base::in | std::ios_base::binary);
+            strm.seekg(align_lex_offset);
+
+            int32 num_entries;
+            ReadBasicType(strm, true, &num_entries);
+            lexicon.resize(num_entries);
+            for (int32 i = 0; i < num_entries; i++)
+                ReadIntegerVector(strm, true, &lexicon[i]);
+            return;
+        }
+
+        bool binary_in;
+        Input ki(align_lex_filename, &binary_in);
+        KALDI_ASSERT(!binary_in && "Not expecting binary file for lexicon");
+        if (!ReadLexiconForWordAlign(ki.Stream(), &lexicon)) {
+            KALDI_ERR << "Error reading alignment lexicon from "
+                      << align_lex_filename;
+        }
+    }
+
+    const fst::SymbolTable *NNet3OnlineModelWrapper::get_word_syms(void) {
+
+        std::lock_guard<std::mutex> lock(resource_mutex);
+
+        if (!word_syms)
+            load_word_syms();
+
+        return word_syms;
+    }
+
+    const WordAlignLatticeLexiconInfo *NNet3OnlineModelWrapper::get_word_alignment_info(void) {
+
+        std::lock_guard<std::mutex> lock(resource_mutex);
+
+        if (!word_alignment_info) {
+            if (!word_alignment)
+                KALDI_ERR << "Model was loaded without word alignment support.";
+            if (word_alignment_lexicon.empty())
+                load_word_alignment_lexicon(word_alignment_lexicon);
+#if VERBOSE
+            KALDI_LOG << "alloc: WordAlignLatticeLexiconInfo";
+#endif
+            word_alignment_info = new WordAlignLatticeLexiconInfo(word_alignment_lexicon);
+            // lexicon info keeps its own copy in a form suitable for lookups
+            std::vector<std::vector<int32> >().swap(word_alignment_lexicon);
+        }
+
+        return word_alignment_info;
+    }
+
+    void NNet3OnlineModelWrapper::best_path_to_string(const Lattice &best_path_lat,
+                                                      std::string   &decoded_string, 
+                                                      double        &likelihood) {
+
+        std::vector<int32> words;
+        std::vector<int32> alignment;
+        LatticeWeight      weight;
+        int32              num_frames;
+        GetLinearSymbolSequence(best_path_lat, &alignment, &words, &weight);
+        num_frames = alignment.size();
+        likelihood = -(weight.Value1() + weight.Value2()) / num_frames;
+                   
+        words_to_string(words, decoded_string);
+    }
+
+    void NNet3OnlineModelWrapper::words_to_string(const std::vector<int32> &words,
+                                                  std::string              &decoded_string) {
+
+        std::vector<string> word_strings;
+        words_to_strings(words, word_strings);
+
+        size_t len = 0;
+        for (size_t i = 0; i < word_strings.size(); i++)
+            len += word_strings[i].size() + 1;
+
+        decoded_string.clear();
+        decoded_string.reserve(len);
+        for (size_t i = 0; i < word_strings.size(); i++) {
+            decoded_string.append(word_strings[i]);
+            decoded_string.push_back(' ');
+        }
+    }
+
+    void NNet3OnlineModelWrapper::words_to_strings(const std::vector<int32> &words,
+                                                   std::vector<string>      &word_strings) {
+
+        const fst::SymbolTable *syms = get_word_syms();
+
+        word_strings.resize(words.size());
+        for (size_t i = 0; i < words.size(); i++) {
+            word_strings[i] = syms->Find(words[i]);
+            if (word_strings[i] == "")
+                KALDI_ERR << "Word-id " << words[i] << " not in symbol table.";
+        }
+    }
+
+    bool NNet3OnlineModelWrapper::align_best_path(const CompactLattice &best_path_clat,
+                                                  std::vector<string>  &words,
+                                                  std::vector<int32>   &times,
+                                                  std::vector<int32>   &lengths) {
+
+        std::vector<int32> word_ids;
+        if (!align_best_path_ids(best_path_clat, word_ids, times, lengths))
+            return false;
+
+        // lexicon lookup
+        words_to_strings(word_ids, words);
+        return true;
+    }
+
+    bool NNet3OnlineModelWrapper::align_best_path_ids(const CompactLattice &best_path_clat,
+                                                      std::vector<int32>   &word_ids,
+                                                      std::vector<int32>   &times,
+                                                      std::vector<int32>   &lengths,
+                                                      bool                  partial) {
+
+        const WordAlignLatticeLexiconInfo &lexicon_info = *get_word_alignment_info();
+
+#if VERBOSE
+        KALDI_LOG << "word alignment starts...";
+#endif
+        CompactLattice aligned_clat;
+        WordAlignLatticeLexiconOpts opts;
+        if (partial)
+            opts.partial_word_label = kPartialWordLabel;
+
+        bool ok = WordAlignLatticeLexicon(best_path_clat, trans_model, lexicon_info, opts, &aligned_clat);
+
+        // a partial path fails to align completely whenever it ends within
+        // a word, the aligned part is still usable
+
+        if (!ok && !(partial && aligned_clat.Start() != fst::kNoStateId)) {
+            KALDI_WARN << "Lattice did not align correctly";
+            return false;
+        } else {
+            if (aligned_clat.Start() == fst::kNoStateId) {
+                KALDI_WARN << "Lattice was empty";
+                return false;
+            } else {
+#if VERBOSE
+                KALDI_LOG << "Aligned lattice.";
+#endif
+                TopSortCompactLatticeIfNeeded(&aligned_clat);
+
+                // lattice-1best
+
+                CompactLattice best_path_aligned;
+                CompactLatticeShortestPath(aligned_clat, &best_path_aligned); 
+
+                // nbest-to-ctm
+
+                if (!CompactLatticeToWordAlignment(best_path_aligned, &word_ids, &times, &lengths)) {
+                    KALDI_WARN << "CompactLatticeToWordAlignment failed.";
+                    return false;
+                }
+            }
+        }
+        return true;
     }
 
     NNet3OnlineModelWrapper::~NNet3OnlineModelWrapper() {
+        delete decodable_info;
         delete feature_info;
+        delete decode_fst;
+        delete word_syms;
+        delete word_alignment_info;
     }
 
 }
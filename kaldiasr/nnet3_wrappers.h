@@ -27,14 +27,27 @@
 #include "fstext/fstext-lib.h"
 #include "nnet3/nnet-am-decodable-simple.h"
 #include "online2/online-nnet3-decoding.h"
+#include "online2/online-endpoint.h"
 #include "online2/online-nnet2-feature-pipeline.h"
 #include "decoder/lattice-faster-decoder.h"
 #include "decoder/lattice-faster-decoder.h"
 #include "nnet3/decodable-simple-looped.h"
+#include "nnet3/nnet-batch-compute.h"
+#include "lat/word-align-lattice-lexicon.h"
+
+#include "decoder_stats.h"
+
+#include <mutex>
 
 namespace kaldi {
+
+    // convert a decoding graph to an aligned ConstFst file which can be
+    // memory-mapped by the model wrapper (mmap_fst)
+    void convert_fst_for_mapping(const std::string &fst_in_str, const std::string &fst_out_str);
+
     class NNet3OnlineModelWrapper {
     friend class NNet3OnlineDecoderWrapper;
+    friend class NNet3BatchDecoderWrapper;
     public:
   
         NNet3OnlineModelWrapper(BaseFloat    beam,
@@ -48,31 +61,147 @@ namespace kaldi {
                                 std::string &fst_in_str,
                                 std::string &mfcc_config,
                                 std::string &ie_conf_filename,
-                                std::string &align_lex_filename
+                                std::string &align_lex_filename,
+                                std::string &endpoint_options,
+                                bool         mmap_fst,
+                                bool         endpoint_auto_finalize,
+                                bool         lazy_load
+                               ) ;
+        // load everything from a bundle written by save_bundle()
+        NNet3OnlineModelWrapper(BaseFloat    beam,
+                                int32        max_active,
+                                int32        min_active,
+                                BaseFloat    lattice_beam,
+                                BaseFloat    acoustic_scale, 
+                                int32        frame_subsampling_factor, 
+                                std::string &bundle_filename,
+                                std::string &endpoint_options,
+                                bool         mmap_fst,
+                                bool         endpoint_auto_finalize,
+                                bool         word_symbols,
+                                bool         word_alignment,
+                                bool         lazy_load
                                ) ;
         ~NNet3OnlineModelWrapper();
 
+        void               save_bundle(const std::string &bundle_filename);
+
+        bool               has_word_symbols(void);
+        bool               has_word_alignment(void);
+
+        // time between two output frames in seconds (feature frame shift
+        // times frame subsampling factor)
+        BaseFloat          frame_shift(void);
+        void               get_word_symbols(std::vector<std::string> &symbols);
+
+        // load word symbols and build the word alignment lexicon info right
+        // away instead of on first use
+        void               load_resources(void);
+
     private:
 
+        void               init_options(BaseFloat          beam,
+                                        int32              max_active,
+                                        int32              min_active,
+                                        BaseFloat          lattice_beam,
+                                        BaseFloat          acoustic_scale, 
+                                        int32              frame_subsampling_factor, 
+                                        const std::string &endpoint_options,
+                                        bool               endpoint_auto_finalize);
+
+        // result helpers shared by online and batch decoders
+
+        void               best_path_to_string(const Lattice &best_path_lat,
+                                               std::string   &decoded_string, 
+                                               double        &likelihood);
+        void               words_to_string(const std::vector<int32> &words,
+                                           std::string              &decoded_string);
+        void               words_to_strings(const std::vector<int32> &words,
+                                            std::vector<string>      &word_strings);
+        bool               align_best_path(const CompactLattice &best_path_clat,
+                                           std::vector<string>  &words,
+                                           std::vector<int32>   &times,
+                                           std::vector<int32>   &lengths);
+        // with partial set the path may end in the middle of a word, which
+        // is output as kPartialWordLabel
+        bool               align_best_path_ids(const CompactLattice &best_path_clat,
+                                               std::vector<int32>   &word_ids,
+                                               std::vector<int32>   &times,
+                                               std::vector<int32>   &lengths,
+                                               bool                  partial = false);
+
+        // word symbol table: read at startup unless lazy_load is set (then on
+        // first use) or there is none (empty word_syms_filename, no bundle
+        // section)
+        const fst::SymbolTable                    *get_word_syms(void);
+        void                                       load_word_syms(void);
+
+        std::string                                word_syms_filename;
         fst::SymbolTable                          *word_syms;
 
+        // model bundle this model was loaded from (if any) and offsets of
+        // its optional sections, -1 if not present
+        std::string                                bundle_filename;
+        int64                                      word_syms_offset;
+        int64                                      align_lex_offset;
+
+        // config file contents, kept for save_bundle()
+        std::string                                mfcc_config_text;
+        std::string                                ie_config_text;
+        std::string                                cmvn_config_text;
+        std::string                                splice_config_text;
+
         // feature_config includes configuration for the iVector adaptation,
         // as well as the basic features.
         OnlineNnet2FeaturePipelineConfig           feature_config;
         LatticeFasterDecoderConfig                 lattice_faster_decoder_config;   
+        OnlineEndpointConfig                       endpoint_config;
+        bool                                       endpoint_auto_finalize;
         
         OnlineNnet2FeaturePipelineInfo            *feature_info;
 
         nnet3::AmNnetSimple                        am_nnet;
         nnet3::NnetSimpleLoopedComputationOptions  decodable_opts;
 
+        // compiled looped computation, built once per model and shared
+        // read-only by all decoders
+        nnet3::DecodableNnetSimpleLoopedInfo      *decodable_info;
+
         TransitionModel                            trans_model;
         //fst::VectorFst<fst::StdArc>               *decode_fst;
         fst::Fst<fst::StdArc>                     *decode_fst;
         std::string                               *ie_conf_filename;
 
-        // word alignment:
+        // word alignment: the lexicon is read at startup unless lazy_load is
+        // set or alignment is disabled (empty align_lex_filename), lexicon
+        // info is built on first use and shared by all decoders
+        const WordAlignLatticeLexiconInfo         *get_word_alignment_info(void);
+        void                                       load_word_alignment_lexicon(std::vector<std::vector<int32> > &lexicon);
+
+        std::string                                align_lex_filename;
+        bool                                       word_alignment;
         std::vector<std::vector<int32> >           word_alignment_lexicon;
+        WordAlignLatticeLexiconInfo               *word_alignment_info;
+
+        // guards lazy loading of the resources above
+        std::mutex                                 resource_mutex;
+    };
+
+    // lattice decoder which can tell the number of tokens active on the
+    // last frame decoded
+    class InstrumentedLatticeDecoder : public LatticeFasterOnlineDecoder {
+    public:
+
+        InstrumentedLatticeDecoder(const fst::Fst<fst::StdArc>       &fst,
+                                   const LatticeFasterDecoderConfig &config) :
+            LatticeFasterOnlineDecoder(fst, config) { }
+
+        int32 NumActiveTokens(void) const {
+            int32 num_tokens = 0;
+            for (const Elem *e = toks_.GetList(); e != NULL; e = e->tail)
+                num_tokens++;
+            return num_tokens;
+        }
     };
 
     class NNet3OnlineDecoderWrapper {
@@ -85,32 +214,232 @@ namespace kaldi {
                                   int32      num_frames, 
                                   BaseFloat *frames, 
                                   bool       finalize);
+        bool               decode_int16(BaseFloat  samp_freq, 
+                                        int32      num_frames, 
+                                        int16     *frames, 
+                                        bool       finalize);
 
         void               get_decoded_string(std::string &decoded_string, 
                                               double &likelihood);
+        void               get_decoded_word_ids(std::vector<int32> &word_ids, 
+                                                double             &likelihood);
         bool               get_word_alignment(std::vector<string> &words,
                                               std::vector<int32>  &times,
                                               std::vector<int32>  &lengths);
+        bool               get_word_alignment_ids(std::vector<int32> &word_ids,
+                                                  std::vector<int32> &times,
+                                                  std::vector<int32> &lengths);
+
+        void               reset(bool reset_adaptation_state);
+
+        // speaker adaptation (iVector and online CMVN) state, updated each
+        // time an utterance is finished, as an opaque binary blob. A state
+        // set before the first chunk of an utterance applies to it, else it
+        // applies from the next utterance on.
+        void               get_adaptation_state(std::string &state);
+        void               set_adaptation_state(const std::string &state);
+
+        // endpointing: has the current utterance ended (trailing silence,
+        // maximum length)? finalize_decoding() then finishes it without
+        // further audio, the next decode() call starts a new one. With
+        // endpoint_auto_finalize set decode() does that by itself and
+        // endpoint_detected() reports whether the last call finalized.
+        bool               endpoint_detected(void);
+        bool               finalize_decoding(void);
+
+        // n best hypotheses of the last finished utterance (best first)
+        // and its full word lattice, with the acoustic scale removed like
+        // in lattices written by kaldi's decoders: as arrays (arcs as source
+        // state, destination state, word id triples; graph and acoustic cost
+        // pairs; transition id sequences concatenated, with offsets) or in
+        // kaldi's binary format. Return false if there is no lattice.
+        bool               get_nbest(int32                             n,
+                                     std::vector<std::vector<int32> > &word_ids,
+                                     std::vector<double>              &likelihoods);
+        bool               get_lattice(int32                  &start,
+                                       std::vector<int32>     &arcs,
+                                       std::vector<BaseFloat> &arc_weights,
+                                       std::vector<int32>     &arc_alignment_offsets,
+                                       std::vector<int32>     &arc_alignments,
+                                       std::vector<BaseFloat> &final_weights,
+                                       std::vector<int32>     &final_alignment_offsets,
+                                       std::vector<int32>     &final_alignments);
+        bool               get_lattice_bytes(std::string &data);
+
+        // lattice posterior (MBR) confidence of each word of the best path
+        // of the last finished utterance, false if there is none
+        bool               get_word_confidences(std::vector<BaseFloat> &confidences);
+        // word alignment plus the confidence of each of its entries, NaN for
+        // optional silence (word id 0) which is no word of the best path
+        bool               get_word_alignment_confidences(std::vector<string>    &words,
+                                                          std::vector<int32>     &times,
+                                                          std::vector<int32>     &lengths,
+                                                          std::vector<BaseFloat> &confidences);
+        void               word_ids_to_string(const std::vector<int32> &word_ids,
+                                              std::string              &decoded_string);
+
+        // incremental partial result: word ids of the current best path,
+        // the first num_stable of which have not changed during the last
+        // stable_frames frames. Returns false if neither words nor the
+        // stable prefix changed since the last call.
+        bool               get_partial_hypothesis(int32               stable_frames,
+                                                  std::vector<int32> &word_ids,
+                                                  int32              &num_stable,
+                                                  double             &likelihood);
+        void               word_ids_to_strings(const std::vector<int32> &word_ids,
+                                               std::vector<string>      &words);
+
+        // word alignment of the current partial best path while decoding
+        // (of the best path once the utterance is finished). The first
+        // num_aligned words are aligned by the lexicon, the words after them
+        // have not been completed yet and get provisional times. Words
+        // aligned by an earlier call are reused as long as the part of the
+        // best path they cover did not change, only the rest is aligned.
+        bool               get_partial_word_alignment(std::vector<int32> &word_ids,
+                                                      std::vector<int32> &times,
+                                                      std::vector<int32> &lengths,
+                                                      int32              &num_aligned);
+
+        // instrumentation: per-stage timing, search statistics and real
+        // time factor, see decoder_stats.h. Off by default, when enabled
+        // it costs a few clock reads per chunk and frame. get_stats() may
+        // be called from any thread.
+        void               set_stats_enabled(bool enabled);
+        void               get_stats(DecoderStats &stats_out);
+        void               reset_stats(void);
+
+        // search beam settings of this decoder, initially the model's.
+        // Changes apply from the next chunk on, even in the middle of an
+        // utterance. reset_beam_options() restores the model's settings.
+        void               get_beam_options(BaseFloat &beam,
+                                            int32     &max_active,
+                                            int32     &min_active,
+                                            BaseFloat &lattice_beam);
+        void               set_beam_options(BaseFloat beam,
+                                            int32     max_active,
+                                            int32     min_active,
+                                            BaseFloat lattice_beam);
+        void               reset_beam_options(void);
 
     private:
 
+        bool decode_wave(BaseFloat                samp_freq, 
+                         const VectorBase<BaseFloat> &wave_part, 
+                         bool                     finalize);
+        void advance_decoding(void);
+        bool end_utterance(void);
+        bool finish_utterance(void);
+        void discard_utterance(void);
+        bool check_endpoint(void);
+
         void start_decoding(void);
         void free_decoder(void);
 
+        void add_stage_time(DecoderStage stage, double seconds);
+        void add_decode_time(int32 num_chunks, double audio_seconds, double seconds);
+
+        void update_partial(void);
+        void clear_partial(void);
+
         NNet3OnlineModelWrapper                   *model;
 
+        LatticeFasterDecoderConfig                 decoder_config;
+
         OnlineIvectorExtractorAdaptationState     *adaptation_state;
         OnlineNnet2FeaturePipeline                *feature_pipeline;
         OnlineSilenceWeighting                    *silence_weighting;
-        nnet3::DecodableNnetSimpleLoopedInfo      *decodable_info;
-        SingleUtteranceNnet3Decoder               *decoder;
+
+        // what SingleUtteranceNnet3Decoder would hold, kept here so the
+        // nnet forward pass can be timed apart from the search
+        nnet3::DecodableAmNnetLoopedOnline        *decodable;
+        InstrumentedLatticeDecoder                *decoder;
 
         std::vector<std::pair<int32, BaseFloat> >  delta_weights;
         int32                                      tot_frames, tot_frames_decoded;
+        bool                                       endpointed;
+
+        // reused for int16 -> float conversion of incoming samples
+        Vector<BaseFloat>                          wave_buf;
 
         // decoding result:
         CompactLattice                             best_path_clat;
+        CompactLattice                             lattice_clat;
+
+        // incremental traceback of the best path while decoding. Like
+        // OnlineSilenceWeighting we remember the token each frame's
+        // traceback ended in: once we reach the same token again the rest
+        // of the path is unchanged and need not be traced back.
+        struct PartialFrame {
+            void                                  *tok;
+            int32                                  tid;        // transition id of this frame's arc
+            std::vector<int32>                     words;      // output on this frame's arcs
+            double                                 cost;       // of this frame's arcs
+            double                                 tot_cost;   // of the path up to and including this frame
+            int32                                  changed_at; // number of frames decoded when last changed
+        };
+        std::vector<PartialFrame>                  partial_frames;
+        std::vector<int32>                         partial_words;       // current best path
+        std::vector<int32>                         partial_word_frames; // frame each word belongs to, -1: before the first frame
+        double                                     partial_initial_cost;
+        double                                     partial_likelihood;
+        int32                                      partial_num_stable_frames;
+        bool                                       partial_reported;
+        std::vector<int32>                         reported_words;
+        int32                                      reported_num_stable;
+
+        // word alignment of the partial best path: words aligned by
+        // get_partial_word_alignment() that ended before the last frame.
+        // Entries are dropped by update_partial() once a frame they depend
+        // on (valid_frames, their own frames and those their word labels
+        // were output on) changes.
+        std::vector<int32>                         partial_align_words;
+        std::vector<int32>                         partial_align_times;
+        std::vector<int32>                         partial_align_lengths;
+        std::vector<int32>                         partial_align_valid_frames;
+        int32                                      partial_align_num_labels; // of partial_words covered
+
+        bool                                       stats_enabled;
+        DecoderStats                               stats;
+        std::mutex                                 stats_mutex;
+
+    };
+
+    class NNet3BatchDecoderWrapper {
+    public:
+  
+        NNet3BatchDecoderWrapper(NNet3OnlineModelWrapper *aModel,
+                                 int32                    num_threads,
+                                 int32                    minibatch_size);
+        ~NNet3BatchDecoderWrapper();
+
+        int32              decode_batch(BaseFloat                samp_freq, 
+                                        std::vector<int32>      &num_frames, 
+                                        std::vector<BaseFloat*> &frames);
+
+        bool               get_decoded_string(int32        utt,
+                                              std::string &decoded_string, 
+                                              double      &likelihood);
+        bool               get_word_alignment(int32                utt,
+                                              std::vector<string> &words,
+                                              std::vector<int32>  &times,
+                                              std::vector<int32>  &lengths);
+
+    private:
+
+        void compute_features(BaseFloat          samp_freq, 
+                              int32              num_frames, 
+                              BaseFloat         *frames,
+                              Matrix<BaseFloat> *features,
+                              Matrix<BaseFloat> *online_ivectors);
+
+        NNet3OnlineModelWrapper                   *model;
+
+        nnet3::NnetBatchComputerOptions            batch_opts;
+        int32                                      num_threads;
 
+        // decoding results, one per utterance of the last batch
+        // (empty lattice if decoding of that utterance failed):
+        std::vector<CompactLattice>                best_path_clats;
     };
 
 
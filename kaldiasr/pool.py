@@ -0,0 +1,175 @@
+#
+# Copyright 2016, 2017, 2018 G. Bartsch
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# THIS CODE IS PROVIDED *AS IS* BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, EITHER EXPRESS OR IMPLIED, INCLUDING WITHOUT LIMITATION ANY IMPLIED
+# WARRANTIES OR CONDITIONS OF TITLE, FITNESS FOR A PARTICULAR PURPOSE,
+# MERCHANTABLITY OR NON-INFRINGEMENT.
+# See the Apache 2 License for the specific language governing permissions and
+# limitations under the License.
+#
+#
+# bounded pool of ready-to-use decoders sharing one model
+#
+
+import threading
+
+from time import time
+
+
+class DecoderPool(object):
+
+    """
+    Bounded pool of pre-warmed decoders sharing a single model.
+
+    All decoders are created up front and reset(), so their decoder and
+    feature pipeline are allocated before the first chunk of audio arrives.
+    acquire() lends a decoder out, release() resets it and puts it back.
+    Decoders are thread-safe to use concurrently as long as each one is held
+    by a single thread at a time, which is exactly what the pool guarantees.
+
+    Usage:
+
+        pool = DecoderPool(KaldiNNet3OnlineModel(MODELDIR), size=8)
+
+        decoder = pool.acquire(timeout=1.0)
+        if decoder is None:
+            ... # all decoders busy
+        try:
+            decoder.decode(16000, samples, True)
+            hstr, likelihood = decoder.get_decoded_string()
+        finally:
+            pool.release(decoder)
+    """
+
+    def __init__(self, model, size, decoder_class=None):
+
+        if size < 1:
+            raise Exception('decoder pool size must be at least 1, got %d' % size)
+
+        if decoder_class is None:
+            from kaldiasr.nnet3 import KaldiNNet3OnlineDecoder
+            decoder_class = KaldiNNet3OnlineDecoder
+
+        self.model    = model
+        self.size     = size
+        # all decoders, idle or not, e.g. to collect their get_stats()
+        self.decoders = []
+
+        self._cond   = threading.Condition(threading.Lock())
+        self._idle   = []
+        self._in_use = set()
+
+        # stats
+        self._num_acquired  = 0
+        self._num_timeouts  = 0
+        self._num_waits     = 0
+        self._wait_time     = 0.0
+        self._max_wait_time = 0.0
+
+        for i in range(size):
+            decoder = decoder_class(model)
+            decoder.reset(True)
+            self.decoders.append(decoder)
+            self._idle.append(decoder)
+
+    def acquire(self, block=True, timeout=None):
+        """
+        Lend out an idle decoder. If none is available, wait until one is
+        released (block=True), at most timeout seconds if timeout is given.
+        Returns None if no decoder could be acquired.
+        """
+
+        time_start = time()
+
+        with self._cond:
+
+            waited = False
+
+            while not self._idle:
+
+                if not block:
+                    self._num_timeouts += 1
+                    return None
+
+                waited = True
+
+                if timeout is None:
+                    self._cond.wait()
+                else:
+                    remaining = timeout - (time() - time_start)
+                    if remaining <= 0.0:
+                        self._num_timeouts += 1
+                        self._account_wait(time() - time_start)
+                        return None
+                    self._cond.wait(remaining)
+
+            decoder = self._idle.pop()
+            self._in_use.add(decoder)
+            self._num_acquired += 1
+
+            if waited:
+                self._account_wait(time() - time_start)
+
+        return decoder
+
+    def release(self, decoder, reset_speaker=True):
+        """
+        Reset a decoder obtained from acquire() and return it to the pool.
+        By default the speaker adaptation state is cleared as well since the
+        next user of this decoder will most likely be a different speaker.
+        Beam settings changed via set_beam() are restored to the model's.
+        """
+
+        # claim the decoder in the same critical section as the check, so a
+        # concurrent release() of the same decoder fails instead of putting
+        # it on the idle list twice
+        with self._cond:
+            if decoder not in self._in_use:
+                raise Exception('decoder was not acquired from this pool')
+            self._in_use.discard(decoder)
+
+        # reset outside of the lock: it releases the GIL and should not
+        # block other threads acquiring or releasing decoders. The decoder
+        # goes back even if resetting it fails (the exception is passed on),
+        # otherwise the pool would shrink and acquire() could block forever.
+
+        try:
+            try:
+                decoder.reset(reset_speaker)
+            finally:
+                decoder.reset_beam()
+        finally:
+            with self._cond:
+                self._idle.append(decoder)
+                self._cond.notify()
+
+    def stats(self):
+        """
+        Returns a dict of pool statistics: number of decoders in use and idle,
+        number of acquire() calls that succeeded, had to wait or timed out,
+        plus total and maximum time spent waiting in seconds.
+        """
+
+        with self._cond:
+            return {'size'          : self.size,
+                    'in_use'        : len(self._in_use),
+                    'idle'          : len(self._idle),
+                    'acquired'      : self._num_acquired,
+                    'waits'         : self._num_waits,
+                    'timeouts'      : self._num_timeouts,
+                    'wait_time'     : self._wait_time,
+                    'max_wait_time' : self._max_wait_time}
+
+    def _account_wait(self, wait_time):
+        # caller must hold self._cond
+        self._num_waits     += 1
+        self._wait_time     += wait_time
+        self._max_wait_time  = max(self._max_wait_time, wait_time)
+
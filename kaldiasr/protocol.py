@@ -0,0 +1,199 @@
+#
+# Copyright 2016, 2017, 2018 G. Bartsch
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# THIS CODE IS PROVIDED *AS IS* BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, EITHER EXPRESS OR IMPLIED, INCLUDING WITHOUT LIMITATION ANY IMPLIED
+# WARRANTIES OR CONDITIONS OF TITLE, FITNESS FOR A PARTICULAR PURPOSE,
+# MERCHANTABLITY OR NON-INFRINGEMENT.
+# See the Apache 2 License for the specific language governing permissions and
+# limitations under the License.
+#
+#
+# binary streaming protocol for the ASR server
+#
+# One TCP connection is one session (see kaldiasr.server). Both directions
+# carry messages of a 5 byte header, a one byte message type and the
+# payload length as 32 bit big endian unsigned int, followed by the
+# payload:
+#
+# client -> server
+#
+#   MSG_AUDIO    'A'  raw 16 bit little endian PCM, fed straight into decode()
+#   MSG_FINALIZE 'F'  end of utterance, no payload
+#   MSG_END      'E'  end of stream: finalizes a pending utterance, the
+#                     server closes the connection after its last result
+#
+# server -> client (JSON payloads)
+#
+#   MSG_OPEN     'O'  {"session": "<id>"}, first message on a new connection
+#   MSG_PARTIAL  'P'  {"hstr": ..., "likelihood": ...}, sent whenever the
+#                     partial result of the current utterance changes
+#   MSG_RESULT   'R'  {"hstr": ..., "likelihood": ...}, final result of an
+#                     utterance (finalized by the client or by endpointing)
+#   MSG_ERROR    'X'  {"error": "..."}, the server closes the connection
+#                     afterwards, e.g. when all decoders are busy
+#
+# Clients stream audio without waiting for replies, results arrive
+# asynchronously and are best read by a separate thread.
+#
+
+import json
+import socket
+import struct
+import logging
+
+try:
+    from socketserver import ThreadingMixIn, TCPServer, StreamRequestHandler
+except ImportError:
+    from SocketServer import ThreadingMixIn, TCPServer, StreamRequestHandler
+
+DEFAULT_STREAM_PORT = 8302
+
+MSG_AUDIO           = b'A'
+MSG_FINALIZE        = b'F'
+MSG_END             = b'E'
+
+MSG_OPEN            = b'O'
+MSG_PARTIAL         = b'P'
+MSG_RESULT          = b'R'
+MSG_ERROR           = b'X'
+
+MAX_MESSAGE_SIZE    = 16 * 1024 * 1024
+
+_HEADER             = struct.Struct('!cI')
+
+
+def write_message(f, msg_type, payload=b''):
+    """
+    Write one message to the binary file object f and flush it.
+    """
+    f.write(_HEADER.pack(msg_type, len(payload)) + payload)
+    f.flush()
+
+
+def read_message(f):
+    """
+    Read one message from the binary file object f, returns a
+    (msg_type, payload) tuple or (None, None) at the end of the stream.
+    """
+
+    header = f.read(_HEADER.size)
+    if len(header) < _HEADER.size:
+        return None, None
+
+    msg_type, length = _HEADER.unpack(header)
+    if length > MAX_MESSAGE_SIZE:
+        raise IOError('message too large: %d bytes' % length)
+
+    payload = f.read(length) if length else b''
+    if len(payload) < length:
+        return None, None
+
+    return msg_type, payload
+
+
+def write_json(f, msg_type, data):
+    write_message(f, msg_type, json.dumps(data).encode('utf8'))
+
+
+class ASRStreamHandler(StreamRequestHandler):
+
+    """
+    One session per connection: audio messages go straight into the
+    session's decoder, partial results are only sent when they change.
+    """
+
+    def setup(self):
+        StreamRequestHandler.setup(self)
+        # results are small and latency matters
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def handle(self):
+
+        manager = self.server.manager
+
+        session = manager.open()
+        if session is None:
+            write_json(self.wfile, MSG_ERROR, {'error': 'all decoders busy'})
+            return
+
+        try:
+            write_json(self.wfile, MSG_OPEN, {'session': session.id})
+
+            last_hstr = None
+            pending   = False  # audio received since the last final result
+
+            while True:
+
+                msg_type, payload = read_message(self.rfile)
+
+                if msg_type is None:
+                    break
+
+                if msg_type == MSG_AUDIO:
+                    finalize = False
+                elif msg_type in (MSG_FINALIZE, MSG_END):
+                    if not pending:
+                        if msg_type == MSG_END:
+                            break
+                        continue
+                    finalize = True
+                    payload  = b''
+                else:
+                    write_json(self.wfile, MSG_ERROR, {'error': 'invalid message type %r' % msg_type})
+                    break
+
+                try:
+                    res = manager.decode(session, payload, finalize)
+                except Exception as e:
+                    logging.error('session %s: decoding failed: %s' % (session.id, e))
+                    write_json(self.wfile, MSG_ERROR, {'error': 'decoding failed: %s' % e})
+                    break
+
+                if res is None:
+                    write_json(self.wfile, MSG_ERROR, {'error': 'session expired'})
+                    break
+
+                hstr, likelihood, final = res
+
+                if final:
+                    write_json(self.wfile, MSG_RESULT, {'hstr': hstr, 'likelihood': likelihood})
+                    last_hstr = None
+                    pending   = False
+                else:
+                    pending = True
+                    if hstr != last_hstr:
+                        write_json(self.wfile, MSG_PARTIAL, {'hstr': hstr, 'likelihood': likelihood})
+                        last_hstr = hstr
+
+                if msg_type == MSG_END:
+                    break
+
+        except (IOError, socket.error) as e:
+            logging.debug('session %s: %s' % (session.id, e))
+
+        finally:
+            manager.close(session.id)
+
+
+class ASRStreamServer(ThreadingMixIn, TCPServer):
+
+    """
+    Threaded TCP server for the binary streaming protocol, sharing manager
+    (a kaldiasr.server.SessionManager, which must have been started) and
+    thereby its decoder pool with an ASRServer.
+    """
+
+    daemon_threads      = True
+    allow_reuse_address = True
+    request_queue_size  = 128
+
+    def __init__(self, server_address, manager):
+        TCPServer.__init__(self, server_address, ASRStreamHandler)
+        self.manager = manager
@@ -0,0 +1,244 @@
+#
+# Copyright 2016, 2017, 2018 G. Bartsch
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# THIS CODE IS PROVIDED *AS IS* BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, EITHER EXPRESS OR IMPLIED, INCLUDING WITHOUT LIMITATION ANY IMPLIED
+# WARRANTIES OR CONDITIONS OF TITLE, FITNESS FOR A PARTICULAR PURPOSE,
+# MERCHANTABLITY OR NON-INFRINGEMENT.
+# See the Apache 2 License for the specific language governing permissions and
+# limitations under the License.
+#
+#
+# background WAV recorder, keeps disk I/O out of the decoding path
+#
+
+import io
+import struct
+import logging
+import threading
+
+from collections import deque
+
+DEFAULT_MAX_QUEUE_BYTES = 64 * 1024 * 1024
+DEFAULT_BUFFER_SIZE     = 256 * 1024
+
+# writer thread handles at most this many queued items per batch
+MAX_BATCH               = 256
+
+_WAV_HEADER             = struct.Struct('<4sI4s4sIHHIIHH4sI')
+
+_OPEN, _WRITE, _CLOSE   = range(3)
+
+
+def _wav_header(samp_freq, data_size):
+    # canonical 44 byte header of a mono 16 bit PCM file
+    return _WAV_HEADER.pack(b'RIFF', 36 + data_size, b'WAVE',
+                            b'fmt ', 16, 1, 1, samp_freq, samp_freq * 2, 2, 16,
+                            b'data', data_size)
+
+
+def _finish_wav(f, samp_freq, data_size):
+
+    # an odd number of bytes would leave a partial sample
+    if data_size & 1:
+        f.write(b'\0')
+        data_size += 1
+
+    f.seek(0)
+    f.write(_wav_header(samp_freq, data_size))
+    f.close()
+
+
+class Recording(object):
+
+    """
+    Handle of one WAV file being recorded, see Recorder.open(). Not
+    thread-safe, a recording is expected to be fed by one session.
+    """
+
+    def __init__(self, recorder, filename, samp_freq):
+        self.recorder  = recorder
+        self.filename  = filename
+        self.samp_freq = samp_freq
+        self.closed    = False
+
+    def write(self, data):
+        """
+        Queue raw 16 bit little endian PCM (bytes or any other buffer, kept
+        by reference: do not modify it afterwards) for writing. Returns
+        False if the data was dropped because the queue is full.
+        """
+        if self.closed:
+            raise Exception('recording %s is closed' % self.filename)
+        return self.recorder._put(_WRITE, self, data)
+
+    def close(self):
+        """
+        Finish the file: the header is fixed up once all queued data has
+        been written.
+        """
+        if not self.closed:
+            self.closed = True
+            self.recorder._put(_CLOSE, self, None)
+
+
+class Recorder(object):
+
+    """
+    Writes WAV files from a background thread. Callers hand over raw PCM
+    buffers without any conversion, they are queued (bounded by
+    max_queue_bytes, data is dropped rather than blocking the caller when
+    the disk cannot keep up) and written in batches through buffered files.
+    Each file starts with a placeholder header which is fixed up when the
+    recording is closed. Thread-safe.
+
+    Usage:
+
+        recorder = Recorder()
+
+        rec = recorder.open('data/recordings/%s.wav' % session_id, 16000)
+        rec.write(pcm_bytes)
+        ...
+        rec.close()
+
+        recorder.shutdown()   # waits for all data to be written
+    """
+
+    def __init__(self, max_queue_bytes=DEFAULT_MAX_QUEUE_BYTES, buffer_size=DEFAULT_BUFFER_SIZE):
+
+        self.max_queue_bytes = max_queue_bytes
+        self.buffer_size     = buffer_size
+
+        self._cond         = threading.Condition(threading.Lock())
+        self._queue        = deque()
+        self._queue_bytes  = 0
+        self._stopping     = False
+
+        # stats
+        self._num_files     = 0
+        self._bytes_written = 0
+        self._bytes_dropped = 0
+        self._num_errors    = 0
+
+        self._thread = threading.Thread(target=self._run, name='recorder')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def open(self, filename, samp_freq):
+        """
+        Start recording a mono 16 bit WAV file. The file is created by the
+        writer thread, errors are logged and counted in stats().
+        """
+        recording = Recording(self, filename, samp_freq)
+        self._put(_OPEN, recording, None)
+        return recording
+
+    def shutdown(self):
+        """
+        Write all queued data, close all files and stop the writer thread.
+        """
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        self._thread.join()
+
+    def stats(self):
+        """
+        Returns a dict of recorder statistics: files opened, bytes written,
+        dropped and currently queued, write errors.
+        """
+        with self._cond:
+            return {'files'         : self._num_files,
+                    'bytes_written' : self._bytes_written,
+                    'bytes_dropped' : self._bytes_dropped,
+                    'bytes_queued'  : self._queue_bytes,
+                    'errors'        : self._num_errors}
+
+    def _put(self, op, recording, data):
+
+        size = len(data) if data is not None else 0
+
+        with self._cond:
+
+            if self._stopping:
+                raise Exception('recorder has been shut down')
+
+            if op == _WRITE and self._queue_bytes + size > self.max_queue_bytes:
+                self._bytes_dropped += size
+                return False
+
+            self._queue.append((op, recording, data))
+            self._queue_bytes += size
+            self._cond.notify()
+
+        return True
+
+    def _run(self):
+
+        files = {} # recording -> [file, data size], None if it could not be opened
+
+        while True:
+
+            with self._cond:
+                while not self._queue and not self._stopping:
+                    self._cond.wait()
+                if not self._queue:
+                    break
+                batch = []
+                while self._queue and len(batch) < MAX_BATCH:
+                    batch.append(self._queue.popleft())
+
+            dequeued = 0
+            written  = 0
+            for op, recording, data in batch:
+                try:
+                    if op == _OPEN:
+                        files[recording] = None
+                        f = io.open(recording.filename, 'wb', buffering=self.buffer_size)
+                        f.write(_wav_header(recording.samp_freq, 0))
+                        files[recording] = [f, 0]
+                        with self._cond:
+                            self._num_files += 1
+
+                    elif op == _WRITE:
+                        dequeued += len(data)
+                        entry = files.get(recording)
+                        if entry:
+                            entry[0].write(data)
+                            entry[1] += len(data)
+                            written  += len(data)
+
+                    else:
+                        entry = files.pop(recording, None)
+                        if entry:
+                            _finish_wav(entry[0], recording.samp_freq, entry[1])
+
+                except (IOError, OSError) as e:
+                    logging.error('recording %s: %s' % (recording.filename, e))
+                    entry = files.pop(recording, None)
+                    if entry:
+                        try:
+                            entry[0].close()
+                        except (IOError, OSError):
+                            pass
+                    with self._cond:
+                        self._num_errors += 1
+
+            with self._cond:
+                self._queue_bytes   -= dequeued
+                self._bytes_written += written
+
+        # recordings never closed by their owner
+
+        for recording, entry in files.items():
+            if entry:
+                try:
+                    _finish_wav(entry[0], recording.samp_freq, entry[1])
+                except (IOError, OSError) as e:
+                    logging.error('recording %s: %s' % (recording.filename, e))
@@ -0,0 +1,704 @@
+#
+# Copyright 2016, 2017, 2018 G. Bartsch
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# THIS CODE IS PROVIDED *AS IS* BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, EITHER EXPRESS OR IMPLIED, INCLUDING WITHOUT LIMITATION ANY IMPLIED
+# WARRANTIES OR CONDITIONS OF TITLE, FITNESS FOR A PARTICULAR PURPOSE,
+# MERCHANTABLITY OR NON-INFRINGEMENT.
+# See the Apache 2 License for the specific language governing permissions and
+# limitations under the License.
+#
+#
+# multi-session speech recognition http server
+#
+# Every client stream is a session holding a decoder leased from a
+# DecoderPool over one shared model. Requests are served by a thread per
+# connection, decoding releases the GIL so sessions are decoded in
+# parallel, at most num_threads at a time. Sessions idle for longer than
+# session_timeout are closed and their decoders returned to the pool. If
+# all decoders stay busy for acquire_timeout seconds, new sessions are
+# refused with 503 and a Retry-After header. Recordings are written by a
+# background kaldiasr.recorder.Recorder, named after the session id. With
+# --adaptive-beam each session narrows its search beam while decoding falls
+# behind real time or the host CPU is saturated (kaldiasr.beam), trading
+# accuracy for throughput instead of letting requests queue up.
+#
+# API
+# ---
+#
+# * POST   /sessions                   start a session
+#                                      args (optional JSON dict):
+#                                        "record": boolean, record audio to a wav file
+#                                      201 {"session": "<id>"}, 503 if no decoder is free
+# * POST   /sessions/<id>/audio        feed audio to a session, either raw 16 bit little
+#                                      endian PCM (Content-Type: application/octet-stream,
+#                                      "?finalize=1" finishes the utterance) or a JSON dict
+#                                      {"audio": [int16 samples], "finalize": boolean}
+#                                      200 {"hstr": "...", "likelihood": -0.9, "final": false}
+#                                      404 if the session does not exist (anymore)
+# * DELETE /sessions/<id>              end a session, 200 {"audiofn": "..."}
+# * GET    /status                     session and decoder pool statistics
+# * GET    /metrics                    the same plus decoder instrumentation (with
+#                                      --instrument) in prometheus text format
+#
+# Streaming clients should rather use the binary protocol of
+# kaldiasr.protocol on --stream-port: one persistent connection per session,
+# raw PCM in, results pushed back as they change.
+#
+# An utterance ends when the client finalizes it or when kaldi's endpointing
+# detects one, "final" is true then. The session stays open for the next
+# utterance of the same speaker.
+#
+# usage:
+#
+#     python -m kaldiasr.server [options]
+#
+
+from __future__ import print_function
+
+import os
+import re
+import json
+import uuid
+import errno
+import logging
+import datetime
+import threading
+import multiprocessing
+
+import numpy as np
+
+from time import time
+from optparse import OptionParser
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import urlparse, parse_qs
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import urlparse, parse_qs
+
+from kaldiasr.pool import DecoderPool
+from kaldiasr.metrics import MetricsWriter, merge_decoder_stats, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from kaldiasr.recorder import Recorder
+from kaldiasr.beam import AdaptiveBeamController, CpuLoad
+from kaldiasr.protocol import ASRStreamServer, DEFAULT_STREAM_PORT
+
+DEFAULT_HOST            = 'localhost'
+DEFAULT_PORT            = 8301
+
+DEFAULT_MODEL_DIR       = 'data/models/kaldi-generic-en-tdnn_sp-latest'
+DEFAULT_MODEL           = 'model'
+
+DEFAULT_DECODERS        = 64
+DEFAULT_THREADS         = multiprocessing.cpu_count()
+DEFAULT_SESSION_TIMEOUT = 30.0
+DEFAULT_ACQUIRE_TIMEOUT = 0.5
+DEFAULT_SAMPLE_RATE     = 16000
+
+# max request body size (60s of 16 kHz audio as JSON is about 4 MB)
+MAX_BODY_SIZE           = 16 * 1024 * 1024
+
+RE_SESSION_PATH         = re.compile(r'^/sessions/([0-9a-f]+)(/audio)?$')
+
+
+def _mkdirs(path):
+    try:
+        os.makedirs(path)
+    except OSError as exception:
+        if exception.errno != errno.EEXIST:
+            raise
+
+
+class Session(object):
+
+    """
+    One client stream: a leased decoder plus recording state. All access
+    happens under self.lock, a decoder must only be used by one thread at a
+    time.
+    """
+
+    def __init__(self, session_id, decoder):
+
+        self.id          = session_id
+        self.decoder     = decoder
+        self.lock        = threading.Lock()
+        self.last_active = time()
+        self.closed      = False
+
+        # odd trailing byte of raw PCM, carried over to the next request
+        self.pending     = b''
+
+        self.audiofn     = None
+        self.recording   = None
+
+        # kaldiasr.beam.AdaptiveBeamController, if enabled
+        self.beam        = None
+
+    def record(self, data):
+        # raw PCM, queued for the recorder's writer thread
+        if self.recording:
+            self.recording.write(data)
+
+    def stop_recording(self):
+        if self.recording:
+            self.recording.close()
+            self.recording = None
+
+
+class SessionManager(object):
+
+    """
+    Sessions of an ASRServer: leases a decoder from pool per session, runs
+    decode requests (at most num_threads of them concurrently, so CPUs are
+    not oversubscribed however many sessions are active) and closes idle
+    sessions from a background thread. With decoder_stats set the decoders'
+    instrumentation is enabled and included in metrics(). With adaptive_beam
+    set every session gets an AdaptiveBeamController, fed with the time its
+    requests take including the wait for a decoding thread. Thread-safe.
+    """
+
+    def __init__(self, pool, num_threads=DEFAULT_THREADS, session_timeout=DEFAULT_SESSION_TIMEOUT,
+                 acquire_timeout=DEFAULT_ACQUIRE_TIMEOUT, samp_freq=DEFAULT_SAMPLE_RATE, recordings_dir=None,
+                 decoder_stats=False, adaptive_beam=False):
+
+        self.pool            = pool
+        self.model           = pool.model
+        self.session_timeout = session_timeout
+        self.acquire_timeout = acquire_timeout
+        self.samp_freq       = samp_freq
+        self.recordings_dir  = recordings_dir
+        self.recorder        = Recorder() if recordings_dir else None
+        self.decoder_stats   = decoder_stats
+        self.cpu_load        = CpuLoad() if adaptive_beam else None
+
+        for decoder in pool.decoders:
+            decoder.enable_stats(decoder_stats)
+
+        self._lock         = threading.Lock()
+        self._sessions     = {}
+        self._decode_slots = threading.BoundedSemaphore(num_threads)
+
+        self._stop   = threading.Event()
+        self._reaper = None
+
+        # stats
+        self._num_opened   = 0
+        self._num_refused  = 0
+        self._num_expired  = 0
+        self._num_requests = 0
+        self._audio_time   = 0.0
+        self._decode_time  = 0.0
+        self._num_narrowed = 0
+        self._num_widened  = 0
+
+    def start(self):
+        """
+        Start closing idle sessions in the background.
+        """
+        if self.recordings_dir and self.recorder is None:
+            self.recorder = Recorder()
+        self._stop.clear()
+        self._reaper = threading.Thread(target=self._reap_loop, name='session reaper')
+        self._reaper.daemon = True
+        self._reaper.start()
+
+    def shutdown(self):
+        """
+        Stop the reaper, close all sessions and wait for their recordings
+        to be written.
+        """
+        self._stop.set()
+        if self._reaper:
+            self._reaper.join()
+            self._reaper = None
+        with self._lock:
+            session_ids = list(self._sessions.keys())
+        for session_id in session_ids:
+            self.close(session_id)
+        if self.recorder:
+            self.recorder.shutdown()
+            self.recorder = None
+
+    def open(self, record=False):
+        """
+        Start a new session, returns None if no decoder became available
+        within acquire_timeout seconds.
+        """
+
+        decoder = self.pool.acquire(timeout=self.acquire_timeout)
+        if decoder is None:
+            with self._lock:
+                self._num_refused += 1
+            return None
+
+        session = Session(uuid.uuid4().hex, decoder)
+
+        if self.cpu_load:
+            session.beam = AdaptiveBeamController(decoder, cpu_load=self.cpu_load)
+
+        try:
+            if record and self.recorder:
+                ds = datetime.date.strftime(datetime.date.today(), '%Y%m%d')
+                audiodirfn = os.path.join(self.recordings_dir, ds)
+                _mkdirs(audiodirfn)
+                session.audiofn   = os.path.join(audiodirfn, '%s.wav' % session.id)
+                session.recording = self.recorder.open(session.audiofn, self.samp_freq)
+        except:
+            self.pool.release(decoder)
+            raise
+
+        with self._lock:
+            self._sessions[session.id] = session
+            self._num_opened += 1
+
+        logging.debug('session %s opened' % session.id)
+
+        return session
+
+    def get(self, session_id):
+        with self._lock:
+            return self._sessions.get(session_id)
+
+    def close(self, session_id):
+        """
+        End a session and return its decoder to the pool. Returns the
+        session or None if there is no such session.
+        """
+
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+        if session is None:
+            return None
+
+        with session.lock:
+            session.closed = True
+            session.stop_recording()
+            self.pool.release(session.decoder)
+            session.decoder = None
+
+        logging.debug('session %s closed' % session_id)
+
+        return session
+
+    def decode(self, session, samples, finalize):
+        """
+        Feed samples (int16 numpy array or raw PCM bytes) to session, returns
+        a (hstr, likelihood, final) tuple or None if the session has been
+        closed meanwhile.
+        """
+
+        # keep the reaper away while we wait for the session
+        session.last_active = time()
+
+        with session.lock:
+
+            if session.closed:
+                return None
+
+            decoder = session.decoder
+
+            if isinstance(samples, (bytes, bytearray)):
+                if session.pending:
+                    samples         = session.pending + samples
+                    session.pending = b''
+                if len(samples) & 1:
+                    session.pending = samples[-1:]
+                    samples         = samples[:-1]
+                pcm     = bytes(samples)
+                samples = np.frombuffer(pcm, dtype='<i2')
+            else:
+                pcm     = samples.astype('<i2').tobytes() if session.recording else None
+
+            time_start = time()
+
+            with self._decode_slots:
+
+                decoder.decode(self.samp_freq, samples, finalize)
+
+                final = finalize
+                if not final and decoder.endpoint_detected():
+                    final = self.model.endpoint_auto_finalize or decoder.finalize_decoding()
+
+                if self.model.word_symbols:
+                    hstr, likelihood = decoder.get_decoded_string()
+                else:
+                    hstr, likelihood = decoder.get_decoded_word_ids()
+
+            decode_time = time() - time_start
+            audio_time  = float(len(samples)) / self.samp_freq
+
+            beam_change = session.beam.update(audio_time, decode_time) if session.beam else 0
+
+            # after decoding: recording never delays the result
+            if pcm:
+                session.record(pcm)
+
+            session.last_active = time()
+
+        with self._lock:
+            self._num_requests += 1
+            self._audio_time   += audio_time
+            self._decode_time  += decode_time
+            if beam_change < 0:
+                self._num_narrowed += 1
+            elif beam_change > 0:
+                self._num_widened += 1
+
+        return hstr, likelihood, final
+
+    def reap(self):
+        """
+        Close sessions idle for longer than session_timeout, returns their
+        number. Sessions busy with a request are left alone.
+        """
+
+        deadline = time() - self.session_timeout
+
+        with self._lock:
+            expired = [s.id for s in self._sessions.values() if s.last_active < deadline]
+
+        num_closed = 0
+        for session_id in expired:
+            session = self.get(session_id)
+            if session is None or session.last_active >= deadline:
+                continue
+            logging.info('session %s idle for more than %.1fs, closing it.' % (session_id, self.session_timeout))
+            if self.close(session_id):
+                num_closed += 1
+
+        with self._lock:
+            self._num_expired += num_closed
+
+        return num_closed
+
+    def stats(self):
+        """
+        Returns a dict of session statistics plus those of the decoder pool
+        (as 'pool') and the recorder (as 'recorder', if recording). With
+        adaptive beams 'beam_narrowed' and 'beam_widened' count the beam
+        adjustments, 'cpu_load' is the current host CPU utilization.
+        """
+
+        recorder = self.recorder
+
+        with self._lock:
+            stats = {'sessions'    : len(self._sessions),
+                     'opened'      : self._num_opened,
+                     'refused'     : self._num_refused,
+                     'expired'     : self._num_expired,
+                     'requests'    : self._num_requests,
+                     'audio_time'  : self._audio_time,
+                     'decode_time' : self._decode_time,
+                     'pool'        : self.pool.stats(),
+                     'recorder'    : recorder.stats() if recorder else None}
+
+            if self.cpu_load:
+                stats['beam_narrowed'] = self._num_narrowed
+                stats['beam_widened']  = self._num_widened
+                stats['cpu_load']      = self.cpu_load.get()
+
+            return stats
+
+    def metrics(self):
+        """
+        Returns stats() and, if enabled, the merged instrumentation
+        statistics of all decoders in prometheus text format.
+        """
+
+        stats  = self.stats()
+        pool   = stats['pool']
+        writer = MetricsWriter()
+
+        writer.gauge('sessions', 'Open sessions.', [(None, stats['sessions'])])
+        writer.counter('sessions_opened_total', 'Sessions opened.', [(None, stats['opened'])])
+        writer.counter('sessions_refused_total', 'Sessions refused, all decoders busy.', [(None, stats['refused'])])
+        writer.counter('sessions_expired_total', 'Sessions closed for being idle.', [(None, stats['expired'])])
+        writer.counter('requests_total', 'Decode requests.', [(None, stats['requests'])])
+        writer.counter('request_audio_seconds_total', 'Seconds of audio received.', [(None, stats['audio_time'])])
+        writer.counter('request_decode_seconds_total', 'Seconds spent in decode requests.', [(None, stats['decode_time'])])
+
+        writer.gauge('pool_decoders', 'Decoders in the pool.', [({'state': 'in_use'}, pool['in_use']),
+                                                                ({'state': 'idle'}, pool['idle'])])
+        writer.counter('pool_waits_total', 'Decoder acquisitions that had to wait.', [(None, pool['waits'])])
+        writer.counter('pool_timeouts_total', 'Decoder acquisitions that timed out.', [(None, pool['timeouts'])])
+        writer.counter('pool_wait_seconds_total', 'Seconds spent waiting for a decoder.', [(None, pool['wait_time'])])
+
+        recorder = stats['recorder']
+        if recorder:
+            writer.counter('recorder_bytes_written_total', 'Bytes of audio recorded.', [(None, recorder['bytes_written'])])
+            writer.counter('recorder_bytes_dropped_total', 'Bytes of audio dropped, disk too slow.', [(None, recorder['bytes_dropped'])])
+            writer.gauge('recorder_bytes_queued', 'Bytes of audio waiting to be written.', [(None, recorder['bytes_queued'])])
+            writer.counter('recorder_errors_total', 'Recording write errors.', [(None, recorder['errors'])])
+
+        if self.cpu_load:
+            writer.counter('beam_adjustments_total', 'Adaptive beam adjustments.',
+                           [({'direction': 'narrow'}, stats['beam_narrowed']),
+                            ({'direction': 'widen'}, stats['beam_widened'])])
+            if stats['cpu_load'] is not None:
+                writer.gauge('cpu_load', 'Host CPU utilization.', [(None, stats['cpu_load'])])
+
+        if self.decoder_stats:
+            writer.decoder_stats(merge_decoder_stats(d.get_stats() for d in self.pool.decoders))
+
+        return writer.text()
+
+    def _reap_loop(self):
+        interval = max(0.1, self.session_timeout / 4.0)
+        while not self._stop.wait(interval):
+            try:
+                self.reap()
+            except Exception as e:
+                logging.error('reaping sessions failed: %s' % e)
+
+
+class ASRRequestHandler(BaseHTTPRequestHandler):
+
+    # keep connections open, streaming clients send many requests, and
+    # send small replies right away
+    protocol_version        = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        logging.debug('%s %s' % (self.address_string(), format % args))
+
+    def do_GET(self):
+
+        path = urlparse(self.path).path
+
+        if path == '/status':
+            self._reply(200, self.server.manager.stats())
+        elif path == '/metrics':
+            self._reply_raw(200, self.server.manager.metrics().encode('utf8'), METRICS_CONTENT_TYPE)
+        else:
+            self._reply(404, {'error': 'not found'})
+
+    def do_POST(self):
+
+        url     = urlparse(self.path)
+        manager = self.server.manager
+
+        try:
+            body = self._read_body()
+        except ValueError as e:
+            self._reply(400, {'error': str(e)})
+            return
+
+        if url.path == '/sessions':
+
+            try:
+                args = json.loads(body.decode('utf8')) if body else {}
+            except ValueError:
+                self._reply(400, {'error': 'invalid JSON'})
+                return
+            if not isinstance(args, dict):
+                self._reply(400, {'error': 'invalid JSON'})
+                return
+
+            session = manager.open(record=bool(args.get('record')))
+            if session is None:
+                self._reply(503, {'error': 'all decoders busy'}, {'Retry-After': '1'})
+                return
+
+            self._reply(201, {'session': session.id})
+            return
+
+        m = RE_SESSION_PATH.match(url.path)
+        if not m or not m.group(2):
+            self._reply(404, {'error': 'not found'})
+            return
+
+        session = manager.get(m.group(1))
+        if session is None:
+            self._reply(404, {'error': 'no such session'})
+            return
+
+        if self.headers.get('Content-Type', '').startswith('application/json'):
+            try:
+                args     = json.loads(body.decode('utf8'))
+                samples  = np.array(args.get('audio', []), dtype=np.int16)
+                finalize = bool(args.get('finalize'))
+            except (ValueError, TypeError, AttributeError):
+                self._reply(400, {'error': 'invalid JSON'})
+                return
+            except OverflowError:
+                self._reply(400, {'error': 'audio samples out of 16 bit range'})
+                return
+        else:
+            samples  = body
+            finalize = parse_qs(url.query).get('finalize', ['0'])[0] in ('1', 'true')
+
+        try:
+            res = manager.decode(session, samples, finalize)
+        except Exception as e:
+            logging.error('session %s: decoding failed: %s' % (session.id, e))
+            self._reply(500, {'error': 'decoding failed: %s' % e})
+            return
+
+        if res is None:
+            self._reply(404, {'error': 'no such session'})
+            return
+
+        hstr, likelihood, final = res
+        self._reply(200, {'hstr': hstr, 'likelihood': likelihood, 'final': final})
+
+    def do_DELETE(self):
+
+        m = RE_SESSION_PATH.match(urlparse(self.path).path)
+        if not m or m.group(2):
+            self._reply(404, {'error': 'not found'})
+            return
+
+        session = self.server.manager.close(m.group(1))
+        if session is None:
+            self._reply(404, {'error': 'no such session'})
+            return
+
+        self._reply(200, {'audiofn': session.audiofn})
+
+    def _read_body(self):
+
+        length = int(self.headers.get('Content-Length', 0))
+        if length < 0 or length > MAX_BODY_SIZE:
+            raise ValueError('invalid request size: %d' % length)
+        return self.rfile.read(length) if length else b''
+
+    def _reply(self, code, data, headers=None):
+        self._reply_raw(code, json.dumps(data).encode('utf8'), 'application/json', headers)
+
+    def _reply_raw(self, code, body, content_type, headers=None):
+
+        self.send_response(code)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class ASRServer(ThreadingMixIn, HTTPServer):
+
+    """
+    Threaded HTTP server for the API described above, one thread per client
+    connection. manager is the SessionManager holding model and decoders.
+
+    Usage:
+
+        pool    = DecoderPool(KaldiNNet3OnlineModel(MODELDIR), size=64)
+        manager = SessionManager(pool)
+        server  = ASRServer(('localhost', 8301), manager)
+        server.serve_forever()
+    """
+
+    daemon_threads      = True
+    allow_reuse_address = True
+    request_queue_size  = 128
+
+    def __init__(self, server_address, manager):
+        HTTPServer.__init__(self, server_address, ASRRequestHandler)
+        self.manager = manager
+
+    def serve_forever(self, poll_interval=0.5):
+        self.manager.start()
+        try:
+            HTTPServer.serve_forever(self, poll_interval)
+        finally:
+            self.manager.shutdown()
+
+
+def main():
+
+    parser = OptionParser("usage: %prog [options]")
+
+    parser.add_option ("-v", "--verbose", action="store_true", dest="verbose",
+                       help="verbose output")
+
+    parser.add_option ("-H", "--host", dest="host", type = "string", default=DEFAULT_HOST,
+                       help="host, default: %s" % DEFAULT_HOST)
+
+    parser.add_option ("-p", "--port", dest="port", type = "int", default=DEFAULT_PORT,
+                       help="port, default: %d" % DEFAULT_PORT)
+
+    parser.add_option ("-d", "--model-dir", dest="model_dir", type = "string", default=DEFAULT_MODEL_DIR,
+                       help="kaldi model directory, default: %s" % DEFAULT_MODEL_DIR)
+
+    parser.add_option ("-m", "--model", dest="model", type = "string", default=DEFAULT_MODEL,
+                       help="kaldi model, default: %s" % DEFAULT_MODEL)
+
+    parser.add_option ("-s", "--stream-port", dest="stream_port", type = "int", default=DEFAULT_STREAM_PORT,
+                       help="port for the binary streaming protocol, 0 to disable, default: %d" % DEFAULT_STREAM_PORT)
+
+    parser.add_option ("-n", "--decoders", dest="num_decoders", type = "int", default=DEFAULT_DECODERS,
+                       help="number of decoders, i.e. max concurrent sessions, default: %d" % DEFAULT_DECODERS)
+
+    parser.add_option ("-t", "--threads", dest="num_threads", type = "int", default=DEFAULT_THREADS,
+                       help="max concurrent decode calls, default: %d" % DEFAULT_THREADS)
+
+    parser.add_option ("-T", "--session-timeout", dest="session_timeout", type = "float",
+                       default=DEFAULT_SESSION_TIMEOUT,
+                       help="close sessions idle for this many seconds, default: %.1f" % DEFAULT_SESSION_TIMEOUT)
+
+    parser.add_option ("-a", "--acquire-timeout", dest="acquire_timeout", type = "float",
+                       default=DEFAULT_ACQUIRE_TIMEOUT,
+                       help="wait at most this many seconds for a free decoder, default: %.1f" % DEFAULT_ACQUIRE_TIMEOUT)
+
+    parser.add_option ("-r", "--recordings-dir", dest="recordings_dir", type = "string", default=None,
+                       help="wav recordings directory, default: recording disabled")
+
+    parser.add_option ("-M", "--mmap-fst", action="store_true", dest="mmap_fst",
+                       help="memory-map the decoding graph")
+
+    parser.add_option ("-i", "--instrument", action="store_true", dest="instrument",
+                       help="time decoder stages, reported by /metrics")
+
+    parser.add_option ("-b", "--adaptive-beam", action="store_true", dest="adaptive_beam",
+                       help="narrow the search beam while decoding falls behind real time or the CPU is saturated")
+
+    (options, args) = parser.parse_args()
+
+    if options.verbose:
+        logging.basicConfig(level=logging.DEBUG)
+    else:
+        logging.basicConfig(level=logging.INFO)
+
+    from kaldiasr.nnet3 import KaldiNNet3OnlineModel
+
+    time_start = time()
+    logging.info('%s loading model from %s ...' % (options.model, options.model_dir))
+    model = KaldiNNet3OnlineModel (options.model_dir, options.model, mmap_fst=options.mmap_fst)
+    logging.info('%s loading model... done. took %fs.' % (options.model, time()-time_start))
+
+    pool    = DecoderPool(model, options.num_decoders)
+    manager = SessionManager(pool, num_threads=options.num_threads, session_timeout=options.session_timeout,
+                             acquire_timeout=options.acquire_timeout, recordings_dir=options.recordings_dir,
+                             decoder_stats=options.instrument, adaptive_beam=options.adaptive_beam)
+    server  = ASRServer((options.host, options.port), manager)
+
+    if options.stream_port:
+        stream_server = ASRStreamServer((options.host, options.stream_port), manager)
+        stream_thread = threading.Thread(target=stream_server.serve_forever, name='stream server')
+        stream_thread.daemon = True
+        stream_thread.start()
+        logging.info('listening for streaming connections on %s:%d' % (options.host, options.stream_port))
+
+    logging.info('listening for HTTP requests on %s:%d, %d decoders' % (options.host, options.port,
+                                                                       options.num_decoders))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logging.error('^C received, shutting down the server')
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+#
+# Copyright 2016, 2017, 2018 G. Bartsch
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# THIS CODE IS PROVIDED *AS IS* BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, EITHER EXPRESS OR IMPLIED, INCLUDING WITHOUT LIMITATION ANY IMPLIED
+# WARRANTIES OR CONDITIONS OF TITLE, FITNESS FOR A PARTICULAR PURPOSE,
+# MERCHANTABLITY OR NON-INFRINGEMENT.
+# See the Apache 2 License for the specific language governing permissions and
+# limitations under the License.
+#
+#
+# LRU cache of per-speaker adaptation states
+#
+
+import threading
+
+from collections import OrderedDict
+
+
+class SpeakerStateCache(object):
+
+    """
+    Least recently used cache of speaker adaptation states (the blobs
+    returned by a decoder's get_adaptation_state()), keyed by speaker id and
+    bounded by the total size of the stored states in bytes. Thread-safe.
+
+    Usage:
+
+        cache = SpeakerStateCache(max_bytes=64*1024*1024)
+
+        decoder = pool.acquire()
+        try:
+            cache.restore(decoder, speaker_id)  # before the first chunk
+            ... # decode one or more utterances
+            cache.save(decoder, speaker_id)
+        finally:
+            pool.release(decoder)
+    """
+
+    def __init__(self, max_bytes=64*1024*1024):
+
+        if max_bytes < 1:
+            raise Exception('speaker state cache size must be at least 1 byte, got %d' % max_bytes)
+
+        self.max_bytes = max_bytes
+
+        self._lock   = threading.Lock()
+        self._states = OrderedDict()
+        self._bytes  = 0
+
+        # stats
+        self._num_hits      = 0
+        self._num_misses    = 0
+        self._num_evictions = 0
+
+    def get(self, speaker_id):
+        """
+        Returns the adaptation state stored for speaker_id or None, marks the
+        speaker as most recently used.
+        """
+
+        with self._lock:
+            state = self._states.pop(speaker_id, None)
+            if state is None:
+                self._num_misses += 1
+                return None
+            self._states[speaker_id] = state
+            self._num_hits += 1
+            return state
+
+    def put(self, speaker_id, state):
+        """
+        Store the adaptation state of speaker_id, evicting the least recently
+        used speakers as needed to stay within max_bytes. States larger than
+        max_bytes are not stored.
+        """
+
+        state = bytes(state)
+
+        with self._lock:
+
+            old_state = self._states.pop(speaker_id, None)
+            if old_state is not None:
+                self._bytes -= len(old_state)
+
+            if len(state) > self.max_bytes:
+                return
+
+            while self._states and self._bytes + len(state) > self.max_bytes:
+                evicted_id, evicted_state = self._states.popitem(last=False)
+                self._bytes -= len(evicted_state)
+                self._num_evictions += 1
+
+            self._states[speaker_id] = state
+            self._bytes += len(state)
+
+    def discard(self, speaker_id):
+        """
+        Forget the adaptation state of speaker_id, if any.
+        """
+
+        with self._lock:
+            state = self._states.pop(speaker_id, None)
+            if state is not None:
+                self._bytes -= len(state)
+
+    def restore(self, decoder, speaker_id):
+        """
+        Hand the cached state of speaker_id to decoder. Returns False (and
+        leaves the decoder untouched) if the speaker is unknown.
+        """
+
+        state = self.get(speaker_id)
+        if state is None:
+            return False
+        decoder.set_adaptation_state(state)
+        return True
+
+    def save(self, decoder, speaker_id):
+        """
+        Store the current adaptation state of decoder for speaker_id, call
+        after the speaker's last utterance has been finalized.
+        """
+
+        self.put(speaker_id, decoder.get_adaptation_state())
+
+    def stats(self):
+        """
+        Returns a dict of cache statistics: number of speakers and bytes
+        stored, number of hits, misses and evictions.
+        """
+
+        with self._lock:
+            return {'speakers'  : len(self._states),
+                    'bytes'     : self._bytes,
+                    'max_bytes' : self.max_bytes,
+                    'hits'      : self._num_hits,
+                    'misses'    : self._num_misses,
+                    'evictions' : self._num_evictions}
+
+    def __len__(self):
+        with self._lock:
+            return len(self._states)
+
+    def __contains__(self, speaker_id):
+        with self._lock:
+            return speaker_id in self._states
@@ -0,0 +1,118 @@
+#
+# Copyright 2016, 2017, 2018 G. Bartsch
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# THIS CODE IS PROVIDED *AS IS* BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, EITHER EXPRESS OR IMPLIED, INCLUDING WITHOUT LIMITATION ANY IMPLIED
+# WARRANTIES OR CONDITIONS OF TITLE, FITNESS FOR A PARTICULAR PURPOSE,
+# MERCHANTABLITY OR NON-INFRINGEMENT.
+# See the Apache 2 License for the specific language governing permissions and
+# limitations under the License.
+#
+#
+# compact word symbol table for vectorized word id lookups
+#
+
+import io
+import threading
+
+import numpy as np
+
+
+class WordSymbolTable(object):
+
+    """
+    Word symbol table (kaldi's words.txt) stored as one numpy array of UTF-8
+    encoded byte strings indexed by word id, so arrays of word ids as
+    returned by a decoder's get_word_alignment_arrays() are mapped to words
+    with a single fancy indexing operation instead of a python loop.
+
+    Ids missing from the table map to b''. Usually obtained from a model's
+    get_word_symbol_table(), load() reads a words.txt file directly.
+    """
+
+    def __init__(self, symbols):
+
+        """
+        symbols is a sequence of words (str or UTF-8 bytes) indexed by id.
+        """
+
+        self.symbols = np.array([s if isinstance(s, bytes) else s.encode('utf8') for s in symbols],
+                                dtype=np.bytes_)
+        if self.symbols.ndim != 1 or not len(self.symbols):
+            self.symbols = np.zeros(0, dtype='S1')
+
+        self._lock = threading.Lock()
+        self._ids  = None
+
+    @classmethod
+    def load(cls, filename):
+
+        """
+        Read a kaldi text symbol table (one "word id" pair per line).
+        """
+
+        words = {}
+        with io.open(filename, 'rb') as f:
+            for line in f:
+                parts = line.split()
+                if not parts:
+                    continue
+                if len(parts) != 2:
+                    raise Exception('%s: invalid symbol table line: %r' % (filename, line))
+                words[int(parts[1])] = parts[0]
+
+        symbols = [b''] * (max(words) + 1 if words else 0)
+        for wid, word in words.items():
+            symbols[wid] = word
+
+        return cls(symbols)
+
+    def lookup(self, word_ids, decode=False):
+
+        """
+        Map an array of word ids to a numpy array of UTF-8 byte strings, or to
+        a list of str if decode is set. A single word id maps to a single
+        word. Raises IndexError for ids outside the table.
+        """
+
+        word_ids = np.asarray(word_ids, dtype=np.int32)
+        if word_ids.size and word_ids.min() < 0:
+            raise IndexError('negative word id')
+
+        words = self.symbols[word_ids]
+        if decode:
+            if word_ids.ndim == 0:
+                return words.decode('utf8')
+            return [w.decode('utf8') for w in words]
+        return words
+
+    def find(self, word):
+
+        """
+        Id of word (str or bytes), -1 if unknown. The reverse index is built
+        on first use.
+        """
+
+        if not isinstance(word, bytes):
+            word = word.encode('utf8')
+
+        with self._lock:
+            if self._ids is None:
+                self._ids = dict((w, i) for i, w in enumerate(self.symbols.tolist()) if w)
+
+        return self._ids.get(word, -1)
+
+    def __getitem__(self, word_id):
+        return self.symbols[word_id].decode('utf8')
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def __repr__(self):
+        return '<WordSymbolTable: %d symbols>' % len(self.symbols)
@@ -0,0 +1,102 @@
+#
+# Copyright 2016, 2017, 2018 G. Bartsch
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# THIS CODE IS PROVIDED *AS IS* BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, EITHER EXPRESS OR IMPLIED, INCLUDING WITHOUT LIMITATION ANY IMPLIED
+# WARRANTIES OR CONDITIONS OF TITLE, FITNESS FOR A PARTICULAR PURPOSE,
+# MERCHANTABLITY OR NON-INFRINGEMENT.
+# See the Apache 2 License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import os
+
+import numpy as np
+import pytest
+
+import kaldiasr.batch as batch
+
+WAVFILE = os.path.join(os.path.dirname(__file__), '..', 'data', 'dw961.wav')
+
+
+class FakeModel(object):
+    word_alignment = True
+
+
+class FakeDecoder(object):
+
+    """
+    Alignment as returned by get_word_alignment(confidences=True): optional
+    silence is aligned as <eps> with a confidence of NaN.
+    """
+
+    def decode_wav_file(self, wavfn):
+        return True
+
+    def get_decoded_string(self):
+        return 'hello world', -1.0
+
+    def get_word_alignment(self, confidences=False):
+        return ([b'<eps>', b'hello', b'<eps>', b'world'], [0, 10, 40, 50], [10, 30, 10, 40],
+                np.array([np.nan, 0.9, np.nan, 0.8], dtype=np.float32))
+
+    def reset(self):
+        pass
+
+
+@pytest.fixture
+def worker(monkeypatch):
+    monkeypatch.setattr(batch, '_model', FakeModel())
+    monkeypatch.setattr(batch, '_decoder', FakeDecoder())
+
+
+def test_transcribe_skips_optional_silence(worker):
+
+    res = batch._transcribe(('utt1', WAVFILE))
+
+    assert res['ok']
+    assert [w[0] for w in res['words']] == ['hello', 'world']
+    assert [w[3] for w in res['words']] == pytest.approx([0.9, 0.8])
+
+
+def test_transcribe_missing_file(worker):
+
+    res = batch._transcribe(('utt1', '/nonexistent/utt1.wav'))
+
+    assert not res['ok']
+    assert 'words' not in res
+
+
+def test_read_done_retries_failed(tmp_path):
+
+    outfn = str(tmp_path / 'out.jsonl')
+    with open(outfn, 'w') as f:
+        f.write('{"utt": "utt1", "ok": true}\n')
+        f.write('{"utt": "utt2", "ok": false}\n')
+
+    assert batch.read_done(outfn, batch.FORMAT_JSONL) == set(['utt1'])
+
+
+def test_truncate_partial_line(tmp_path):
+
+    outfn = str(tmp_path / 'out.jsonl')
+    with open(outfn, 'w') as f:
+        f.write('{"utt": "utt1", "ok": true}\n')
+        f.write('{"utt": "utt2", "o')
+
+    batch.truncate_partial_line(outfn)
+
+    with open(outfn) as f:
+        assert f.read() == '{"utt": "utt1", "ok": true}\n'
+
+    # complete files stay as they are
+    batch.truncate_partial_line(outfn)
+
+    with open(outfn) as f:
+        assert f.read() == '{"utt": "utt1", "ok": true}\n'
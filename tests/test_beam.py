@@ -0,0 +1,55 @@
+#
+# Copyright 2016, 2017, 2018 G. Bartsch
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# THIS CODE IS PROVIDED *AS IS* BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, EITHER EXPRESS OR IMPLIED, INCLUDING WITHOUT LIMITATION ANY IMPLIED
+# WARRANTIES OR CONDITIONS OF TITLE, FITNESS FOR A PARTICULAR PURPOSE,
+# MERCHANTABLITY OR NON-INFRINGEMENT.
+# See the Apache 2 License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import array
+
+import numpy as np
+import pytest
+
+from kaldiasr.beam import AdaptiveBeamController
+
+
+class FakeDecoder(object):
+
+    def __init__(self):
+        self.beam = (13.0, 7000, 200, 8.0)
+
+    def get_beam(self):
+        return self.beam
+
+    def set_beam(self, beam=None, max_active=None, min_active=None, lattice_beam=None):
+        self.beam = (beam, max_active, self.beam[2], lattice_beam)
+
+    def decode(self, samp_freq, samples, finalize):
+        return True
+
+
+@pytest.mark.parametrize('chunk', [
+    np.zeros(1600, dtype=np.int16),
+    np.zeros(1600, dtype=np.float32),
+    b'\0' * 3200,
+    bytearray(3200),
+    memoryview(b'\0' * 3200),
+    array.array('h', [0] * 1600),
+])
+def test_audio_time(chunk):
+
+    controller = AdaptiveBeamController(FakeDecoder(), interval=10.0)
+    controller.decode(16000, chunk, False)
+
+    # 1600 samples at 16kHz, whatever the buffer type
+    assert controller._audio_time == pytest.approx(0.1)
@@ -0,0 +1,54 @@
+#
+# Copyright 2016, 2017, 2018 G. Bartsch
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# THIS CODE IS PROVIDED *AS IS* BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, EITHER EXPRESS OR IMPLIED, INCLUDING WITHOUT LIMITATION ANY IMPLIED
+# WARRANTIES OR CONDITIONS OF TITLE, FITNESS FOR A PARTICULAR PURPOSE,
+# MERCHANTABLITY OR NON-INFRINGEMENT.
+# See the Apache 2 License for the specific language governing permissions and
+# limitations under the License.
+#
+#
+# word confidences of the online nnet3 decoder, needs an nnet3 model: set
+# KALDIASR_NNET3_MODELDIR (default as in examples/chain_wavfile.py)
+#
+
+import os
+
+import numpy as np
+import pytest
+
+nnet3 = pytest.importorskip('kaldiasr.nnet3')
+
+MODELDIR = os.environ.get('KALDIASR_NNET3_MODELDIR', 'data/models/kaldi-generic-en-tdnn_sp-latest')
+WAVFILE  = os.path.join(os.path.dirname(__file__), '..', 'data', 'dw961.wav')
+
+
+@pytest.fixture(scope='module')
+def model():
+    if not os.path.isdir(MODELDIR):
+        pytest.skip('no nnet3 model in %s' % MODELDIR)
+    return nnet3.KaldiNNet3OnlineModel(MODELDIR)
+
+
+def test_alignment_confidences(model):
+
+    decoder = nnet3.KaldiNNet3OnlineDecoder(model)
+    assert decoder.decode_wav_file(WAVFILE)
+
+    words, times, lengths, confidences = decoder.get_word_alignment(confidences=True)
+    word_ids, likelihood = decoder.get_decoded_word_ids()
+
+    # one confidence per alignment entry, NaN exactly for optional silence
+    assert len(confidences) == len(words)
+    assert [w == b'<eps>' for w in words] == list(np.isnan(confidences))
+
+    # the others are those of the best path words, in order
+    assert np.array_equal(confidences[~np.isnan(confidences)], decoder.get_word_confidences())
+    assert len(word_ids) == np.count_nonzero(~np.isnan(confidences))
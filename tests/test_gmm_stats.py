@@ -0,0 +1,63 @@
+#
+# Copyright 2016, 2017, 2018 G. Bartsch
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# THIS CODE IS PROVIDED *AS IS* BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, EITHER EXPRESS OR IMPLIED, INCLUDING WITHOUT LIMITATION ANY IMPLIED
+# WARRANTIES OR CONDITIONS OF TITLE, FITNESS FOR A PARTICULAR PURPOSE,
+# MERCHANTABLITY OR NON-INFRINGEMENT.
+# See the Apache 2 License for the specific language governing permissions and
+# limitations under the License.
+#
+#
+# decoder instrumentation of the online gmm decoder, needs a gmm model:
+# set KALDIASR_GMM_MODELDIR and KALDIASR_GMM_GRAPHDIR (see
+# examples/gmm_incremental.py for the expected layout)
+#
+
+import os
+import wave
+
+import numpy as np
+import pytest
+
+gmm = pytest.importorskip('kaldiasr.gmm')
+
+MODELDIR = os.environ.get('KALDIASR_GMM_MODELDIR', '../training/kaldi_tmp/exp/tri3b_mmi_online')
+GRAPHDIR = os.environ.get('KALDIASR_GMM_GRAPHDIR', '../training/kaldi_tmp/exp/tri3b')
+WAVFILE  = os.path.join(os.path.dirname(__file__), '..', 'data', 'dw961.wav')
+
+
+@pytest.fixture(scope='module')
+def model():
+    if not os.path.isdir(MODELDIR) or not os.path.isdir(GRAPHDIR):
+        pytest.skip('no gmm model in %s / %s' % (MODELDIR, GRAPHDIR))
+    return gmm.KaldiGmmOnlineModel(MODELDIR, GRAPHDIR)
+
+
+def test_frames_decoded(model):
+
+    decoder = gmm.KaldiGmmOnlineDecoder(model)
+    decoder.enable_stats()
+
+    wavf      = wave.open(WAVFILE, 'rb')
+    samp_freq = wavf.getframerate()
+    samples   = np.frombuffer(wavf.readframes(wavf.getnframes()), dtype='<i2')
+    wavf.close()
+
+    # several chunks, so frames are counted across AdvanceDecoding() calls
+    chunk = samp_freq // 4
+    for i in range(0, len(samples), chunk):
+        decoder.decode(samp_freq, samples[i:i+chunk], i + chunk >= len(samples))
+
+    stats = decoder.get_stats()
+
+    assert stats['utterances'] == 1
+    assert stats['frames_decoded'] > 0
+    # 10ms frame shift, no frame subsampling
+    assert abs(stats['frames_decoded'] - stats['audio_seconds'] * 100) < 10
@@ -0,0 +1,63 @@
+#
+# Copyright 2016, 2017, 2018 G. Bartsch
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# THIS CODE IS PROVIDED *AS IS* BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, EITHER EXPRESS OR IMPLIED, INCLUDING WITHOUT LIMITATION ANY IMPLIED
+# WARRANTIES OR CONDITIONS OF TITLE, FITNESS FOR A PARTICULAR PURPOSE,
+# MERCHANTABLITY OR NON-INFRINGEMENT.
+# See the Apache 2 License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import threading
+
+import pytest
+
+from kaldiasr.pool import DecoderPool
+
+
+class FakeDecoder(object):
+
+    """
+    reset() blocks until released, so two release() calls overlap.
+    """
+
+    def __init__(self, model):
+        self.in_reset = threading.Event()
+        self.go_on    = threading.Event()
+        self.go_on.set()
+
+    def reset(self, reset_speaker):
+        self.in_reset.set()
+        self.go_on.wait()
+
+    def reset_beam(self):
+        pass
+
+
+def test_concurrent_double_release():
+
+    pool    = DecoderPool(None, 1, decoder_class=FakeDecoder)
+    decoder = pool.acquire()
+
+    decoder.go_on.clear()
+    t = threading.Thread(target=pool.release, args=(decoder,))
+    t.start()
+    decoder.in_reset.wait()
+
+    # second release() while the first one is still resetting
+    with pytest.raises(Exception):
+        pool.release(decoder)
+
+    decoder.go_on.set()
+    t.join()
+
+    assert pool.stats()['idle'] == 1
+    assert pool.acquire(block=False) is decoder
+    assert pool.acquire(block=False) is None
@@ -0,0 +1,44 @@
+#
+# Copyright 2016, 2017, 2018 G. Bartsch
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# THIS CODE IS PROVIDED *AS IS* BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, EITHER EXPRESS OR IMPLIED, INCLUDING WITHOUT LIMITATION ANY IMPLIED
+# WARRANTIES OR CONDITIONS OF TITLE, FITNESS FOR A PARTICULAR PURPOSE,
+# MERCHANTABLITY OR NON-INFRINGEMENT.
+# See the Apache 2 License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import numpy as np
+import pytest
+
+from kaldiasr.symbols import WordSymbolTable
+
+
+@pytest.fixture
+def table():
+    return WordSymbolTable(['<eps>', 'hello', u'wörld'])
+
+
+def test_lookup_array(table):
+    assert list(table.lookup(np.array([1, 2], dtype=np.int32))) == [b'hello', u'wörld'.encode('utf8')]
+    assert table.lookup([2, 0], decode=True) == [u'wörld', '<eps>']
+    assert len(table.lookup([])) == 0
+
+
+def test_lookup_scalar(table):
+    assert table.lookup(1) == b'hello'
+    assert table.lookup(np.int32(2), decode=True) == u'wörld'
+
+
+def test_lookup_invalid(table):
+    with pytest.raises(IndexError):
+        table.lookup(-1)
+    with pytest.raises(IndexError):
+        table.lookup([1, 3])